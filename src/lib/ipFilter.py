@@ -0,0 +1,186 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        ipFilter.py
+#
+# Purpose:     This module will provide the source IP address filter used by the
+#              PLC Modbus-TCP data handler: an allow list with single IP and CIDR
+#              subnet entries, the per source IP request counters and a per source
+#              IP token bucket rate limiter.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/26
+# Version:     v_0.1.1
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+    - ipAllowList: the allow list entries are compiled to a frozenset of the single
+        addresses (O(1) lookup) and a binary prefix trie per IP version for the CIDR
+        entries such as '192.168.10.0/24' (at most 32/128 steps). The check result
+        of every source IP is cached, so the flood from the same address only costs
+        one dict lookup. The entries which are not IP addresses (example 'localhost')
+        are matched as the exact string.
+    - ipCounter: request counters of every source IP, at most MAX_TRACK_IPS addresses
+        are tracked, the others are counted under OTHER_KEY.
+    - rateLimiter: token bucket of every source IP, the bucket is refilled with rate
+        tokens per second up to burst tokens, a request takes one token.
+"""
+
+import time
+import ipaddress
+import threading
+from collections import OrderedDict
+
+MAX_TRACK_IPS = 1024    # max number of source IPs tracked by the counters/buckets.
+MAX_CACHE = 4096        # max number of cached allow list check results.
+OTHER_KEY = 'others'    # counter key of the not tracked source IPs.
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class ipAllowList(object):
+    """ IP allow list with single address and CIDR subnet entries."""
+    def __init__(self, ipList=None):
+        """ Init example: allowList = ipAllowList(['127.0.0.1', '192.168.10.0/24'])
+            Args:
+                ipList (list(str), optional): allowed IP address/subnet list. Defaults
+                    to None allow any IP.
+        """
+        self.ipList = None if ipList is None else list(ipList)
+        addrList = []
+        self.tries = {4: [None, None, False], 6: [None, None, False]}  # [child0, child1, allowed]
+        self.netCount = 0
+        for entry in self.ipList or []:
+            entry = str(entry).strip()
+            try:
+                if '/' in entry:
+                    self._addNetwork(ipaddress.ip_network(entry, strict=False))
+                else:
+                    addrList.append(str(ipaddress.ip_address(entry)))
+            except ValueError:
+                addrList.append(entry)
+        self.addrSet = frozenset(addrList)
+        self.cache = {}
+
+    def _addNetwork(self, network):
+        node = self.tries[network.version]
+        netInt, maxLen = int(network.network_address), network.max_prefixlen
+        for i in range(network.prefixlen):
+            bit = (netInt >> (maxLen - 1 - i)) & 1
+            if node[bit] is None: node[bit] = [None, None, False]
+            node = node[bit]
+        node[2] = True
+        self.netCount += 1
+
+    def _inNetworks(self, ipStr):
+        try:
+            address = ipaddress.ip_address(ipStr)
+        except ValueError:
+            return False
+        node = self.tries[address.version]
+        addrInt, maxLen = int(address), address.max_prefixlen
+        for i in range(maxLen):
+            if node[2]: return True
+            node = node[(addrInt >> (maxLen - 1 - i)) & 1]
+            if node is None: return False
+        return node[2]
+
+#-----------------------------------------------------------------------------
+    def isAllowed(self, ipStr):
+        """ Return True if the source IP string is in the allow list."""
+        if self.ipList is None or ipStr in self.addrSet: return True
+        if not self.netCount: return False
+        result = self.cache.get(ipStr)
+        if result is None:
+            if len(self.cache) >= MAX_CACHE: self.cache.clear()
+            result = self.cache[ipStr] = self._inNetworks(ipStr)
+        return result
+
+    def getIpList(self):
+        return self.ipList
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class ipCounter(object):
+    """ Request counters of every source IP."""
+    def __init__(self, maxTrack=MAX_TRACK_IPS):
+        self.maxTrack = maxTrack
+        self.counts = {}
+        self.total = 0
+
+    def inc(self, ipStr):
+        if ipStr not in self.counts and len(self.counts) >= self.maxTrack: ipStr = OTHER_KEY
+        self.counts[ipStr] = self.counts.get(ipStr, 0) + 1
+        self.total += 1
+
+    def getStats(self, topN=10):
+        """ Return {'total': n, 'top': {ip: count}} of the topN source IPs."""
+        top = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:topN]
+        return OrderedDict([('total', self.total), ('top', OrderedDict(top))])
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class rateLimiter(object):
+    """ Token bucket rate limiter of every source IP."""
+    def __init__(self, rate, burst=None, maxTrack=MAX_TRACK_IPS):
+        """ Init example: limiter = rateLimiter(100, burst=200)
+            Args:
+                rate (float): allowed requests per second of one source IP.
+                burst (float, optional): bucket size. Defaults to None (rate tokens, min 1).
+                maxTrack (int, optional): max number of source IP buckets, the least
+                    recent bucket is removed if full. Defaults to MAX_TRACK_IPS.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self.maxTrack = maxTrack
+        self.buckets = OrderedDict()    # ip: [tokens, lastTime]
+        self.lock = threading.Lock()
+
+    def allow(self, ipStr, now=None):
+        """ Take one token from the source IP's bucket, return False if it is empty."""
+        if now is None: now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(ipStr)
+            if bucket is None:
+                if len(self.buckets) >= self.maxTrack: self.buckets.popitem(last=False)
+                bucket = self.buckets[ipStr] = [self.burst, now]
+            else:
+                self.buckets.move_to_end(ipStr)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1: return False
+            bucket[0] -= 1
+            return True
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    tCount = 0
+    print("1. Allow list:\n----")
+    allowList = ipAllowList(['127.0.0.1', 'localhost', '192.168.10.0/24', '10.0.0.0/8', 'fd00::/8'])
+    tPass = all(allowList.isAllowed(ip) for ip in ('127.0.0.1', 'localhost', '192.168.10.25', '10.1.2.3', 'fd00::1'))
+    tPass = tPass and not any(allowList.isAllowed(ip) for ip in ('127.0.0.2', '192.168.11.1', '11.0.0.1', 'fe80::1', 'abc'))
+    tPass = tPass and ipAllowList(None).isAllowed('1.2.3.4') and not ipAllowList([]).isAllowed('1.2.3.4')
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("2. Counter:\n----")
+    counter = ipCounter(maxTrack=2)
+    for ip in ('1.1.1.1', '1.1.1.1', '2.2.2.2', '3.3.3.3'): counter.inc(ip)
+    stats = counter.getStats()
+    tPass = stats['total'] == 4 and stats['top'] == {'1.1.1.1': 2, '2.2.2.2': 1, OTHER_KEY: 1}
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("3. Rate limiter:\n----")
+    limiter = rateLimiter(10, burst=2)
+    result = [limiter.allow('1.1.1.1', now=100) for _ in range(3)]
+    tPass = result == [True, True, False] and limiter.allow('2.2.2.2', now=100)
+    tPass = tPass and not limiter.allow('1.1.1.1', now=100.05) and limiter.allow('1.1.1.1', now=100.2)
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+    print(" => All test finished: %s/3" % str(tCount))
+
+#-----------------------------------------------------------------------------
+if __name__ == '__main__':
+    testCase()
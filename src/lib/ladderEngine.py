@@ -0,0 +1,327 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        ladderEngine.py
+#
+# Purpose:     This module will provide a declarative ladder logic rung description
+#              and compile it to an evaluator working on the bit image of the PLC
+#              holding registers and coils, so a PLC program doesn't need to hand
+#              write the ladder calculation in python.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/20
+# Version:     v_0.1.1
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+    A ladder program is a list of rung dicts, every rung drives one destination coil
+    (a 'copy' rung drives a coil range). The contacts are the operand strings:
+    'R<n>' holding register n (on if the value is not 0), 'C<n>' source coil n and
+    the '!' prefix for the normally closed contact, example: '!R3'.
+
+    - coil:    {'type': 'coil', 'coil': 2, 'branches': [('R0', 'R1'), ('!C0',)]}
+               the coil is on if all the contacts of one branch are on.
+               --+--|R0|--|R1|--+--(coil-02)--
+                 +-----|/C0|----+
+    - tff:     {'type': 'tff', 'coil': 0, 'on': ('R37',), 'off': ('R38',)}
+               T-flip-flop latching relay, the off coil is toggled on if any 'on'
+               contact is on, the on coil is toggled off if any 'off' contact is on.
+    - copy:    {'type': 'copy', 'coil': 0, 'reg': 0, 'count': 22}
+               direct connection of the registers [reg, reg+count) to the coils.
+    - ton:     {'type': 'ton', 'coil': 3, 'in': ('R4',), 'preset': 2.0}
+               on-delay timer, the coil is on after all the 'in' contacts are on for
+               preset seconds.
+    - ctu:     {'type': 'ctu', 'coil': 4, 'in': ('R5',), 'reset': ('R6',), 'preset': 3}
+               up counter, count the rising edges of the 'in' contacts, the coil is on
+               if count >= preset, all the 'reset' contacts on set the count to 0.
+
+    ladderProgram compiles the rungs to:
+    - terms: every series contacts branch (AND) is one term, all the terms' states are
+        one int bit vector. For every input bit the compiler keeps the bit mask of the
+        terms which fail if the input is off (NO contact) or on (NC contact), so the
+        evaluator only OR the masks of the inputs and costs O(inputs) not O(contacts).
+    - coil tables: the coil bit of every term, the 'coil' rung results are gathered
+        from the true terms.
+    - tff tables: for every input bit the mask of the coils it toggles on/off, all the
+        tff coils are calculated together with bit operations:
+        new = (state & ~offVec) | (~state & onVec)
+    - copy ops: (srcShift, mask, destShift), one shift/and per register range.
+    The registers and source coils are packed to one input image int (registers at
+    bit 0, source coils after the registers), the output is the dest coils image int.
+"""
+
+import time
+
+RUNG_TYPES = ('coil', 'tff', 'copy', 'ton', 'ctu')
+
+#-----------------------------------------------------------------------------
+def packBits(valList):
+    """ Pack the value list to an int bit image (bit i is on if valList[i] is true)."""
+    if not valList: return 0
+    return int(''.join(['1' if val else '0' for val in reversed(valList)]), 2)
+
+def unpackBits(image, count):
+    """ Unpack the int bit image to a bool list with count items."""
+    return [bit == '1' for bit in reversed(format(image & ((1 << count) - 1), '0%db' % count))] if count else []
+
+def _iterBits(vector):
+    """ Yield the index of every on bit of the int vector."""
+    while vector:
+        lowBit = vector & -vector
+        yield lowBit.bit_length() - 1
+        vector ^= lowBit
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class ladderProgram(object):
+    """ Compiled ladder logic program, details refer to the < Program Design > part."""
+    def __init__(self, rungs, regCount, coilCount, srcCoilCount=0):
+        """ Init example: program = ladderProgram([{'type': 'copy', 'coil': 0, 'reg': 0, 'count': 22}], 22, 22)
+            Args:
+                rungs (list(dict)): rung description list.
+                regCount (int): number of the holding registers in the input image.
+                coilCount (int): number of the destination coils.
+                srcCoilCount (int, optional): number of the source coils in the input
+                    image. Defaults to 0.
+            Raise ValueError if a rung is invalid or a coil is driven by more than one rung.
+        """
+        self.rungs = list(rungs)
+        self.regCount = regCount
+        self.coilCount = coilCount
+        self.srcCoilCount = srcCoilCount
+        self.inputCount = regCount + srcCoilCount
+        self.terms = []         # (NO contacts input mask, NC contacts input mask)
+        self.termCoilBits = []  # dest coil bit of every term.
+        self.coilTermMask = 0   # terms of the 'coil' rungs.
+        self.tffContacts = []   # (inputIdx, normallyClosed, coilBit, toggleOn)
+        self.tffMask = 0        # dest coils driven by the tff rungs.
+        self.copyOps = []       # (srcShift, mask, destShift)
+        self.timers = []        # [coilBit, termBit, preset, startTime]
+        self.counters = []      # [coilBit, inTermBit, resetTermBit, preset, count, lastIn]
+        self.drivenMask = 0
+        self._compile()
+        self.lastInput = None
+        self.lastTermVec = 0
+
+#-----------------------------------------------------------------------------
+    def _parseOperand(self, operand):
+        """ Parse the 'R<n>'/'C<n>'/'!R<n>' contact string to (inputIdx, normallyClosed)."""
+        opStr = str(operand).strip()
+        closed = opStr.startswith('!')
+        if closed: opStr = opStr[1:]
+        try:
+            idx = int(opStr[1:])
+        except ValueError:
+            raise ValueError("Invalid contact: %s" % str(operand))
+        if opStr[:1] == 'R' and 0 <= idx < self.regCount: return (idx, closed)
+        if opStr[:1] == 'C' and 0 <= idx < self.srcCoilCount: return (self.regCount + idx, closed)
+        raise ValueError("Invalid contact: %s" % str(operand))
+
+    def _addTerm(self, contacts, coilBit):
+        """ Add the series contacts branch as a term, return the term bit."""
+        noMask = ncMask = 0
+        for contact in contacts:
+            idx, closed = self._parseOperand(contact)
+            if closed:
+                ncMask |= 1 << idx
+            else:
+                noMask |= 1 << idx
+        self.terms.append((noMask, ncMask))
+        self.termCoilBits.append(coilBit)
+        return 1 << (len(self.terms) - 1)
+
+    def _driveCoils(self, coilIdx, count=1):
+        """ Mark the dest coils as driven and return the coils mask."""
+        if coilIdx < 0 or coilIdx + count > self.coilCount or count < 1:
+            raise ValueError("Invalid dest coil: %s" % str(coilIdx))
+        mask = ((1 << count) - 1) << coilIdx
+        if self.drivenMask & mask:
+            raise ValueError("Coil %s is driven by more than one rung" % str(coilIdx))
+        self.drivenMask |= mask
+        return mask
+
+    def _compile(self):
+        for rung in self.rungs:
+            rungType = rung.get('type')
+            if rungType not in RUNG_TYPES: raise ValueError("Invalid rung type: %s" % str(rungType))
+            if rungType == 'copy':
+                count, regIdx = int(rung['count']), int(rung['reg'])
+                if regIdx < 0 or regIdx + count > self.regCount:
+                    raise ValueError("Invalid copy registers: %s" % str(rung))
+                self._driveCoils(rung['coil'], count)
+                self.copyOps.append((regIdx, (1 << count) - 1, rung['coil']))
+                continue
+            coilBit = self._driveCoils(rung['coil'])
+            if rungType == 'coil':
+                for branch in rung['branches']:
+                    self.coilTermMask |= self._addTerm(branch, coilBit)
+            elif rungType == 'tff':
+                self.tffMask |= coilBit
+                for contact in rung['on']: self.tffContacts.append(self._parseOperand(contact) + (coilBit, True))
+                for contact in rung['off']: self.tffContacts.append(self._parseOperand(contact) + (coilBit, False))
+            elif rungType == 'ton':
+                self.timers.append([coilBit, self._addTerm(rung['in'], coilBit), float(rung['preset']), None])
+            elif rungType == 'ctu':
+                resetBit = self._addTerm(rung['reset'], coilBit) if rung.get('reset') else 0
+                self.counters.append([coilBit, self._addTerm(rung['in'], coilBit), resetBit,
+                                      int(rung['preset']), 0, False])
+        self.allTermMask = (1 << len(self.terms)) - 1
+        # per input fan-out tables: the terms fail if the input is off/on.
+        self.noFailTable = [0]*self.inputCount
+        self.ncFailTable = [0]*self.inputCount
+        self.noUsedMask = self.ncUsedMask = 0
+        for termIdx, (noMask, ncMask) in enumerate(self.terms):
+            for idx in _iterBits(noMask): self.noFailTable[idx] |= 1 << termIdx
+            for idx in _iterBits(ncMask): self.ncFailTable[idx] |= 1 << termIdx
+            self.noUsedMask |= noMask
+            self.ncUsedMask |= ncMask
+        # per input tff tables: the coils toggled on/off if the input is on (NO contact)
+        # or off (NC contact), the tff contacts don't need the terms gathering.
+        self.tffOnTable = {False: [0]*self.inputCount, True: [0]*self.inputCount}
+        self.tffOffTable = {False: [0]*self.inputCount, True: [0]*self.inputCount}
+        self.tffUsedMask = {False: 0, True: 0}
+        for idx, closed, coilBit, toggleOn in self.tffContacts:
+            table = self.tffOnTable if toggleOn else self.tffOffTable
+            table[closed][idx] |= coilBit
+            self.tffUsedMask[closed] |= 1 << idx
+        self.keepMask = ((1 << self.coilCount) - 1) & ~self.drivenMask
+
+#-----------------------------------------------------------------------------
+    def _evalTerms(self, inputImg):
+        """ Return the true terms bit vector of the input image."""
+        if inputImg == self.lastInput: return self.lastTermVec
+        failVec = 0
+        for idx in _iterBits(~inputImg & self.noUsedMask): failVec |= self.noFailTable[idx]
+        for idx in _iterBits(inputImg & self.ncUsedMask): failVec |= self.ncFailTable[idx]
+        self.lastInput, self.lastTermVec = inputImg, self.allTermMask & ~failVec
+        return self.lastTermVec
+
+    def _gatherCoils(self, termVec):
+        coilVec = 0
+        for termIdx in _iterBits(termVec): coilVec |= self.termCoilBits[termIdx]
+        return coilVec
+
+    def evaluate(self, inputImg, stateImg=0, now=None):
+        """ Calculate the dest coils image.
+            Args:
+                inputImg (int): registers + source coils bit image.
+                stateImg (int, optional): current dest coils image, used by the tff rungs
+                    and kept for the coils not driven by any rung. Defaults to 0.
+                now (float, optional): time.monotonic() time for the timers. Defaults to None.
+            Returns:
+                int: the dest coils bit image.
+        """
+        termVec = self._evalTerms(inputImg)
+        outImg = stateImg & self.keepMask
+        for srcShift, mask, destShift in self.copyOps:
+            outImg |= ((inputImg >> srcShift) & mask) << destShift
+        if self.coilTermMask: outImg |= self._gatherCoils(termVec & self.coilTermMask)
+        if self.tffMask:
+            state = stateImg & self.tffMask
+            onVec = offVec = 0
+            for closed, activeImg in ((False, inputImg), (True, ~inputImg)):
+                onTable, offTable = self.tffOnTable[closed], self.tffOffTable[closed]
+                for idx in _iterBits(activeImg & self.tffUsedMask[closed]):
+                    onVec |= onTable[idx]
+                    offVec |= offTable[idx]
+            outImg |= (state & ~offVec) | (~state & onVec & self.tffMask)
+        if self.timers:
+            if now is None: now = time.monotonic()
+            for timer in self.timers:
+                if termVec & timer[1]:
+                    if timer[3] is None: timer[3] = now
+                    if now - timer[3] >= timer[2]: outImg |= timer[0]
+                else:
+                    timer[3] = None
+        for counter in self.counters:
+            inState = bool(termVec & counter[1])
+            if counter[2] and termVec & counter[2]:
+                counter[4] = 0
+            elif inState and not counter[5]:
+                counter[4] += 1
+            counter[5] = inState
+            if counter[4] >= counter[3]: outImg |= counter[0]
+        return outImg
+
+#-----------------------------------------------------------------------------
+    def getRungCount(self):
+        return len(self.rungs)
+
+    def getInputMask(self):
+        """ Return the bit mask of all the inputs (registers + source coils) used by the rungs."""
+        mask = self.noUsedMask | self.ncUsedMask | self.tffUsedMask[False] | self.tffUsedMask[True]
+        for srcShift, srcMask, _ in self.copyOps: mask |= srcMask << srcShift
+        return mask
+
+    def isTimeDriven(self):
+        """ Return True if the output can change without input change (timer rungs)."""
+        return bool(self.timers)
+
+    def reset(self):
+        """ Reset all the timers and counters."""
+        for timer in self.timers: timer[3] = None
+        for counter in self.counters: counter[4:6] = [0, False]
+        self.lastInput = None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    tCount = 0
+    print("1. Coil, copy and tff rungs:\n----")
+    rungs = [
+        {'type': 'coil', 'coil': 0, 'branches': [('R0', 'R1'), ('!C0',)]},
+        {'type': 'copy', 'coil': 1, 'reg': 2, 'count': 2},
+        {'type': 'tff', 'coil': 3, 'on': ('R0',), 'off': ('R1', 'R2')}
+    ]
+    program = ladderProgram(rungs, 4, 5, srcCoilCount=1)
+    inputImg = packBits([1, 1, 0, 1]) | packBits([True]) << 4
+    result = unpackBits(program.evaluate(inputImg, stateImg=packBits([0, 0, 0, 0, 1])), 5)
+    tPass = result == [True, False, True, True, True]
+    inputImg = packBits([0, 1, 0, 0]) | packBits([True]) << 4
+    result = unpackBits(program.evaluate(inputImg, stateImg=packBits([0, 0, 0, 1, 0])), 5)
+    tPass = tPass and result == [False, False, False, False, False]
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("2. Timer and counter rungs:\n----")
+    rungs = [
+        {'type': 'ton', 'coil': 0, 'in': ('R0',), 'preset': 2.0},
+        {'type': 'ctu', 'coil': 1, 'in': ('R1',), 'reset': ('R2',), 'preset': 2}
+    ]
+    program = ladderProgram(rungs, 3, 2)
+    tPass = program.evaluate(packBits([1, 1, 0]), now=10) == 0
+    tPass = tPass and program.evaluate(packBits([1, 0, 0]), now=12) == 1
+    tPass = tPass and program.evaluate(packBits([1, 1, 0]), now=12.5) == 3
+    tPass = tPass and program.evaluate(packBits([0, 0, 1]), now=13) == 0
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("3. Invalid rungs and performance:\n----")
+    tPass = True
+    for rungs in ([{'type': 'coil', 'coil': 0, 'branches': [('X1',)]}],
+                  [{'type': 'copy', 'coil': 0, 'reg': 0, 'count': 2},
+                   {'type': 'tff', 'coil': 1, 'on': ('R0',), 'off': ('R1',)}]):
+        try:
+            ladderProgram(rungs, 2, 2)
+            tPass = False
+        except ValueError:
+            pass
+    rungCount = 2000
+    rungs = [{'type': 'tff', 'coil': i, 'on': ('R%s' % (i % 500),), 'off': ('R%s' % ((i + 7) % 500),)}
+             for i in range(rungCount)]
+    program = ladderProgram(rungs, 500, rungCount)
+    regsList = [i % 3 == 0 for i in range(500)]
+    startT = time.monotonic()
+    stateImg = 0
+    for i in range(100):
+        regsList[i] = not regsList[i]
+        stateImg = program.evaluate(packBits(regsList), stateImg)
+    print("%s rungs scan time: %.1f us" % (rungCount, (time.monotonic() - startT) * 1e4))
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+    print(" => All test finished: %s/3" % str(tCount))
+
+#-----------------------------------------------------------------------------
+if __name__ == '__main__':
+    testCase()
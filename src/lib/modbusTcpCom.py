@@ -20,7 +20,7 @@
     to read the data from a real PLC or simulate the PLC Modbus data handling process (handle 
     modbusTCP request from other program which same as PLC).
     
-    Four modules will be provided in this module: 
+    Below modules will be provided in this module: 
 
     - ladderLogic: An interface class hold the ladder logic calculation algorithm, it will take the 
         holding register's state, source coils state then generate the destination coils states.
@@ -36,26 +36,154 @@
         7. runLadderLogic() will return the calculated coils list result, plcDataHandler will set 
             the destination coils with the result.
 
+    - compiledLadderLogic: A ladderLogic whose rungs are described with the ladderEngine
+        declarative rung dicts (set self.rungs in initLadderInfo()) instead of the hand
+        written runLadderLogic(), the rungs are compiled to a ladderEngine.ladderProgram
+        which calculates all the destination coils with bit operations.
+
     - plcDataHandler: A pyModbusTcp.dataHandler module to keep one allow read white list and one 
         allow write white list to filter the client's coils or registers read and write request.
         As most of the PLC are using the input => register (memory) parameter config, they are 
-        not allowed to change the input directly, we only provide the coil and holding register 
-        write functions.
-    
+        not allowed to change the input directly, we only provide the coil and holding register
+        write functions. The write functions keep the dirty bitmaps of the changed registers
+        and coils, updateState() only runs the ladders whose input addresses (getInputMasks())
+        changed, so the repeated writes of the same values don't trigger the ladder logic.
+        The allow lists accept the CIDR subnet entries (ipFilter.ipAllowList), the denied 
+        requests are counted per source IP and an optional per source IP token bucket rate 
+        limit replies the slave device busy exception.
+
+    - unitDataHandler: A pyModbusTcp.dataHandler module to dispatch the requests to the 
+        plcDataHandler of the request's unit ID, so several PLCs can share one server port.
+
+    - priorityDataHandler: A pyModbusTcp.dataHandler module to queue the requests in the 
+        bounded 'hmi' (priority source IPs) and 'others' queues, one worker thread executes
+        them with the inner data handler, the 'hmi' queue first. The requests over the 
+        queue depth or the max waiting age are shed with the slave device busy exception.
+
     - modbusTcpClient: Modbus-TCP client module to read/write holding register and coils data 
-        from/to the target PLC. 
+        from/to the target PLC. The bulk functions write the coils/registers lists with the 
+        write multiple requests and read several address ranges with the fewest requests 
+        (the ranges are merged within the 2000 coils / 125 registers request limits). In 
+        the pipelined mode (modbusPipeline) the requests of one batch are sent before 
+        reading the replies, so a batch costs one network round trip.
+
+    - modbusConnPool: A connection pool shared by the HMI data managers, it keeps one 
+        persistent client per PLC endpoint with a sub-second request time out and a 
+        circuitBreaker: an offline PLC's requests fail fast (return None) and a background
+        thread reconnects it with exponential backoff instead of blocking the UI timer.
+
+    - asyncModbusServer: A single thread asyncio Modbus-TCP server with the pyModbusTCP
+        ModbusServer interface, it uses the ModbusServer's function engine to process the 
+        frames so the data handler callbacks are the same as the thread backend. The number
+        of client connections is limited, the pipelined requests of one connection are 
+        processed at most queueDepth per event loop turn and replied in one write.
 
     - modbusTcpServer: Modbus-TCP server module will be used by PLC module to handle the modbus 
         data read/set request. If the input data handler is None, the server will create and keep 
-        one empty databank inside.
+        one empty databank inside. The server backend is the pyModbusTCP ModbusServer (one 
+        thread per client connection) or the asyncModbusServer.
 """
 
 import time
-from collections import OrderedDict
+import socket
+import struct
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+import ladderEngine
+import ipFilter
+import perfStats
 
 from pyModbusTCP.client import ModbusClient
 from pyModbusTCP.server import ModbusServer, DataHandler, DataBank
-from pyModbusTCP.constants import EXP_ILLEGAL_FUNCTION
+from pyModbusTCP.constants import EXP_ILLEGAL_FUNCTION, EXP_GATEWAY_PATH_UNAVAILABLE, EXP_SLAVE_DEVICE_BUSY
+from pyModbusTCP.constants import MB_NO_ERR, MB_EXCEPT_ERR
+
+MB_BACKENDS = ('thread', 'asyncio') # modbusTcpServer backends.
+DEF_MAX_CONN = 1024     # default max client connections of the asyncio server.
+DEF_QUEUE_DEPTH = 16    # default max pipelined requests of one asyncio server connection.
+MBAP_SZ = 7             # Modbus-TCP MBAP header size.
+REQ_CLASSES = ('hmi', 'others') # priorityDataHandler request classes in priority order.
+DEF_REQ_QUEUE = 64      # default max queued requests of every request class.
+DEF_REQ_AGE = 0.2       # default max seconds a request waits in the queue.
+MAX_READ_COILS = 2000   # max coils of one read coils request.
+MAX_READ_REGS = 125     # max registers of one read holding registers request.
+MAX_WRITE_COILS = 1968  # max coils of one write multiple coils request.
+MAX_WRITE_REGS = 123    # max registers of one write multiple registers request.
+DEF_PIPELINE_DEPTH = 16 # default max in flight transactions of the pipelined client.
+DEF_REQ_TO = 0.5        # default request time out (sec) of the connection pool clients.
+DEF_FAIL_NUM = 3        # default continuous failed requests to open the circuit breaker.
+DEF_MIN_BACKOFF = 0.5   # default first reconnect retry interval (sec).
+DEF_MAX_BACKOFF = 30    # default max reconnect retry interval (sec).
+RECONN_INTERVAL = 0.1   # connection pool reconnect thread check interval (sec).
+# The asyncio server backend needs the pyModbusTCP ModbusServer request engine (check runMbEngine()).
+HAS_MB_ENGINE = hasattr(ModbusServer, '_engine') and hasattr(ModbusServer, 'SessionData')
+
+#-----------------------------------------------------------------------------
+def addrMask(addrInfo):
+    """ Return the address bit mask of the ladder address info {'address': x, 'offset': n}."""
+    if addrInfo['address'] is None or not addrInfo['offset']: return 0
+    return ((1 << addrInfo['offset']) - 1) << addrInfo['address']
+
+#-----------------------------------------------------------------------------
+def mergeRanges(rangeList, maxSpan, maxGap=None):
+    """ Merge the (address, offset) read ranges to the fewest spans within maxSpan.
+        Args:
+            rangeList (list): [(address, offset), ...] ranges to read.
+            maxSpan (int): max number of addresses of one read request.
+            maxGap (int, optional): max number of not needed addresses between two
+                merged ranges. Defaults to None (any gap within maxSpan).
+        Returns:
+            list: [[spanAddress, spanOffset, [rangeList index, ...]], ...], the span
+                larger than maxSpan is a single range which needs to be read by chunks.
+    """
+    spans = []
+    for i in sorted(range(len(rangeList)), key=lambda i: rangeList[i][0]):
+        address, offset = rangeList[i]
+        if spans:
+            span = spans[-1]
+            spanEnd, end = span[0] + span[1], address + offset
+            gapOk = maxGap is None or address - spanEnd <= maxGap
+            if gapOk and max(end, spanEnd) - span[0] <= maxSpan:
+                span[1] = max(end, spanEnd) - span[0]
+                span[2].append(i)
+                continue
+        spans.append([address, offset, [i]])
+    return spans
+
+#-----------------------------------------------------------------------------
+def buildPdu(reqType, address, value):
+    """ Build the request PDU bytes.
+        Args:
+            reqType (str): 'coils', 'hregs' (value is the number to read), 'setcoils'
+                or 'setregs' (value is the list to write).
+    """
+    if reqType == 'coils': return struct.pack('>BHH', 0x01, address, value)
+    if reqType == 'hregs': return struct.pack('>BHH', 0x03, address, value)
+    if reqType == 'setcoils':
+        bitsBytes = bytearray((len(value) + 7) // 8)
+        for i, bit in enumerate(value):
+            if bit: bitsBytes[i // 8] |= 1 << (i % 8)
+        return struct.pack('>BHHB', 0x0F, address, len(value), len(bitsBytes)) + bytes(bitsBytes)
+    if reqType == 'setregs':
+        return struct.pack('>BHHB%dH' % len(value), 0x10, address, len(value),
+                           2 * len(value), *value)
+    raise ValueError('Unknown request type: %s' % str(reqType))
+
+def parsePdu(reqType, value, pdu):
+    """ Parse the reply PDU bytes of the buildPdu() request, return the read list,
+        True for the write request or None if the reply is an exception or invalid.
+    """
+    if not pdu or pdu[0] & 0x80: return None
+    try:
+        if reqType == 'coils':
+            return [bool(pdu[2 + i // 8] >> (i % 8) & 1) for i in range(value)]
+        if reqType == 'hregs':
+            return list(struct.unpack('>%dH' % value, pdu[2:2 + 2 * value]))
+        return True
+    except (IndexError, struct.error):
+        return None
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -94,6 +222,13 @@ class ladderLogic(object):
     def getDestCoilsInfo(self):
         return self.destCoilsInfo
 
+    def getInputMasks(self):
+        """ Return the (holding registers, coils) address bit masks the ladder reads, the 
+            plcDataHandler only runs the ladder if one of the addresses changed. Return None
+            to run the ladder in every update.
+        """
+        return (addrMask(self.holdingRegsInfo), addrMask(self.srcCoilsInfo))
+
 #-----------------------------------------------------------------------------
     def runLadderLogic(self, regsList, coilList=None):
         """ Pass in the registers state list, source coils state list and 
@@ -103,6 +238,49 @@ class ladderLogic(object):
         """
         return []
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class compiledLadderLogic(ladderLogic):
+    """ The ladder logic described by the rung dict list self.rungs (details refer to the
+        ladderEngine < Program Design > part), set the rungs with the registers and coils
+        info in initLadderInfo(). The contact 'C<n>' is the source coil n, if the source
+        coils are the destination coils, the tff rungs use them as the current state.
+    """
+    def __init__(self, parent, ladderName=None) -> None:
+        self.rungs = []
+        super().__init__(parent, ladderName=ladderName)
+        self.regCount = self.holdingRegsInfo['offset'] or 0
+        self.srcCoilCount = self.srcCoilsInfo['offset'] or 0
+        self.destCoilCount = self.destCoilsInfo['offset'] or 0
+        self.program = ladderEngine.ladderProgram(self.rungs, self.regCount, self.destCoilCount,
+                                                  srcCoilCount=self.srcCoilCount)
+        self.stateFromSrc = self.srcCoilsInfo == self.destCoilsInfo
+        self.lastOutImg = 0
+        # only the registers and coils used by the rungs are the ladder's inputs.
+        inputMask = self.program.getInputMask()
+        regsMask = (inputMask & ((1 << self.regCount) - 1)) << (self.holdingRegsInfo['address'] or 0)
+        coilsMask = (inputMask >> self.regCount) << (self.srcCoilsInfo['address'] or 0)
+        if self.stateFromSrc: coilsMask |= self.program.tffMask << (self.srcCoilsInfo['address'] or 0)
+        self.inputMasks = None if self.program.isTimeDriven() else (regsMask, coilsMask)
+
+    def getProgram(self):
+        return self.program
+
+    def getInputMasks(self):
+        return self.inputMasks
+
+    def runLadderLogic(self, regsList, coilList=None):
+        """ Calculate the destination coils state with the compiled rungs."""
+        if not self.program.getRungCount(): return []
+        if regsList is None or len(regsList) != self.regCount or len(coilList or []) != self.srcCoilCount:
+            print("runLadderLogic() Error: input not valid: %s, %s" % (str(regsList), str(coilList)))
+            return []
+        srcImg = ladderEngine.packBits(coilList)
+        inputImg = ladderEngine.packBits(regsList) | (srcImg << self.regCount)
+        stateImg = srcImg if self.stateFromSrc else self.lastOutImg
+        self.lastOutImg = self.program.evaluate(inputImg, stateImg=stateImg)
+        return ladderEngine.unpackBits(self.lastOutImg, self.destCoilCount)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class plcDataHandler(DataHandler):
@@ -116,29 +294,59 @@ class plcDataHandler(DataHandler):
         """ Obj init example: plcDataHandler(allowRipList=['127.0.0.1', '192.168.10.112'], allowWipList=['192.168.10.113'])
         Args:
             data_bank (<pyModbusTcp.DataBank>, optional): . Defaults to None.
-            allowRipList (list(str), optional): list of ip address string which are allowed to read 
-                the data from PLC. Defaults to None allow any ip to read. 
-            allowWipList (list(str), optional): list of ip address string which are allowed to write
-                the data to PLC. Defaults to None allow any ip to write.
+            allowRipList (list(str), optional): list of ip address (or CIDR subnet such as 
+                '192.168.10.0/24') string which are allowed to read the data from PLC. Defaults 
+                to None allow any ip to read. 
+            allowWipList (list(str), optional): list of ip address (or CIDR subnet) string which 
+                are allowed to write the data to PLC. Defaults to None allow any ip to write.
         """
         self.data_bank = DataBank() if data_bank is None else data_bank
         super().__init__(self.data_bank)
         self.serverInfo = None
         self.allowRipList = allowRipList
         self.allowWipList = allowWipList
+        self.readFilter = ipFilter.ipAllowList(allowRipList)
+        self.writeFilter = ipFilter.ipAllowList(allowWipList)
+        self.deniedCounter = ipFilter.ipCounter()   # requests denied by the allow lists.
+        self.busyCounter = ipFilter.ipCounter()     # requests rejected by the rate limit.
+        self.rateLimiter = None
         self.autoUpdate = False # auto update if the holding register state changed. 
         self.ladderDict = OrderedDict()
+        self.requestHandler = None      # called when a client request is received.
+        self.ladderTimeHandler = None   # called with the ladder logic execution seconds.
+        # dirty bitmaps (bit n: address n) of the holding registers and coils changed
+        # since the last updateState(), -1: all the addresses.
+        self.dirtyLock = threading.Lock()
+        self.dirtyRegs = 0
+        self.dirtyCoils = 0
+        self.ladderOutputs = {} # last written coils of every ladder.
+        # clients' holding registers write update mode, None: run updateState() in the
+        # write request, 0: at the next updateState() call, >0: the logic thread runs it
+        # at most once per coalesceInt seconds.
+        self.coalesceInt = None
+        self.rawIpList = []     # read-after-write clients.
+        self.updateLock = threading.Lock()
+        self.pendingEvent = threading.Event()
+        self.logicThread = None
 
     def _checkAllowRead(self, ipaddress):
         """ Check whether the input IP addres is allowed to read the info."""
-        if (self.allowRipList is None) or (ipaddress in self.allowRipList): return True
+        if self.readFilter.isAllowed(ipaddress): return True
+        self.deniedCounter.inc(ipaddress)
         return False 
 
     def _checkAllowWrite(self, ipaddress):
         """ Check whether the input IP addres is allowed to write the info."""
-        if (self.allowWipList is None) or (ipaddress in self.allowWipList): return True
+        if self.writeFilter.isAllowed(ipaddress): return True
+        self.deniedCounter.inc(ipaddress)
         return False
 
+    def _checkOverRate(self, ipaddress):
+        """ Check whether the input IP address's requests exceed the rate limit."""
+        if self.rateLimiter is None or self.rateLimiter.allow(ipaddress): return False
+        self.busyCounter.inc(ipaddress)
+        return True
+
 #-----------------------------------------------------------------------------
     def initServerInfo(self, serverInfo):
         """ Init the server Information.
@@ -157,6 +365,37 @@ class plcDataHandler(DataHandler):
                 logicObj (ladderLogic): _description_
         """
         self.ladderDict[ladderKey] = logicObj
+        self.ladderOutputs.pop(ladderKey, None)
+        with self.dirtyLock:
+            self.dirtyRegs = self.dirtyCoils = -1
+
+#-----------------------------------------------------------------------------
+    def _changedMask(self, address, oldList, newList, bitFlg=False):
+        """ Return the address bit mask of the values changed from oldList to newList."""
+        if oldList is None: return ((1 << len(newList)) - 1) << address
+        mask = 0
+        for idx, (oldVal, newVal) in enumerate(zip(oldList, newList)):
+            if (bool(oldVal) != bool(newVal)) if bitFlg else (oldVal != newVal): mask |= 1 << idx
+        return mask << address
+
+    def _writeRegs(self, address, words_l, srv_info):
+        """ Write the holding registers and mark the changed registers dirty."""
+        with self.dirtyLock:
+            oldList = self.data_bank.get_holding_registers(address, number=len(words_l), srv_info=srv_info)
+            result = super().write_h_regs(address, words_l, srv_info)
+            self.dirtyRegs |= self._changedMask(address, oldList, words_l)
+        return result
+
+    def _writeCoils(self, address, bits_l, srv_info, dirty=True):
+        """ Write the coils, return (result, changed coils address mask). The changed 
+            coils are marked dirty if dirty is True (written by a client).
+        """
+        with self.dirtyLock:
+            oldList = self.data_bank.get_coils(address, number=len(bits_l), srv_info=srv_info)
+            result = super().write_coils(address, bits_l, srv_info)
+            changedMask = self._changedMask(address, oldList, bits_l, bitFlg=True)
+            if dirty: self.dirtyCoils |= changedMask
+        return (result, changedMask)
 
 #-----------------------------------------------------------------------------
 # Init all the iterator read() functions.(Internal callback by <modbusTcpServer>)
@@ -167,8 +406,12 @@ class plcDataHandler(DataHandler):
 
     def read_coils(self, address, addrOffset, srv_info):
         """ Read the output coils state"""
+        if self.requestHandler: self.requestHandler()
+        if self._checkOverRate(srv_info.client.address): return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
         try:
             if self._checkAllowRead(srv_info.client.address):
+                # read-after-write: run the pending ladder update before the client reads.
+                if srv_info.client.address in self.rawIpList and self.hasPendingUpdate(): self.updateState()
                 return super().read_coils(address, addrOffset, srv_info)
         except Exception as err:
             print("read_coils() Error: %s" %str(err))
@@ -176,6 +419,8 @@ class plcDataHandler(DataHandler):
 
     def read_d_inputs(self, address, addrOffset, srv_info):
         """ Read the discrete input idx[I0.x]"""
+        if self.requestHandler: self.requestHandler()
+        if self._checkOverRate(srv_info.client.address): return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
         try:
             if self._checkAllowRead(srv_info.client.address):
                 return super().read_d_inputs(address, addrOffset, srv_info)
@@ -185,6 +430,8 @@ class plcDataHandler(DataHandler):
 
     def read_h_regs(self, address, addrOffset, srv_info):
         """ Read the holding registers [idx]. """
+        if self.requestHandler: self.requestHandler()
+        if self._checkOverRate(srv_info.client.address): return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
         try:
             if self._checkAllowRead(srv_info.client.address):
                 return super().read_h_regs(address, addrOffset, srv_info)
@@ -194,6 +441,8 @@ class plcDataHandler(DataHandler):
 
     def read_i_regs(self, address, addrOffset, srv_info):
         """ Read the input registers"""
+        if self.requestHandler: self.requestHandler()
+        if self._checkOverRate(srv_info.client.address): return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
         try:
             if self._checkAllowRead(srv_info.client.address):
                 return super().read_i_regs(address, addrOffset, srv_info)
@@ -211,19 +460,27 @@ class plcDataHandler(DataHandler):
 
     def write_coils(self, address, bits_l, srv_info):
         """ Write the PLC out coils."""
+        if self.requestHandler: self.requestHandler()
+        if self._checkOverRate(srv_info.client.address): return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
         try:
             if self._checkAllowWrite(srv_info.client.address):
-                return super().write_coils(address, bits_l, srv_info)
+                return self._writeCoils(address, bits_l, srv_info)[0]
         except Exception as err:
             print("write_coils() Error: %s" %str(err))
         return DataHandler.Return(exp_code=EXP_ILLEGAL_FUNCTION)
 
     def write_h_regs(self, address, words_l, srv_info):
         """ write the holding registers."""
+        if self.requestHandler: self.requestHandler()
+        if self._checkOverRate(srv_info.client.address): return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
         try:
             if self._checkAllowWrite(srv_info.client.address):
-                result = super().write_h_regs(address, words_l, srv_info)
-                if self.autoUpdate: self.updateState()
+                result = self._writeRegs(address, words_l, srv_info)
+                if self.autoUpdate:
+                    if self.coalesceInt is None:
+                        self.updateState()
+                    elif self.coalesceInt > 0:
+                        self.pendingEvent.set()
                 return result
         except Exception as err:
             print("write_h_regs() Error: %s" %str(err))
@@ -248,38 +505,107 @@ class plcDataHandler(DataHandler):
         """
         self.autoUpdate = updateFlag
 
+    def setCoalesceUpdate(self, interval, rawIpList=None):
+        """ Set how the ladder logic is updated after the clients' holding registers write
+            (the auto update flag needs to be 'True'), the write request is replied without
+            waiting the ladder logic in the coalesce mode.
+            Args:
+                interval (float): None or <0: run the ladder logic in the write request, 
+                    0: only mark the change, the next updateState() call (PLC scan cycle)
+                    runs it, >0: a logic thread runs it at most once per interval seconds.
+                rawIpList (list(str), optional): read-after-write client ip list, the coils
+                    read request of these clients runs the pending update first. 
+                    Defaults to None.
+        """
+        self.coalesceInt = interval if interval is not None and interval >= 0 else None
+        self.rawIpList = list(rawIpList) if rawIpList else []
+        if self.coalesceInt and self.logicThread is None:
+            self.logicThread = threading.Thread(target=self._logicLoop, daemon=True)
+            self.logicThread.start()
+        self.pendingEvent.set()
+
+    def _logicLoop(self):
+        """ Logic thread: run the ladder update when the registers changed, then wait the
+            coalesce interval so all the writes during the interval need one update.
+        """
+        while self.coalesceInt:
+            self.pendingEvent.wait()
+            self.pendingEvent.clear()
+            if not self.coalesceInt: break
+            if self.hasPendingUpdate(): self.updateState()
+            time.sleep(self.coalesceInt)
+        self.logicThread = None
+
+    def hasPendingUpdate(self):
+        """ Return True if some registers/coils changed after the last updateState()."""
+        return bool(self.dirtyRegs or self.dirtyCoils)
+
+    def setPerfHandlers(self, requestHandler=None, ladderTimeHandler=None):
+        """ Set the performance instrumentation callbacks: requestHandler() is called 
+            for every client read/write request (in the server thread), ladderTimeHandler
+            (seconds) is called with the execution time of updateState().
+        """
+        self.requestHandler = requestHandler
+        self.ladderTimeHandler = ladderTimeHandler
+
+    def setRateLimit(self, rate, burst=None):
+        """ Limit every source IP's requests to rate per second (token bucket with burst 
+            tokens), the requests over the limit are replied with the slave device busy
+            exception. rate <= 0: disable the rate limit.
+        """
+        self.rateLimiter = ipFilter.rateLimiter(rate, burst=burst) if rate and rate > 0 else None
+
+    def getFilterStats(self):
+        """ Return the denied and rate limited (busy) requests counters of the source IPs."""
+        return OrderedDict([('denied', self.deniedCounter.getStats()),
+                            ('busy', self.busyCounter.getStats())])
+
     def setAllowReadIpaddresses(self, ipList):
         if isinstance(ipList, list) or isinstance(ipList, tuple) or ipList is None:
-            self.allowRipList = list(ipList)
+            self.allowRipList = None if ipList is None else list(ipList)
+            self.readFilter = ipFilter.ipAllowList(self.allowRipList)
             return True
         print("setAllowReadIpaddresses(): the input IP list is not valid.")
         return False
 
     def setAllowWriteIpaddresses(self, ipList):
         if isinstance(ipList, list) or isinstance(ipList, tuple) or ipList is None:
-            self.allowWipList = list(ipList)
+            self.allowWipList = None if ipList is None else list(ipList)
+            self.writeFilter = ipFilter.ipAllowList(self.allowWipList)
             return True
         print("setAllowWriteIpaddresses(): the input IP list is not valid.")
         return False
 
     def updateOutPutCoils(self, address, bitList):
         if self.serverInfo:
-            return super().write_coils(address, bitList, self.serverInfo)
+            return self._writeCoils(address, bitList, self.serverInfo)[0]
         print("updateOutPutCoils() Error: Parent modBus server not config, call initServerInfo() first.")
         return False
 
     def updateHoldingRegs(self, address, bitList):
         if self.serverInfo:
-            result = super().write_h_regs(address, bitList, self.serverInfo)
+            result = self._writeRegs(address, bitList, self.serverInfo)
             if self.autoUpdate: self.updateState()
             return result
         print("updateHoldingRegs() Error: Parent modBus server not config, call initServerInfo() first.")
         return False
 
     def updateState(self):
-        """ Update the PLC state base on the input ladder logic one by one."""
+        """ Update the PLC state base on the input ladder logic one by one, only the ladders
+            whose input registers/coils changed since the last update are executed and the
+            destination coils are only written if the ladder output changed.
+        """
+        with self.updateLock:
+            self._runLadders()
+
+    def _runLadders(self):
+        startT = time.monotonic()
+        with self.dirtyLock:
+            dirtyRegs, dirtyCoils = self.dirtyRegs, self.dirtyCoils
+            self.dirtyRegs = self.dirtyCoils = 0
         for key, item in self.ladderDict.items():
-            print("updateState(): update ladder logic: %s" %str(key))
+            inputMasks = item.getInputMasks()
+            if inputMasks is not None and not (dirtyRegs & inputMasks[0] or dirtyCoils & inputMasks[1]): continue
             # get the ladder logic related registers state.
             holdRegsInfo = item.getHoldingRegsInfo()
             if holdRegsInfo['address'] is None or holdRegsInfo['offset'] is None: continue
@@ -295,26 +621,428 @@ class plcDataHandler(DataHandler):
             destCoilState = item.runLadderLogic(regState, coilList=srcCoilState)
             if destCoilState is None or len(destCoilState) == 0: continue
             destCoidInfo = item.getDestCoilsInfo()
-            self.updateOutPutCoils(destCoidInfo['address'], destCoilState)
+            # skip the write if the output is same as last time and the coils are not changed.
+            if destCoilState == self.ladderOutputs.get(key) and not dirtyCoils & addrMask(destCoidInfo): continue
+            self.ladderOutputs[key] = list(destCoilState)
+            if not self.serverInfo: continue
+            # the ladder outputs don't trigger the next run, only the next ladders of
+            # this run read the new coils.
+            _, changedMask = self._writeCoils(destCoidInfo['address'], destCoilState, self.serverInfo, dirty=False)
+            dirtyCoils |= changedMask
+        if self.ladderTimeHandler: self.ladderTimeHandler(time.monotonic() - startT)
             
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class unitDataHandler(DataHandler):
+    """ Module inherited from pyModbusTcp.dataHandler to dispatch the client requests to 
+        the plcDataHandler registered with the request's unit ID (MBAP header), so several
+        simulated PLCs can share one Modbus-TCP server port. The request to an unknown 
+        unit ID is replied with the gateway path unavailable exception.
+    """
+    def __init__(self):
+        super().__init__(DataBank())
+        self.serverInfo = None
+        self.unitHandlers = {}
+
+    def initServerInfo(self, serverInfo):
+        """ Init the server info of all the unit data handlers."""
+        self.serverInfo = serverInfo
+        for handler in self.unitHandlers.values(): handler.initServerInfo(serverInfo)
+
+    def addUnitHandler(self, unitID, dataHandler):
+        """ Add the <plcDataHandler> to handle the requests sent to the unit ID."""
+        self.unitHandlers[int(unitID)] = dataHandler
+        if self.serverInfo: dataHandler.initServerInfo(self.serverInfo)
+
+    def getUnitIDs(self):
+        return list(self.unitHandlers.keys())
+
+    def _getHandler(self, srv_info):
+        try:
+            return self.unitHandlers.get(srv_info.recv_frame.mbap.unit_id)
+        except AttributeError:
+            return None
+
+    def _dispatch(self, funName, address, arg, srv_info):
+        handler = self._getHandler(srv_info)
+        if handler is None: return DataHandler.Return(exp_code=EXP_GATEWAY_PATH_UNAVAILABLE)
+        return getattr(handler, funName)(address, arg, srv_info)
+
+#-----------------------------------------------------------------------------
+    def read_coils(self, address, addrOffset, srv_info):
+        return self._dispatch('read_coils', address, addrOffset, srv_info)
+
+    def read_d_inputs(self, address, addrOffset, srv_info):
+        return self._dispatch('read_d_inputs', address, addrOffset, srv_info)
+
+    def read_h_regs(self, address, addrOffset, srv_info):
+        return self._dispatch('read_h_regs', address, addrOffset, srv_info)
+
+    def read_i_regs(self, address, addrOffset, srv_info):
+        return self._dispatch('read_i_regs', address, addrOffset, srv_info)
+
+    def write_coils(self, address, bits_l, srv_info):
+        return self._dispatch('write_coils', address, bits_l, srv_info)
+
+    def write_h_regs(self, address, words_l, srv_info):
+        return self._dispatch('write_h_regs', address, words_l, srv_info)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class priorityDataHandler(DataHandler):
+    """ Module inherited from pyModbusTcp.dataHandler to put the client requests in the
+        bounded priority queues keyed by the request's source IP before passing them to 
+        the inner data handler (plcDataHandler or unitDataHandler). The requests are 
+        executed one by one: if no request is running or queued, the request is executed
+        directly in the server thread, else it is queued and one worker thread executes
+        the queued requests, the priority (HMI) sources' queue first. The request is shed
+        with the slave device busy exception if its queue is full or it waited longer 
+        than the max age, so the flood of the other sources can't delay the HMI requests
+        and the waiting time of every queued request is bounded.
+    """
+    def __init__(self, dataHandler, priorityIpList=None, maxDepth=DEF_REQ_QUEUE, maxAge=DEF_REQ_AGE):
+        """ Init example: handler = priorityDataHandler(dataMgr, priorityIpList=['127.0.0.1'])
+            Args:
+                dataHandler (DataHandler): the inner data handler.
+                priorityIpList (list(str), optional): priority (HMI) source ip address or 
+                    CIDR subnet list. Defaults to None.
+                maxDepth (int, optional): max queued requests of every class. Defaults to 
+                    DEF_REQ_QUEUE.
+                maxAge (float, optional): max seconds a request waits in the queue. 
+                    Defaults to DEF_REQ_AGE.
+        """
+        super().__init__(dataHandler.data_bank)
+        self.dataHandler = dataHandler
+        self.priorityFilter = ipFilter.ipAllowList(priorityIpList or [])
+        self.maxDepth = max(1, int(maxDepth))
+        self.maxAge = maxAge
+        self.queues = [deque() for _ in REQ_CLASSES]
+        self.queueCond = threading.Condition()
+        self.running = False    # a request is being executed.
+        self.classStats = [{'processed': 0, 'shedFull': 0, 'shedAge': 0, 'maxDepth': 0,
+                            'wait': perfStats.latencyHistogram()} for _ in REQ_CLASSES]
+        self.terminate = False
+        self.worker = threading.Thread(target=self._workLoop, daemon=True)
+        self.worker.start()
+
+    def initServerInfo(self, serverInfo):
+        self.dataHandler.initServerInfo(serverInfo)
+
+    def stop(self):
+        with self.queueCond:
+            self.terminate = True
+            self.queueCond.notify()
+
+#-----------------------------------------------------------------------------
+    def getQueueStats(self):
+        """ Return every request class's current/max queue depth, processed requests,
+            shed requests (queue full / too old) and the queue waiting time (ms).
+        """
+        stats = OrderedDict()
+        with self.queueCond:
+            depths = [len(queue) for queue in self.queues]
+        for idx, name in enumerate(REQ_CLASSES):
+            clsStats = self.classStats[idx]
+            stats[name] = OrderedDict([('depth', depths[idx]),
+                                       ('maxDepth', clsStats['maxDepth']),
+                                       ('processed', clsStats['processed']),
+                                       ('shedFull', clsStats['shedFull']),
+                                       ('shedAge', clsStats['shedAge']),
+                                       ('wait', clsStats['wait'].getStats())])
+        return stats
+
+#-----------------------------------------------------------------------------
+    def _execute(self, clsIdx, job):
+        """ Execute the request with the inner data handler, then let the worker run 
+            the next queued request.
+        """
+        self.classStats[clsIdx]['processed'] += 1
+        try:
+            job['result'] = getattr(self.dataHandler, job['func'])(*job['args'])
+        except Exception as err:
+            print("priorityDataHandler: %s() Error: %s" % (job['func'], str(err)))
+        with self.queueCond:
+            self.running = False
+            if any(self.queues): self.queueCond.notify()
+
+    def _workLoop(self):
+        """ Worker thread: execute the queued requests, the priority class first."""
+        while True:
+            with self.queueCond:
+                while not self.terminate and (self.running or not any(self.queues)): 
+                    self.queueCond.wait()
+                if self.terminate: break
+                clsIdx = 0 if self.queues[0] else 1
+                job = self.queues[clsIdx].popleft()
+                waitT = time.monotonic() - job['time']
+                self.running = waitT <= self.maxAge
+            self.classStats[clsIdx]['wait'].add(waitT)
+            if self.running:
+                self._execute(clsIdx, job)
+            else:
+                self.classStats[clsIdx]['shedAge'] += 1
+                job['result'] = DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
+            job['event'].set()
+        # release the requests still waiting in the queues.
+        with self.queueCond:
+            for queue in self.queues:
+                while queue: queue.popleft()['event'].set()
+
+    def _submit(self, funName, address, arg, srv_info):
+        """ Execute the request directly if the handler is idle, else queue it and wait
+            the worker's result.
+        """
+        clsIdx = 0 if self.priorityFilter.isAllowed(srv_info.client.address) else 1
+        job = {'func': funName, 'args': (address, arg, srv_info), 'time': time.monotonic(),
+               'result': None, 'event': None}
+        with self.queueCond:
+            queue = self.queues[clsIdx]
+            if self.terminate or len(queue) >= self.maxDepth:
+                self.classStats[clsIdx]['shedFull'] += 1
+                return DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
+            inline = not self.running and not any(self.queues)
+            if inline:
+                self.running = True
+            else:
+                job['event'] = threading.Event()
+                queue.append(job)
+                if len(queue) > self.classStats[clsIdx]['maxDepth']: self.classStats[clsIdx]['maxDepth'] = len(queue)
+                self.queueCond.notify()
+        if inline:
+            self.classStats[clsIdx]['wait'].add(0)
+            self._execute(clsIdx, job)
+        else:
+            job['event'].wait()
+        return job['result'] or DataHandler.Return(exp_code=EXP_SLAVE_DEVICE_BUSY)
+
+#-----------------------------------------------------------------------------
+    def read_coils(self, address, addrOffset, srv_info):
+        return self._submit('read_coils', address, addrOffset, srv_info)
+
+    def read_d_inputs(self, address, addrOffset, srv_info):
+        return self._submit('read_d_inputs', address, addrOffset, srv_info)
+
+    def read_h_regs(self, address, addrOffset, srv_info):
+        return self._submit('read_h_regs', address, addrOffset, srv_info)
+
+    def read_i_regs(self, address, addrOffset, srv_info):
+        return self._submit('read_i_regs', address, addrOffset, srv_info)
+
+    def write_coils(self, address, bits_l, srv_info):
+        return self._submit('write_coils', address, bits_l, srv_info)
+
+    def write_h_regs(self, address, words_l, srv_info):
+        return self._submit('write_h_regs', address, words_l, srv_info)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class circuitBreaker(object):
+    """ Circuit breaker of one PLC connection: the breaker opens if the connection is
+        lost or after failNum continuous failed requests, then all the requests fail
+        fast until the connection pool reconnects the PLC. The reconnect retry interval
+        is doubled from minBackoff up to maxBackoff.
+    """
+    def __init__(self, failNum=DEF_FAIL_NUM, minBackoff=DEF_MIN_BACKOFF, maxBackoff=DEF_MAX_BACKOFF):
+        self.failNum = failNum
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.opened = False
+        self.failCount = 0
+        self.tripCount = 0
+        self.backoff = minBackoff
+        self.retryT = 0
+        self.lock = threading.Lock()
+
+    def allowRequest(self):
+        return not self.opened
+
+    def onSuccess(self):
+        self.failCount = 0
+
+    def onFailure(self, connLost=False):
+        with self.lock:
+            self.failCount += 1
+            if connLost or self.failCount >= self.failNum: self._trip()
+
+    def _trip(self):
+        if self.opened: return
+        self.opened = True
+        self.tripCount += 1
+        self.backoff = self.minBackoff
+        self.retryT = time.monotonic() + self.backoff
+
+    def needRetry(self, now):
+        return self.opened and now >= self.retryT
+
+    def onRetry(self, success, now):
+        """ Close the breaker if the reconnect succeeded, else double the retry interval."""
+        with self.lock:
+            if success:
+                self.opened = False
+                self.failCount = 0
+            else:
+                self.backoff = min(self.maxBackoff, self.backoff * 2)
+                self.retryT = now + self.backoff
+
+    def getStats(self):
+        return OrderedDict([('opened', self.opened), ('failCount', self.failCount),
+                            ('tripCount', self.tripCount), ('backoff', self.backoff)])
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusConnPool(object):
+    """ Connection pool shared by the HMI data managers: one persistent modbusTcpClient
+        with a circuitBreaker per PLC endpoint, the requests use a sub-second time out
+        and a background thread reconnects the offline PLCs with exponential backoff.
+    """
+    def __init__(self, reqTO=DEF_REQ_TO, failNum=DEF_FAIL_NUM, minBackoff=DEF_MIN_BACKOFF,
+                 maxBackoff=DEF_MAX_BACKOFF):
+        """ Init example: connPool = modbusConnPool(reqTO=0.5, maxBackoff=30)
+            Args:
+                reqTO (float, optional): request time out (sec). Defaults to DEF_REQ_TO.
+                failNum (int, optional): continuous failed requests to open the circuit
+                    breaker. Defaults to DEF_FAIL_NUM.
+                minBackoff (float, optional): first reconnect retry interval (sec). 
+                    Defaults to DEF_MIN_BACKOFF.
+                maxBackoff (float, optional): max reconnect retry interval (sec). 
+                    Defaults to DEF_MAX_BACKOFF.
+        """
+        self.reqTO = reqTO
+        self.failNum = failNum
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.clients = OrderedDict()    # (ip, port): modbusTcpClient
+        self.lock = threading.Lock()
+        self.terminate = threading.Event()
+        self.thread = None
+
+    def _reconnectLoop(self):
+        while not self.terminate.wait(RECONN_INTERVAL):
+            now = time.monotonic()
+            for client in list(self.clients.values()):
+                if self.terminate.is_set(): break
+                if client.breaker.needRetry(now): client.reconnect()
+
+#--modbusConnPool--------------------------------------------------------------
+    def getClient(self, tgtIp, tgtPort=502):
+        """ Return the shared client of the PLC endpoint, create it if not exist."""
+        key = (tgtIp, int(tgtPort))
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                breaker = circuitBreaker(failNum=self.failNum, minBackoff=self.minBackoff,
+                                         maxBackoff=self.maxBackoff)
+                client = self.clients[key] = modbusTcpClient(tgtIp, tgtPort=int(tgtPort), 
+                                                             defaultTO=self.reqTO, 
+                                                             connTries=1, breaker=breaker)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._reconnectLoop, daemon=True)
+                self.thread.start()
+        return client
+
+    def getStats(self):
+        """ Return the circuit breaker state of every PLC endpoint."""
+        return OrderedDict([('%s:%s' % key, client.breaker.getStats()) 
+                            for key, client in self.clients.items()])
+
+    def stop(self):
+        self.terminate.set()
+        if self.thread: self.thread.join()
+        for client in self.clients.values(): client.close()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusPipeline(object):
+    """ Pipelined Modbus-TCP transport: send several request frames in one write 
+        before reading the replies, the replies are matched by the transaction ID.
+    """
+    def __init__(self, tgtIp, tgtPort=502, unitId=1, timeout=30, depth=DEF_PIPELINE_DEPTH):
+        """ Init example: pipeline = modbusPipeline('127.0.0.1', unitId=1)
+            Args:
+                tgtIp (str): target PLC ip Address.
+                tgtPort (int, optional): modbus port. Defaults to 502.
+                unitId (int, optional): modbus unit ID. Defaults to 1.
+                timeout (int, optional): reply time out in sec. Defaults to 30.
+                depth (int, optional): max in flight transactions. Defaults to DEF_PIPELINE_DEPTH.
+        """
+        self.tgtIp = tgtIp
+        self.tgtPort = tgtPort
+        self.unitId = unitId
+        self.timeout = timeout
+        self.depth = max(1, int(depth))
+        self.sock = None
+        self.tid = 0
+
+    def _open(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.tgtIp, self.tgtPort), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.sock
+
+    def _recvAll(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk: raise ConnectionError('connection closed by the PLC')
+            data += chunk
+        return data
+
+#--modbusPipeline--------------------------------------------------------------
+    def request(self, pduList):
+        """ Send the request PDUs and return the reply PDU list in the same order, the
+            reply is None if the transaction failed.
+        """
+        replies = [None] * len(pduList)
+        try:
+            self._open()
+            for start in range(0, len(pduList), self.depth):
+                tidMap, frames = {}, []
+                for i in range(start, min(start + self.depth, len(pduList))):
+                    self.tid = self.tid % 0xFFFF + 1
+                    tidMap[self.tid] = i
+                    frames.append(struct.pack('>HHHB', self.tid, 0, len(pduList[i]) + 1, 
+                                              self.unitId) + pduList[i])
+                self.sock.sendall(b''.join(frames))
+                while tidMap:
+                    tid, _, length, _ = struct.unpack('>HHHB', self._recvAll(MBAP_SZ))
+                    pdu = self._recvAll(length - 1)
+                    if tid in tidMap: replies[tidMap.pop(tid)] = pdu
+        except (OSError, struct.error) as err:
+            print('modbusPipeline: request error: %s' % str(err))
+            self.close()
+        return replies
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class modbusTcpClient(object):
     """ Modbus-TCP client module to read/write data from/to PLC."""
-    def __init__(self, tgtIp, tgtPort=502, defaultTO=30) -> None:
+    def __init__(self, tgtIp, tgtPort=502, defaultTO=30, connTries=5, breaker=None) -> None:
         """ Init example: client = modbusTcpCom.modbusTcpClient('127.0.0.1')
             Args:
                 tgtIp (str): target PLC ip Address. 
                 tgtPort (int, optional): modbus port. Defaults to 502.
                 defaultTO (int, optional): default time out if modbus server doesn't 
                     response. Defaults to 30 sec.
+                connTries (int, optional): connection tries (0.2 sec interval) during
+                    init. Defaults to 5.
+                breaker (circuitBreaker, optional): circuit breaker of the connection, 
+                    if set the client doesn't auto open the connection, the requests fail
+                    fast when the breaker is opened and the modbusConnPool reconnects it.
+                    Defaults to None.
         """
         self.tgtIp = tgtIp
         self.tgtPort = tgtPort
-        self.client = ModbusClient(host=self.tgtIp, port=self.tgtPort, auto_open=True)
+        self.breaker = breaker
+        self.lock = threading.Lock()
+        self.client = ModbusClient(host=self.tgtIp, port=self.tgtPort, auto_open=breaker is None)
         self.client.timeout = defaultTO  # set time out.
         # Try to connect to the PLC in 1 sec. 
-        for _ in range(5):
+        for _ in range(connTries):
             print('Try to login to the PLC unit: %s.' %str((self.tgtIp, self.tgtPort)))
             if self.client.open(): break
             time.sleep(0.2)
@@ -322,12 +1050,39 @@ class modbusTcpClient(object):
             print('Success connect to the target PLC: %s' % str((self.tgtIp, self.tgtPort)))
         else:
             print('Fail connect to the target PLC: %s' % str((self.tgtIp,self.tgtPort)))
+            if self.breaker: self.breaker.onFailure(connLost=True)
+        self.pipeline = None
 
 #-----------------------------------------------------------------------------
     def checkConn(self):
         """ return the last connection state."""
+        if self.breaker and not self.breaker.allowRequest(): return False
         return self.client.is_open
 
+    def reconnect(self):
+        """ Reopen the connection and update the circuit breaker, return True if success."""
+        with self.lock:
+            if self.pipeline: self.pipeline.close()
+            result = self.client.open()
+        if self.breaker: self.breaker.onRetry(result, time.monotonic())
+        return result
+
+    def _request(self, func, *args):
+        """ Run the pyModbusTCP client request function, return None if the connection 
+            is not open or the circuit breaker is opened.
+        """
+        if self.breaker is None:
+            return func(*args) if self.client.is_open else None
+        if not self.breaker.allowRequest(): return None
+        with self.lock:
+            data = func(*args) if self.client.is_open else None
+            connLost = not self.client.is_open
+            if not connLost and self.client.last_error in (MB_NO_ERR, MB_EXCEPT_ERR):
+                self.breaker.onSuccess()
+            else:
+                self.breaker.onFailure(connLost=connLost)
+        return data
+
 #-----------------------------------------------------------------------------
 # Define all the get() functions here:
 # Return value type: 
@@ -337,35 +1092,283 @@ class modbusTcpClient(object):
 
     def getCoilsBits(self, addressIdx, offset):
         """ Get the coils bit list [addressIdx: addressIdx + offset] of the PLC."""
-        if self.client.is_open:
-            data = self.client.read_coils(addressIdx, offset)
-            if data: return list(data)
-        return None
+        data = self._request(self.client.read_coils, addressIdx, offset)
+        return list(data) if data else None
     
     def getHoldingRegs(self, addressIdx, offset):
         """ Get the holding register bit list [addressIdx: addressIdx + offset] of the PLC."""
-        if self.client.is_open:
-            data = self.client.read_holding_registers(addressIdx, offset)
-            if data: return list(data)
-        return None
+        data = self._request(self.client.read_holding_registers, addressIdx, offset)
+        return list(data) if data else None
 
 #-----------------------------------------------------------------------------
 # Define all the set() functions here:
 
     def setCoilsBit(self, addressIdx, bitVal):
-        if self.client.is_open:
-            data = self.client.write_single_coil(addressIdx, bitVal)
-            return data
-        return None
+        return self._request(self.client.write_single_coil, addressIdx, bitVal)
 
     def setHoldingRegs(self, addressIdx, bitVal):
-        if self.client.is_open:
-            data = self.client.write_single_register(addressIdx, bitVal)
-            return data
-        return None
+        return self._request(self.client.write_single_register, addressIdx, bitVal)
+
+    def setMultiCoils(self, addressIdx, bitList):
+        """ Set the coils [addressIdx: addressIdx + len(bitList)] with the write multiple
+            coils requests, return True if all the coils are set else None.
+        """
+        reqList = [('setcoils', addressIdx + i, list(bitList[i:i + MAX_WRITE_COILS]))
+                   for i in range(0, len(bitList), MAX_WRITE_COILS)]
+        return True if reqList and all(self.batchRequests(reqList)) else None
+
+    def setMultiHoldingRegs(self, addressIdx, valList):
+        """ Set the holding registers [addressIdx: addressIdx + len(valList)] with the 
+            write multiple registers requests, return True if all are set else None.
+        """
+        reqList = [('setregs', addressIdx + i, list(valList[i:i + MAX_WRITE_REGS]))
+                   for i in range(0, len(valList), MAX_WRITE_REGS)]
+        return True if reqList and all(self.batchRequests(reqList)) else None
+
+#-----------------------------------------------------------------------------
+# Define the bulk request functions here:
+
+    def setPipelineMode(self, flag, depth=DEF_PIPELINE_DEPTH):
+        """ Enable/disable the pipelined mode of batchRequests(): all the requests of
+            one batch are sent before the replies are read (at most depth in flight).
+        """
+        if self.pipeline: self.pipeline.close()
+        self.pipeline = modbusPipeline(self.tgtIp, tgtPort=self.tgtPort, unitId=self.client.unit_id,
+                                       timeout=self.client.timeout, depth=depth) if flag else None
+
+    def batchRequests(self, reqList):
+        """ Execute the requests and return the result list in the same order.
+            Args:
+                reqList (list): [(reqType, address, value), ...], reqType 'coils'/'hregs'
+                    read value number of coils/registers, 'setcoils'/'setregs' write the 
+                    value list.
+            Returns:
+                list: read data list, True for the write request or None if failed.
+        """
+        pduList = [buildPdu(*req) for req in reqList]
+        if not self.pipeline:
+            replies = [self._request(self.client.custom_request, pdu) for pdu in pduList]
+        elif self.breaker and not self.breaker.allowRequest():
+            replies = [None] * len(pduList)
+        else:
+            with self.lock:
+                replies = self.pipeline.request(pduList)
+            if self.breaker:
+                if pduList and replies.count(None) == len(replies):
+                    self.breaker.onFailure(connLost=self.pipeline.sock is None)
+                else:
+                    self.breaker.onSuccess()
+        return [parsePdu(req[0], req[2], reply) for req, reply in zip(reqList, replies)]
+
+    def _getMultiRanges(self, reqType, rangeList, maxSpan, maxGap):
+        spans = mergeRanges(rangeList, maxSpan, maxGap=maxGap)
+        reqList, chunkInfo = [], []
+        for spanAddr, spanNum, _ in spans:
+            chunkInfo.append(len(reqList))
+            reqList += [(reqType, spanAddr + i, min(maxSpan, spanNum - i)) 
+                        for i in range(0, spanNum, maxSpan)]
+        chunkInfo.append(len(reqList))
+        results = self.batchRequests(reqList)
+        rangeData = [None] * len(rangeList)
+        for n, (spanAddr, _, idxList) in enumerate(spans):
+            chunks = results[chunkInfo[n]:chunkInfo[n+1]]
+            if None in chunks: continue
+            data = [val for chunk in chunks for val in chunk]
+            for i in idxList:
+                address, offset = rangeList[i]
+                rangeData[i] = data[address - spanAddr: address - spanAddr + offset]
+        return rangeData
+
+    def getMultiCoilsBits(self, rangeList, maxGap=None):
+        """ Read the coils of several (addressIdx, offset) ranges with the fewest read 
+            requests (the ranges are merged within MAX_READ_COILS), return the bit list
+            of every range, None if the range read failed.
+        """
+        return self._getMultiRanges('coils', rangeList, MAX_READ_COILS, maxGap)
+
+    def getMultiHoldingRegs(self, rangeList, maxGap=None):
+        """ Read the holding registers of several (addressIdx, offset) ranges with the 
+            fewest read requests (the ranges are merged within MAX_READ_REGS), return the
+            register list of every range, None if the range read failed.
+        """
+        return self._getMultiRanges('hregs', rangeList, MAX_READ_REGS, maxGap)
 
     def close(self):
-        self.client.close()
+        with self.lock:
+            if self.pipeline: self.pipeline.close()
+            self.client.close()
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class modbusServerProtocol(asyncio.Protocol):
+    """ asyncio protocol of one client connection, split the received data to the
+        Modbus-TCP request frames and pass them to the asyncModbusServer.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.client = None
+        self.buffer = bytearray()
+        self.writePaused = False
+        self.resumeHandle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if not self.server.addConn(self):
+            transport.abort()
+            return
+        peer = transport.get_extra_info('peername') or ('', 0)
+        self.client = ModbusServer.ClientInfo(peer[0], peer[1])
+
+    def connection_lost(self, exc):
+        if self.resumeHandle: self.resumeHandle.cancel()
+        self.server.removeConn(self)
+
+    def data_received(self, data):
+        self.buffer += data
+        self.processFrames()
+
+    def pause_writing(self):
+        # the client doesn't read the replies: stop reading its requests.
+        self.writePaused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.writePaused = False
+        self.transport.resume_reading()
+        self.processFrames()
+
+    def _resume(self):
+        self.resumeHandle = None
+        if self.writePaused or self.transport.is_closing(): return
+        self.transport.resume_reading()
+        self.processFrames()
+
+#--modbusServerProtocol--------------------------------------------------------
+    def processFrames(self):
+        """ Process at most queueDepth buffered request frames and send the replies in
+            one write, if more frames are buffered the connection stops reading and 
+            continues in the next loop iteration so every client gets its turn.
+        """
+        replies = []
+        try:
+            while len(replies) < self.server.queueDepth and len(self.buffer) >= MBAP_SZ:
+                session = ModbusServer.SessionData()
+                session.client = self.client
+                session.request.mbap.raw = bytes(self.buffer[:MBAP_SZ])
+                frameLen = MBAP_SZ - 1 + session.request.mbap.length
+                if len(self.buffer) < frameLen: break
+                session.request.pdu.raw = bytes(self.buffer[MBAP_SZ:frameLen])
+                del self.buffer[:frameLen]
+                replies.append(self.server.processRequest(session))
+        except ModbusServer.Error:
+            # invalid frame: close the connection same as the thread backend.
+            if replies: self.transport.write(b''.join(replies))
+            self.transport.close()
+            return
+        if replies: self.transport.write(b''.join(replies))
+        if len(replies) >= self.server.queueDepth and len(self.buffer) >= MBAP_SZ \
+                and not self.writePaused and self.resumeHandle is None:
+            self.transport.pause_reading()
+            self.resumeHandle = self.server.loop.call_soon(self._resume)
+
+#-----------------------------------------------------------------------------
+def runMbEngine(engine, session):
+    """ Process one request session with the ModbusServer's request engine and return
+        the reply frame. The ModbusServer has no public API to process a request without
+        its socket threads, so this function calls the private ModbusServer._engine() 
+        (same in pyModbusTCP 0.2.0 pinned in requirements.txt and 0.3.1), check it if 
+        pyModbusTCP is upgraded.
+    """
+    session.set_response_mbap()
+    engine._engine(session)
+    return session.response.raw
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class asyncModbusServer(object):
+    """ Single thread asyncio Modbus-TCP server, provide the same start()/stop()/is_run
+        interface as the pyModbusTCP ModbusServer. The not started ModbusServer object 
+        is used to process the request frames, so all the Modbus functions and the data 
+        handler callbacks work the same as the thread backend.
+    """
+    ServerInfo = ModbusServer.ServerInfo
+
+    def __init__(self, host='localhost', port=502, data_bank=None, data_hdl=None, 
+                 maxConn=DEF_MAX_CONN, queueDepth=DEF_QUEUE_DEPTH):
+        """ Init example: server = asyncModbusServer(host='0.0.0.0', port=502, data_hdl=dataMgr)
+            Args:
+                host (str, optional): server address. Defaults to 'localhost'.
+                port (int, optional): modbus port. Defaults to 502.
+                data_bank (DataBank, optional): data bank if data_hdl is None. Defaults to None.
+                data_hdl (DataHandler, optional): data handler. Defaults to None.
+                maxConn (int, optional): max client connections, the new connection over
+                    the limit is closed. Defaults to DEF_MAX_CONN.
+                queueDepth (int, optional): max pipelined requests of one connection 
+                    processed in one turn, the connection stops reading until the next 
+                    turn if more are buffered. Defaults to DEF_QUEUE_DEPTH.
+        """
+        self.host = host
+        self.port = port
+        self.maxConn = max(1, int(maxConn))
+        self.queueDepth = max(1, int(queueDepth))
+        self.engine = ModbusServer(host=host, port=port, data_bank=data_bank, data_hdl=data_hdl)
+        self.data_hdl = self.engine.data_hdl
+        self.loop = None
+        self.stopEvent = None
+        self.conns = set()
+        self.rejectCount = 0
+        self._evtRunning = threading.Event()
+
+    @property
+    def is_run(self):
+        return self._evtRunning.is_set()
+
+    def getConnStats(self):
+        """ Return the current client connections number and the rejected connections."""
+        return {'connections': len(self.conns), 'rejected': self.rejectCount}
+
+#--asyncModbusServer-----------------------------------------------------------
+    def addConn(self, conn):
+        """ Add the client connection, return False if the max connections reached."""
+        if len(self.conns) >= self.maxConn:
+            self.rejectCount += 1
+            return False
+        self.conns.add(conn)
+        return True
+
+    def removeConn(self, conn):
+        self.conns.discard(conn)
+
+    def processRequest(self, session):
+        """ Process one request with the ModbusServer's request engine, return the reply."""
+        return runMbEngine(self.engine, session)
+
+#--asyncModbusServer-----------------------------------------------------------
+    async def _serve(self):
+        self.stopEvent = asyncio.Event()
+        server = await self.loop.create_server(lambda: modbusServerProtocol(self), self.host, self.port, 
+                                               reuse_address=True, backlog=self.maxConn)
+        self._evtRunning.set()
+        await self.stopEvent.wait()
+        server.close()
+        for conn in list(self.conns): conn.transport.abort()
+        await server.wait_closed()
+
+    def start(self):
+        """ Run the server event loop, this function will block until stop() is called."""
+        if self.is_run: return
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self._evtRunning.clear()
+            self.loop.close()
+
+    def stop(self):
+        """ Stop the server, this function can be called from any thread."""
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopEvent.set)
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -373,7 +1376,8 @@ class modbusTcpServer(object):
     """ Modbus-TCP server, used by PLC module to handle the modbus data read/set 
         request.
     """
-    def __init__(self, hostIp='0.0.0.0', hostPort=502, dataHandler=None) -> None:
+    def __init__(self, hostIp='0.0.0.0', hostPort=502, dataHandler=None, backend='thread', 
+                 maxConn=DEF_MAX_CONN, queueDepth=DEF_QUEUE_DEPTH) -> None:
         """Init example:
             dataMgr = modbusTcpCom.plcDataHandler(allowRipList=ALLOW_R_L, allowWipList=ALLOW_W_L)
             server = modbusTcpCom.modbusTcpServer(hostIp=hostIp, hostPort=hostPort, dataHandler=dataMgr)
@@ -382,15 +1386,31 @@ class modbusTcpServer(object):
             hostPort (int, optional): modbus port. Defaults to 502.
             dataHandler (<plcDataHandler>, optional): The handler object to auto process 
                 register and coils change. Defaults to None.
+            backend (str, optional): 'thread' pyModbusTCP ModbusServer (one thread per client
+                connection) or 'asyncio' asyncModbusServer. Defaults to 'thread'.
+            maxConn (int, optional): max client connections (asyncio backend). Defaults to 
+                DEF_MAX_CONN.
+            queueDepth (int, optional): max pipelined requests per connection (asyncio 
+                backend). Defaults to DEF_QUEUE_DEPTH.
         """
         self.hostIp = hostIp
         self.hostPort = hostPort
         self.server = None
+        if backend not in MB_BACKENDS:
+            print("Modbus server backend %s not support, use the thread backend." % str(backend))
+            backend = MB_BACKENDS[0]
+        if backend == 'asyncio' and not HAS_MB_ENGINE:
+            print("The installed pyModbusTCP has no ModbusServer request engine, use the thread backend.")
+            backend = MB_BACKENDS[0]
+        self.backend = backend
+        serverArgs = {'data_bank': DataBank()} if dataHandler is None else {'data_hdl': dataHandler}
         if dataHandler is None:
             print("PLC logic data handler is not define, use a empty data bank")
-            self.server = ModbusServer(host=hostIp, port=hostPort, data_bank=DataBank())
+        if self.backend == 'asyncio':
+            self.server = asyncModbusServer(host=hostIp, port=hostPort, maxConn=maxConn, 
+                                            queueDepth=queueDepth, **serverArgs)
         else:
-            self.server = ModbusServer(host=hostIp, port=hostPort, data_hdl=dataHandler)
+            self.server = ModbusServer(host=hostIp, port=hostPort, **serverArgs)
 
 #-----------------------------------------------------------------------------
     def isRunning(self):
@@ -401,6 +1421,9 @@ class modbusTcpServer(object):
     def getServerInfo(self):
         return self.server.ServerInfo
 
+    def getBackend(self):
+        return self.backend
+
 #-----------------------------------------------------------------------------
     def startServer(self):
         """ Run the server start loop."""
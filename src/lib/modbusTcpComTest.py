@@ -11,10 +11,20 @@
 # License:     MIT License 
 #-----------------------------------------------------------------------------
 
+import sys
 import time
+import queue
+import struct
+import asyncio
 import threading
+import multiprocessing
 import modbusTcpCom
 
+BENCH_PORT = 5021               # benchmark server port.
+BENCH_CLIENTS = (10, 100, 1000) # benchmark concurrent clients.
+BENCH_TIME = 3                  # benchmark duration (sec) of every case.
+BENCH_READ_GRACE = 1            # extra time (sec) to wait the reply of the request sent before the end time.
+
 class testModbusClientThread(threading.Thread):
     """
     This class is a subclass that inherits from the threading.Thread class. 
@@ -201,6 +211,100 @@ class testModbusClientThread(threading.Thread):
         print(f"[x] Test {testID}: setHoldingRegs() passed")
         time.sleep(0.5)
 
+#---------------------------------------------------------------------------
+# Define unit tests methods for the following ModbusTCPCom client bulk functions:
+#   - setMultiCoils()
+#   - setMultiHoldingRegs()
+#   - getMultiCoilsBits()
+#   - getMultiHoldingRegs()
+#   - modbusConnPool
+
+    def setMultiCoilsTest(self, setInput, readInput, expectedOutput, testID, pipeline=False):
+        """
+        Performs a unit test for setMultiCoils() method of the ModbusTcpClient object. 
+        It sets the coil bits list, retrieves the coil bit values ranges, compares the 
+        actual output with the expected output, and raises an assertion error if they 
+        do not match.
+        Args:
+            setInput (int, list): The first argument representing addressIdx and bitList
+            readInput (list): The second argument representing the (addressIdx, offset) ranges.
+            expectedOutput (list): The third argument representing the expected output.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+            pipeline (bool): Send the requests with the client pipelined mode.
+        Returns:
+            None
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> setMultiCoilsTest((0, [0, 1, 1, 0]), [(0, 2), (2, 2)], [[0, 1], [1, 0]], 1)
+                [x] Test 1: setMultiCoils() passed
+        """
+        self.client.setPipelineMode(pipeline)
+        self.client.setMultiCoils(setInput[0], setInput[1])
+        actualOutput = self.client.getMultiCoilsBits(readInput)
+        self.client.setPipelineMode(False)
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: setMultiCoils() failed"
+        print(f"[x] Test {testID}: setMultiCoils() passed")
+        time.sleep(0.5)
+
+    def setMultiHoldingRegsTest(self, setInput, readInput, expectedOutput, testID, pipeline=False):
+        """
+        Performs a unit test for setMultiHoldingRegs() method of the ModbusTcpClient object. 
+        It sets the holding registers list, retrieves the holding registers ranges, compares
+        the actual output with the expected output, and raises an assertion error if they 
+        do not match.
+        Args:
+            setInput (int, list): The first argument representing addressIdx and valList
+            readInput (list): The second argument representing the (addressIdx, offset) ranges.
+            expectedOutput (list): The third argument representing the expected output.
+            testID (int): The fourth argument representing the ID tagged to this test run.
+            pipeline (bool): Send the requests with the client pipelined mode.
+        Returns:
+            None
+        Raises:
+            AssertionError: If actualOutput != expectedOutput
+        Examples:
+            >>> setMultiHoldingRegsTest((0, [0, 1, 1, 1]), [(0, 1), (1, 3)], [[0], [1, 1, 1]], 1)
+                [x] Test 1: setMultiHoldingRegs() passed
+        """
+        self.client.setPipelineMode(pipeline)
+        self.client.setMultiHoldingRegs(setInput[0], setInput[1])
+        actualOutput = self.client.getMultiHoldingRegs(readInput)
+        self.client.setPipelineMode(False)
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: setMultiHoldingRegs() failed"
+        print(f"[x] Test {testID}: setMultiHoldingRegs() passed")
+        time.sleep(0.5)
+
+    def connPoolTest(self, readInput, expectedOutput, testID):
+        """
+        Performs a unit test for the modbusConnPool object. It reads the coil bits from 
+        the online PLC with the pool client, reads from an offline PLC (closed port) and 
+        raises an assertion error if the online read result doesn't match the expected 
+        output or the offline read doesn't fail fast.
+        Args:
+            readInput (int, int): The first argument representing addressIdx and offset.
+            expectedOutput (list): The second argument representing the expected output.
+            testID (int): The third argument representing the ID tagged to this test run.
+        Returns:
+            None
+        Raises:
+            AssertionError: If actualOutput != expectedOutput or the offline read is slow.
+        Examples:
+            >>> connPoolTest((0, 4), [1, 1, 0, 0], 1)
+                [x] Test 1: modbusConnPool() passed
+        """
+        connPool = modbusTcpCom.modbusConnPool(reqTO=0.5)
+        actualOutput = connPool.getClient('127.0.0.1', 502).getCoilsBits(readInput[0], readInput[1])
+        offlineClient = connPool.getClient('127.0.0.1', 1)
+        startT = time.time()
+        offlineOutput = offlineClient.getCoilsBits(readInput[0], readInput[1])
+        failTime = time.time() - startT
+        connPool.stop()
+        assert actualOutput == expectedOutput, f"[ ] Test {testID}: modbusConnPool() failed"
+        assert offlineOutput is None and failTime < 0.1, f"[ ] Test {testID}: modbusConnPool() failed"
+        print(f"[x] Test {testID}: modbusConnPool() passed")
+        time.sleep(0.5)
+
 #---------------------------------------------------------------------------
 # Define integration test methods for the following ModbusTCPCom plcDataHandler function:
 #   - updateState()
@@ -546,6 +650,34 @@ class testPLCDataHandler(modbusTcpCom.plcDataHandler):
         actualOutput = client.getHoldingRegs(readInput[0], readInput[1])
         assert actualOutput == expectedOutput, f"[ ] Test {testID}: updateHoldingRegs() failed"
         print(f"[x] Test {testID}: updateHoldingRegs() passed")
+
+    def ladderOutputNotDirtyTest(self, client, setInput, readInput, expectedOutput, testID):
+        """
+        Performs a unit test for updateState() method of the plcDataHandler object. It sets 
+        the holding registers (the auto update runs the ladder logic), checks the output 
+        coils and checks the ladder's output coils don't trigger another ladder logic run.
+        Args:
+            client (object): The first argument representing client stub.
+            setInput (int, list/tuple): The second argument representing addressIdx and register value list.
+            readInput (int, int): The third argument representing addressIdx and offset.
+            expectedOutput (list): The fourth argument representing the expected output coils.
+            testID (int): The fifth argument representing the ID tagged to this test run.
+        Returns:
+            None
+        Raises:
+            AssertionError: If actualOutput != expectedOutput or an update is still pending
+        Examples:
+            Assumption: 
+                - Auto update is enabled.
+                - Ladder Logic is to flip all the bits
+            >>> ladderOutputNotDirtyTest(client, (0, [1, 1, 0, 0]), (0, 4), [0, 0, 1, 1], 1)
+                [x] Test 1: updateState() output coils not dirty passed
+        """
+        self.updateHoldingRegs(setInput[0], setInput[1])
+        actualOutput = client.getCoilsBits(readInput[0], readInput[1])
+        assert actualOutput == expectedOutput and not self.hasPendingUpdate(), \
+            f"[ ] Test {testID}: updateState() output coils not dirty failed"
+        print(f"[x] Test {testID}: updateState() output coils not dirty passed")
     
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -631,6 +763,11 @@ def runTestCases(client, server, dataMgr):
     client.getHoldingRegsTest((0, 4), [0, 0, 1, 1], 2)
     client.setCoilBitsTest((1, 1), (0, 4), [1, 1, 0, 0], 3)
     client.setHoldingRegsTest((1, 1), (0, 4), [0, 1, 1, 1], 4)
+    client.setMultiCoilsTest((0, [0, 1, 1, 0]), [(0, 2), (2, 2)], [[0, 1], [1, 0]], 5)
+    client.setMultiCoilsTest((0, [1, 1, 0, 0]), [(2, 2), (0, 4)], [[0, 0], [1, 1, 0, 0]], 6, pipeline=True)
+    client.setMultiHoldingRegsTest((0, [0, 1, 1, 1]), [(0, 1), (1, 3)], [[0], [1, 1, 1]], 7)
+    client.setMultiHoldingRegsTest((0, [0, 1, 1, 1]), [(3, 1), (0, 4)], [[1], [0, 1, 1, 1]], 8, pipeline=True)
+    client.connPoolTest((0, 4), [1, 0, 0, 0], 9)
     print("\n(PLC Data Handler Unit Test Cases)")
     dataMgr.checkAllowReadTest('127.0.0.1', True, 1)
     dataMgr.checkAllowReadTest('192.168.25.1', False, 2)
@@ -644,9 +781,106 @@ def runTestCases(client, server, dataMgr):
     dataMgr.updateHoldingRegsTest(client.getClient(), (0, [0, 0, 1, 1]), (0, 4), [0, 0, 1, 1], 10)
     print("\n(Integration Test Cases)")   
     client.autoUpdateCoilTest((0, 1), (0, 4), [0, 1, 0, 0], 1) 
+    dataMgr.ladderOutputNotDirtyTest(client.getClient(), (0, [1, 1, 0, 0]), (0, 4), [0, 0, 1, 1], 2)
     client.closeClient()
     server.closeServer()
 
+#-----------------------------------------------------------------------------
+async def benchConnOpen(port):
+    try:
+        return await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), BENCH_TIME)
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+async def benchConnRun(conn, endT, latencies):
+    """ Benchmark client connection: keep sending the read holding registers request
+        and waiting the reply until the end time, record every request's latency.
+        Every read is bounded by the end time (the server may never serve the 
+        connection), return False if a reply was not received.
+    """
+    reader, writer = conn
+    tid = 0
+    result = True
+    try:
+        while time.monotonic() < endT:
+            tid = (tid + 1) & 0xFFFF
+            startT = time.monotonic()
+            writer.write(struct.pack('>HHHBBHH', tid, 0, 6, 1, 3, 0, 4))
+            readTO = endT - startT + BENCH_READ_GRACE
+            header = await asyncio.wait_for(reader.readexactly(7), readTO)
+            readTO = endT - time.monotonic() + BENCH_READ_GRACE
+            await asyncio.wait_for(reader.readexactly(struct.unpack('>HHHB', header)[2] - 1), readTO)
+            latencies.append(time.monotonic() - startT)
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        result = False
+    writer.close()
+    return result
+
+def benchClientRun(port, connNum, duration, resultQueue):
+    """ Benchmark clients (run in a sub process): open <connNum> client connections,
+        then run all of them concurrently for <duration> seconds, put the connected
+        clients number, the number of the clients failed to read a reply and the 
+        latency list in the queue.
+    """
+    latencies = []
+    async def runConns():
+        conns = [conn for conn in await asyncio.gather(*[benchConnOpen(port) for _ in range(connNum)]) if conn]
+        endT = time.monotonic() + duration
+        results = await asyncio.gather(*[benchConnRun(conn, endT, latencies) for conn in conns])
+        return (len(conns), results.count(False))
+    connected, readFail = asyncio.run(runConns())
+    resultQueue.put((connected, readFail, latencies))
+
+def runBenchmark(backend, port, connNum, duration=BENCH_TIME):
+    """ Run the <connNum> clients against the backend server, return (connected clients, 
+        connect failed clients, read failed clients, requests/sec, p99 latency ms).
+    """
+    dataMgr = modbusTcpCom.plcDataHandler()
+    server = modbusTcpCom.modbusTcpServer(hostIp='127.0.0.1', hostPort=port, dataHandler=dataMgr, 
+                                          backend=backend, maxConn=max(BENCH_CLIENTS))
+    dataMgr.initServerInfo(server.getServerInfo())
+    servThread = threading.Thread(target=server.startServer, daemon=True)
+    servThread.start()
+    startT = time.monotonic()
+    while not server.isRunning():
+        if time.monotonic() - startT > BENCH_TIME or not servThread.is_alive():
+            print("Error: the %s backend server can not start on port %s." % (backend, str(port)))
+            return (0, connNum, 0, 0, 0)
+        time.sleep(0.05)
+    resultQueue = multiprocessing.Queue()
+    client = multiprocessing.Process(target=benchClientRun, args=(port, connNum, duration, resultQueue))
+    client.start()
+    try:
+        # connect (BENCH_TIME) + run (duration) + last read (BENCH_READ_GRACE) + margin.
+        connected, readFail, latencies = resultQueue.get(timeout=BENCH_TIME+duration+BENCH_READ_GRACE+5)
+    except queue.Empty:
+        connected, readFail, latencies = 0, 0, []
+        client.terminate()
+    client.join()
+    server.stopServer()
+    servThread.join(3)
+    connFail = connNum - connected
+    if not latencies: return (connected, connFail, readFail, 0, 0)
+    latencies.sort()
+    p99 = latencies[min(len(latencies)-1, int(len(latencies)*0.99))]
+    return (connected, connFail, readFail, round(len(latencies)/duration), round(p99*1000, 2))
+
+def runBenchmarks():
+    print("========================== Modbus TCP Server Backends Benchmark ==========================")
+    print("%-8s %-8s %-10s %-9s %-9s %-12s %-10s" % ('backend', 'clients', 'connected', 'connFail', 
+                                                     'readFail', 'requests/s', 'p99(ms)'))
+    port = BENCH_PORT
+    for connNum in BENCH_CLIENTS:
+        for backend in modbusTcpCom.MB_BACKENDS:
+            connected, connFail, readFail, rate, p99 = runBenchmark(backend, port, connNum)
+            print("%-8s %-8s %-10s %-9s %-9s %-12s %-10s" % (backend, connNum, connected, connFail, 
+                                                             readFail, rate, p99))
+            port += 1
+
 if __name__ == '__main__':
-    client, server, dataMgr = createTestObjects()
-    runTestCases(client, server, dataMgr)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        # python modbusTcpComTest.py bench
+        runBenchmarks()
+    else:
+        client, server, dataMgr = createTestObjects()
+        runTestCases(client, server, dataMgr)
\ No newline at end of file
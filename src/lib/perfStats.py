@@ -0,0 +1,346 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        perfStats.py
+#
+# Purpose:     This module will provide the scan cycle scheduler and the timing
+#              instrumentation (latency histograms, request rate counters and a
+#              local stats query endpoint) used by the PLC/RTU simulators.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/12
+# Version:     v_0.1.1
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+    Four components will be provided in this module:
+
+    - latencyHistogram: A HDR style log-linear histogram to record the durations with
+        fixed relative precision: the value (us) smaller than 2^SUB_BITS has its own
+        bucket, bigger values are grouped in 2^(SUB_BITS-1) linear sub-buckets per power
+        of 2 (about 3% precision), so the percentiles of any duration from 1us to hours
+        are kept in a few hundred counters.
+
+    - rateCounter: A thread safe counter to calculate the events per second, such as
+        the Modbus/S7Comm requests served by the PLC/RTU.
+
+    - scanCycleScheduler: A fixed rate PLC/RTU scan cycle scheduler based on the
+        monotonic clock which counts the overruns and records the scan time, the cycle
+        start jitter and the scan stages durations in histograms.
+
+    - statsEndpoint: A UDP service thread bound to localhost to reply the stats
+        query 'GET;stats;{}' with 'REP;stats;<json stats>'.
+"""
+
+import time
+import json
+import math
+import threading
+from collections import OrderedDict
+
+import udpCom
+
+SUB_BITS = 5                # histogram precision bits.
+PERCENTILES = (50, 90, 99, 99.9)
+SCAN_STAGES = ('input', 'logic', 'output')  # PLC scan cycle stages in execution order.
+STATS_HOST = '127.0.0.1'    # the stats endpoint only accepts local query.
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class latencyHistogram(object):
+    """ HDR style log-linear latency histogram, thread safe. The durations are added
+        in seconds, recorded in us and reported in ms.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = []
+            self.count = 0
+            self.total = 0.0
+            self.totalSq = 0.0
+            self.minVal = self.maxVal = None
+
+    @staticmethod
+    def _getIndex(val):
+        if val < (1 << SUB_BITS): return val
+        shift = val.bit_length() - SUB_BITS
+        return (shift << (SUB_BITS - 1)) + (val >> shift)
+
+    @staticmethod
+    def _getBucketMax(idx):
+        """ Return the highest value (us) recorded in the bucket."""
+        if idx < (1 << SUB_BITS): return idx
+        shift = (idx >> (SUB_BITS - 1)) - 1
+        return ((idx - (shift << (SUB_BITS - 1)) + 1) << shift) - 1
+
+#-----------------------------------------------------------------------------
+    def add(self, duration):
+        """ Record the duration (sec), the negative value is recorded as 0."""
+        val = max(0, int(duration * 1e6))
+        idx = self._getIndex(val)
+        with self.lock:
+            if idx >= len(self.counts): self.counts.extend([0] * (idx + 1 - len(self.counts)))
+            self.counts[idx] += 1
+            self.count += 1
+            self.total += val
+            self.totalSq += val * val
+            self.minVal = val if self.minVal is None else min(self.minVal, val)
+            self.maxVal = val if self.maxVal is None else max(self.maxVal, val)
+
+    def getPercentile(self, percent):
+        """ Return the value (ms) which the percent of the records are not bigger than."""
+        with self.lock:
+            if not self.count: return 0.0
+            target = max(1, int(math.ceil(self.count * percent / 100.0)))
+            crtCount = 0
+            for idx, num in enumerate(self.counts):
+                crtCount += num
+                if crtCount >= target:
+                    return min(self._getBucketMax(idx), self.maxVal) / 1000.0
+            return self.maxVal / 1000.0
+
+    def getStats(self):
+        """ Return {'count', 'min', 'max', 'avg', 'std', 'p50', 'p90', 'p99', 'p99.9'}
+            time values in ms.
+        """
+        stats = OrderedDict([('count', self.count), ('min', 0.0), ('max', 0.0), ('avg', 0.0), ('std', 0.0)])
+        if self.count:
+            with self.lock:
+                avg = self.total / self.count
+                std = math.sqrt(max(0.0, self.totalSq / self.count - avg * avg))
+                stats.update({'min': self.minVal / 1000.0, 'max': self.maxVal / 1000.0,
+                              'avg': round(avg / 1000.0, 3), 'std': round(std / 1000.0, 3)})
+        for percent in PERCENTILES:
+            stats['p%s' % str(percent).replace('.0', '')] = self.getPercentile(percent)
+        return stats
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class rateCounter(object):
+    """ Thread safe events counter, the rate is the events per second in the last
+        finished measurement window (at least minWindow seconds).
+    """
+    def __init__(self, minWindow=1):
+        self.lock = threading.Lock()
+        self.minWindow = minWindow
+        self.total = 0
+        self.rate = 0.0
+        self.windowT = time.monotonic()
+        self.windowTotal = 0
+
+    def inc(self, num=1):
+        with self.lock:
+            self.total += num
+
+    def getRate(self):
+        """ Return the events per second."""
+        now = time.monotonic()
+        with self.lock:
+            if now - self.windowT >= self.minWindow:
+                self.rate = (self.total - self.windowTotal) / (now - self.windowT)
+                self.windowT, self.windowTotal = now, self.total
+            return self.rate
+
+    def getStats(self):
+        return {'total': self.total, 'rate': round(self.getRate(), 2)}
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class scanCycleScheduler(object):
+    """ Fixed rate PLC/RTU scan cycle scheduler. The cycle N starts at startT + N*period
+        of the monotonic clock, so the scan rate doesn't drift with the scan time.
+        A scan finished after the next cycle start is an overrun, the missed cycle
+        starts are skipped (not run in a burst) to keep the cycles phase aligned.
+        Usage:
+            scheduler = scanCycleScheduler(0.1)
+            while True:
+                scheduler.waitCycle()
+                ... read inputs
+                scheduler.markStage('input')
+                ... run logic / write outputs, mark the stages
+                scheduler.endCycle()
+    """
+    def __init__(self, period, stages=SCAN_STAGES):
+        self.period = float(period)
+        if self.period <= 0: raise ValueError("Scan cycle period must be bigger than 0.")
+        self.stages = stages
+        self.reset()
+
+    def reset(self):
+        """ Restart the cycle phase from now and clear the statistics."""
+        self.realign()
+        self.cycleStartT = None     # monotonic time the current cycle started.
+        self.stageT = None
+        self.overrunCount = 0
+        self.skipCount = 0          # cycle starts skipped by the overruns.
+        self.jitterHist = latencyHistogram()    # cycle start delay to the scheduled time.
+        self.scanHist = latencyHistogram()      # scan (execution) time.
+        self.stageHists = OrderedDict((stage, latencyHistogram()) for stage in self.stages)
+
+    def realign(self):
+        """ Restart the cycle phase from now and keep the statistics (used after the
+            scan loop was paused).
+        """
+        self.startT = time.monotonic()
+        self.cycleIdx = 0           # index of the next cycle to run.
+
+    def getCycleTime(self, cycleIdx):
+        return self.startT + cycleIdx * self.period
+
+#-----------------------------------------------------------------------------
+    def getNextCycleTime(self):
+        """ Return the monotonic time the next cycle is scheduled to start."""
+        return self.getCycleTime(self.cycleIdx)
+
+    def waitCycle(self):
+        """ Sleep until the next cycle start, return the cycle index."""
+        waitT = self.getNextCycleTime() - time.monotonic()
+        if waitT > 0: time.sleep(waitT)
+        return self.startCycle()
+
+    def startCycle(self):
+        """ Start the scheduled cycle now (used by the caller who runs several 
+            schedulers in one loop and does the waiting itself), return the cycle index.
+        """
+        self.cycleStartT = self.stageT = time.monotonic()
+        self.jitterHist.add(self.cycleStartT - self.getNextCycleTime())
+        return self.cycleIdx
+
+    def markStage(self, stage):
+        """ Record the time used by the stage since the last mark (or cycle start)."""
+        now = time.monotonic()
+        if stage in self.stageHists.keys() and self.stageT is not None:
+            self.stageHists[stage].add(now - self.stageT)
+        self.stageT = now
+
+    def endCycle(self):
+        """ Finish the current cycle and schedule the next one, return True if the
+            scan overran the cycle.
+        """
+        now = time.monotonic()
+        if self.cycleStartT is not None: self.scanHist.add(now - self.cycleStartT)
+        self.cycleIdx += 1
+        overrun = now > self.getCycleTime(self.cycleIdx)
+        if overrun:
+            self.overrunCount += 1
+            # skip to the first cycle start which is not passed.
+            nextIdx = int(math.ceil((now - self.startT) / self.period))
+            self.skipCount += nextIdx - self.cycleIdx
+            self.cycleIdx = nextIdx
+        self.cycleStartT = self.stageT = None
+        return overrun
+
+#-----------------------------------------------------------------------------
+    def getStats(self):
+        """ Return the scan cycle statistics dict, time values are in ms."""
+        return OrderedDict([
+            ('period', round(self.period*1000, 3)),
+            ('cycles', self.scanHist.count),
+            ('overruns', self.overrunCount),
+            ('skipped', self.skipCount),
+            ('scanTime', self.scanHist.getStats()),
+            ('jitter', self.jitterHist.getStats()),
+            ('stages', OrderedDict((stage, hist.getStats()) for stage, hist in self.stageHists.items()))
+        ])
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class statsEndpoint(threading.Thread):
+    """ Local UDP stats query service thread, reply 'GET;stats;{}' with the JSON
+        string of the statsFun() result.
+    """
+    def __init__(self, port, statsFun, host=STATS_HOST):
+        threading.Thread.__init__(self)
+        self.port = port
+        self.statsFun = statsFun
+        self.server = udpCom.udpServer(None, port, host=host)
+        self.daemon = True
+
+    def _msgHandler(self, msg):
+        try:
+            reqKey, reqType, _ = msg.decode('UTF-8').split(';', 2)
+        except Exception:
+            return None
+        if reqKey.strip() != 'GET' or reqType.strip() != 'stats': return None
+        try:
+            statsStr = json.dumps(self.statsFun())
+        except Exception as err:
+            statsStr = json.dumps({'error': str(err)})
+        return ';'.join(('REP', 'stats', statsStr))
+
+    def run(self):
+        self.server.serverStart(handler=self._msgHandler)
+
+    def stop(self):
+        self.server.serverStop()
+        # send a message to unblock the server receive.
+        endClient = udpCom.udpClient((STATS_HOST, self.port))
+        endClient.disconnect()
+
+#-----------------------------------------------------------------------------
+def queryStats(port, host=STATS_HOST):
+    """ Query the stats endpoint, return the stats dict or None if no response."""
+    client = udpCom.udpClient((host, port))
+    resp = client.sendMsg('GET;stats;{}', resp=True)
+    client.disconnect()
+    if not resp: return None
+    try:
+        return json.loads(resp.decode('UTF-8').split(';', 2)[2])
+    except Exception as err:
+        print("queryStats(): Invalid response: %s" % str(err))
+        return None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    tCount = 0
+    print("1. Latency histogram percentiles:\n----")
+    hist = latencyHistogram()
+    for i in range(1, 1001): hist.add(i / 1e4)    # 0.1ms ... 100ms
+    stats = hist.getStats()
+    tPass = stats['count'] == 1000 and stats['min'] == 0.1 and stats['max'] == 100.0
+    # the percentile is the bucket's highest value: within the precision.
+    tPass = tPass and abs(stats['p50'] - 50) / 50 < 0.07 and abs(stats['p99'] - 99) / 99 < 0.07
+    tPass = tPass and len(hist.counts) < 300
+    print(dict(stats))
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("2. Scan cycle scheduler overrun:\n----")
+    scheduler = scanCycleScheduler(0.05)
+    startT = time.monotonic()
+    for i in range(10):
+        scheduler.waitCycle()
+        scheduler.markStage('input')
+        if i == 3: time.sleep(0.12)
+        scheduler.markStage('logic')
+        scheduler.endCycle()
+    spendT = time.monotonic() - startT
+    stats = scheduler.getStats()
+    tPass = stats['cycles'] == 10 and stats['overruns'] == 1 and stats['skipped'] == 2
+    tPass = tPass and 0.5 < spendT < 0.6 and stats['stages']['logic']['max'] >= 120
+    print("Time: %s, overruns: %s, skipped: %s" % (spendT, stats['overruns'], stats['skipped']))
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("3. Stats endpoint query:\n----")
+    counter = rateCounter(minWindow=0.1)
+    counter.inc(5)
+    time.sleep(0.1)
+    endpoint = statsEndpoint(3099, lambda: {'requests': counter.getStats()})
+    endpoint.start()
+    result = queryStats(3099)
+    endpoint.stop()
+    tPass = result is not None and result['requests']['total'] == 5 and result['requests']['rate'] > 0
+    print(result)
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+    print(" => All test finished: %s/3" % str(tCount))
+
+#-----------------------------------------------------------------------------
+if __name__ == '__main__':
+    testCase()
@@ -36,40 +36,79 @@ from collections import OrderedDict
 import Log  # the module need to work with the lib Log module
 import udpCom
 import modbusTcpCom
+import rwDataCodec
+import rwSnapshot
+import perfStats
 
 RECON_INT = 30 # reconnection time interval default set 30 sec
 DEF_RW_PORT = 3001  # default realworld UDP connection port
 DEF_MB_PORT = 502   # default modbus port.
+SUB_LEASE = 6       # realworld state change subscription lease seconds.
+OVERRUN_LOG_INT = 10    # min seconds interval between two scan cycle overrun warnings.
+STATS_LOG_INT = 60      # seconds interval to dump the performance stats to the log.
+RECON_WAIT = 2          # seconds to wait between two realworld reconnection checks.
 
 # Define all the module local untility functions here:
 #-----------------------------------------------------------------------------
 def parseIncomeMsg(msg):
     """ parse the income realworld emulator's message to tuple with 3 element: 
-        request key, type and jsonString
+        request key, type and jsonString (the binary payload is kept as bytes).
         Args: msg (str): example: 'GET;dataType;{"user":"<username>"}'
     """
-    req = msg.decode('UTF-8') if not isinstance(msg, str) else msg
+    req = msg.encode('UTF-8') if isinstance(msg, str) else msg
     reqKey = reqType = reqJsonStr= None
     try:
-        reqKey, reqType, reqJsonStr = req.split(';', 2)
+        reqKey, reqType, reqJsonStr = req.split(b';', 2)
+        reqKey, reqType = reqKey.decode('UTF-8'), reqType.decode('UTF-8')
+        if not rwDataCodec.isBinData(reqJsonStr): reqJsonStr = reqJsonStr.decode('UTF-8')
     except Exception as err:
         Log.error('parseIncomeMsg(): The income message format is incorrect.')
         Log.exception(err)
         return (reqKey, reqType, reqJsonStr)
     return (reqKey.strip(), reqType.strip(), reqJsonStr)
 
+def parseCorrID(msg):
+    """ Get the correlation ID from the message key, return None if the message 
+        doesn't carry it.
+        Args: msg (bytes): example: b'REP#<corrID>;dataType;{"user":"<username>"}'
+    """
+    key = msg.split(b';', 1)[0]
+    return key.partition(b'#')[2].decode('UTF-8') or None
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class RealWorldConnector(object):
     """ A UDP connector(client) used to connect to the realword emulator app 
-        to fetech the realworld electrical signal changes or sensor value.
+        to fetech the realworld electrical signal changes or sensor value. Every 
+        query is sent as '<key>#<corrID>;<type>;<json>' so the reply can be matched 
+        with its query and several queries can be outstanding at the same time.
+        If the realworld emulator accepts the binary format in the login reply, the 
+        json payload is replaced by the rwDataCodec binary payload.
+        The connector can also subscribe the realworld state changes, then the emulator
+        pushes 'PUB;<type>;{"seq": <n>, "full": <bool>, "data": {...}}' after every 
+        simulation tick and the connector keeps the latest state locally.
+        If the PLC runs on the same host as the emulator, the connector can read the
+        state from the emulator's shared memory snapshot (rwSnapshot) without any query.
     """
 
-    def __init__(self, parent, address) -> None:
+    def __init__(self, parent, address, sockProfile=None, shmName=None) -> None:
         self.parent = parent
         self.address = address
         self.realwordInfo= { 'ip': address[0], 'port': address[1]}
-        self.rwConnector = udpCom.udpClient((self.realwordInfo['ip'], self.realwordInfo['port']))
+        self.rwConnector = udpCom.udpPipeClient((self.realwordInfo['ip'], self.realwordInfo['port']), 
+                                                parseCorrID, pushHandler=self._pushHandler,
+                                                sockProfile=sockProfile)
+        self.dropMonitor = udpCom.sockDropMonitor(logFun=Log.warning)
+        self.corrID = 0
+        self.subInfo = None     # state change subscription info.
+        self.subRetryT = 0
+        self.subLock = threading.Lock()
+        self.shmName = shmName  # realworld shared memory snapshot name (None: not used).
+        self.snapshot = None if not shmName else rwSnapshot.snapshotReader(shmName, touchFun=self._touchRW, 
+                                                                           retryInt=RECON_INT, logFun=Log.info)
+        # realworld query round trip time.
+        self.rttHists = {'GET': perfStats.latencyHistogram(), 'POST': perfStats.latencyHistogram()}
+        self.wireFmt = rwDataCodec.FMT_JSON
         self.recoonectCount = RECON_INT
         # Test login the real world emulator
         self.plcID = self.parent.getPlcID()
@@ -81,10 +120,14 @@ class RealWorldConnector(object):
     def _loginRealWord(self, plcID=None):
         """ Try to connect to the realworld emulator with the plc ID."""
         Log.info("Try to connnect to the realword [%s]..." %str(self.address))
-        rqstKey, rqstType, rqstDict = 'GET', 'login', {'plcID': plcID}
+        rqstKey, rqstType = 'GET', 'login'
+        rqstDict = {'plcID': plcID, 'formats': [rwDataCodec.FMT_BIN, rwDataCodec.FMT_JSON]}
+        self.wireFmt = rwDataCodec.FMT_JSON
         result = self._queryToRW(rqstKey, rqstType, rqstDict)
         if result:
-            Log.info("Realworld emulator online, state: ready")
+            if isinstance(result[2], dict) and result[2].get('format') == rwDataCodec.FMT_BIN:
+                self.wireFmt = rwDataCodec.FMT_BIN
+            Log.info("Realworld emulator online, state: ready, format: %s" % self.wireFmt)
             return True
         return False
 
@@ -112,16 +155,140 @@ class RealWorldConnector(object):
         return None
 
 #-----------------------------------------------------------------------------
-    def changeRWCoil(self, rqstType='signals', coilDict={}):
-        """ Send the current plc coils state to the realwrold emulator."""
+    def changeRWCoil(self, rqstType='signals', coilDict={}, wait=True):
+        """ Send the current plc coils state to the realwrold emulator. If wait is False,
+            return without waiting the reply so the next input fetch request can be 
+            sent in the same round-trip window.
+        """
         rqstKey = 'POST'
         print(coilDict)
         if isinstance(coilDict, dict):
-            return self._queryToRW(rqstKey, rqstType, coilDict)
+            if wait: return self._queryToRW(rqstKey, rqstType, coilDict)
+            self._queryToRWAsync(rqstKey, rqstType, coilDict)
+            return None
         else:
             Log.warning("changeRWCoil(): passed in input parm needs to be a dict() type.get %s" %str(coilDict))
             return None
 
+#-----------------------------------------------------------------------------
+    def subscribeRW(self, rqstType, keys):
+        """ Subscribe (or renew) the realworld emulator to push the rqstType state 
+            changes of the keys, return True if the emulator accepted.
+        """
+        keys = list(keys)
+        rqstDict = {'type': rqstType, 'keys': keys, 'lease': SUB_LEASE}
+        result = self._queryToRW('GET', 'subscribe', rqstDict)
+        if result and isinstance(result[2], dict) and result[2].get('result') == 'success':
+            lease = float(result[2].get('lease', SUB_LEASE))
+            with self.subLock:
+                if self.subInfo is None or self.subInfo['type'] != rqstType or self.subInfo['keys'] != keys:
+                    self.subInfo = {'type': rqstType, 'keys': keys, 'seq': None, 'state': OrderedDict()}
+                self.subInfo['renewT'] = time.time() + lease/2
+            return True
+        Log.warning("subscribeRW(): The realworld emulator doesn't accept the subscription.")
+        self.subRetryT = time.time() + RECON_INT
+        return False
+
+    def unsubscribeRW(self):
+        if self.subInfo and self.realworldOnline:
+            self._queryToRW('GET', 'unsubscribe', {'type': self.subInfo['type']}, response=False)
+        self.subInfo = None
+
+#-----------------------------------------------------------------------------
+    def _pushHandler(self, msg):
+        """ Apply the state pushed by the realworld emulator to the local state (called
+            in the UDP receiver thread).
+        """
+        k, t, data = parseIncomeMsg(msg)
+        if k != 'PUB': return
+        pushDict = json.loads(data)
+        with self.subLock:
+            subInfo = self.subInfo
+            if subInfo is None or subInfo['type'] != t: return
+            if pushDict['full']:
+                subInfo['state'] = OrderedDict(pushDict['data'])
+            elif subInfo['seq'] is not None and pushDict['seq'] == subInfo['seq'] + 1:
+                for key, changes in pushDict['data'].items():
+                    for idx, val in changes: subInfo['state'][key][idx] = val
+            else:
+                # push lost, fetch the state by GET until the next keyframe arrive.
+                subInfo['seq'] = None
+                return
+            subInfo['seq'] = pushDict['seq']
+
+#-----------------------------------------------------------------------------
+    def getPushedState(self, rqstType, keys):
+        """ Get the latest state pushed by the realworld emulator and renew the 
+            subscription if needed.
+            Returns:
+                tuple: ('PUB', type, stateDict) or None if not subscribed or the state
+                    is not synchronized (caller needs to fetch the state by GET).
+        """
+        subInfo = self.subInfo
+        if subInfo is None or subInfo['type'] != rqstType:
+            if time.time() > self.subRetryT: self.subscribeRW(rqstType, keys)
+            return None
+        if time.time() > subInfo['renewT']: self.subscribeRW(rqstType, keys)
+        with self.subLock:
+            if subInfo['seq'] is None: return None
+            return ('PUB', rqstType, OrderedDict((key, list(val)) for key, val in subInfo['state'].items()))
+
+#-----------------------------------------------------------------------------
+    def getSnapshotState(self, rqstType, keys):
+        """ Get the state from the realworld emulator's shared memory snapshot.
+            Returns:
+                tuple: ('SHM', type, stateDict) or None if the snapshot is not available
+                    or stale (caller needs to fetch the state by UDP).
+        """
+        if self.snapshot is None: return None
+        state = self.snapshot.readState(rqstType, keys)
+        return None if state is None else ('SHM', rqstType, state)
+
+    def _touchRW(self, rqstType, keys):
+        # the emulator marks the PLC online when it gets the PLC's query.
+        self._queryToRW('GET', rqstType, dict.fromkeys(keys), response=False)
+
+    def detachSnapshot(self):
+        if self.snapshot: self.snapshot.close()
+
+#-----------------------------------------------------------------------------
+    def _sendQuery(self, rqstKey, rqstType, rqstDict, callback=None):
+        """ Send the query with a new correlation ID and return the reply future."""
+        self.corrID += 1
+        corrID = str(self.corrID)
+        payload = None
+        if self.wireFmt == rwDataCodec.FMT_BIN and rwDataCodec.isBinType(rqstType):
+            try:
+                payload = rwDataCodec.encodeData(rqstType, rqstDict)
+            except Exception as err:
+                Log.warning("_sendQuery(): use json format, binary encode failed: %s" % str(err))
+        if payload is None: payload = json.dumps(rqstDict).encode('UTF-8')
+        rqst = b';'.join(('#'.join((rqstKey, corrID)).encode('UTF-8'), rqstType.encode('UTF-8'), payload))
+        return self.rwConnector.sendRequest(rqst, corrID, callback=callback)
+
+#-----------------------------------------------------------------------------
+    def _parseReply(self, resp, rqstType):
+        """ Parse the realworld emulator's reply.
+            Returns:
+                tuple: (key, type, result) or None if lose connection.
+        """
+        if not resp:
+            Log.warning("Lost connection to the server.")
+            self.realworldOnline = False
+            return None
+        #gv.gDebugPrint('===> resp:%s' %str(resp), logType=gv.LOG_INFO)
+        k, t, data = parseIncomeMsg(resp)
+        if k: k = k.partition('#')[0]
+        if k != 'REP': Log.warning('The msg reply key %s is invalid' % k)
+        if t != rqstType: Log.warning('The reply type doesnt match.%s' %str((rqstType, t)))
+        try:
+            result = rwDataCodec.decodeData(t, data) if rwDataCodec.isBinData(data) else json.loads(data)
+            self.lastUpdateT = datetime.now()
+        except Exception as err:
+            Log.exception('Exception: %s' %str(err))
+            return None
+        return (k, t, result)
+
 #-----------------------------------------------------------------------------
     def _queryToRW(self, rqstKey, rqstType, rqstDict, response=True):
         """ Query message send to realword emulator app.
@@ -129,37 +296,54 @@ class RealWorldConnector(object):
                 rqstKey (str): request key (GET/POST/REP)
                 rqstType (str): request type string.
                 rqstDict (doct): request detail dictionary.
-                dataOnly (bool, optional): flag to indentify whether only return the 
-                    data. Defaults to True. return (responseKey, responseType, responseJson) if set
-                    to False.
+                response (bool): flag to identify whether wait the response.
             Returns:
                 tuple: (key, type, result) or None if lose connection.
         """
-        k = t = result = None
         if rqstKey and rqstType and rqstDict:
-            rqst = ';'.join((rqstKey, rqstType, json.dumps(rqstDict)))
             if self.rwConnector:
-                resp = self.rwConnector.sendMsg(rqst, resp=response)
-                if resp:
-                    #gv.gDebugPrint('===> resp:%s' %str(resp), logType=gv.LOG_INFO)
-                    k, t, data = parseIncomeMsg(resp)
-                    if k != 'REP': Log.warning('The msg reply key %s is invalid' % k)
-                    if t != rqstType: Log.warning('The reply type doesnt match.%s' %str((rqstType, t)))
-                    try:
-                        result = json.loads(data)
-                        self.lastUpdateT = datetime.now()
-                    except Exception as err:
-                        Log.exception('Exception: %s' %str(err))
-                        return None
-                else:
-                    Log.warning("Lost connection to the server.")
-                    self.realworldOnline = False
-                    return None
+                startT = time.monotonic()
+                future = self._sendQuery(rqstKey, rqstType, rqstDict)
+                if not response: return (None, None, None)
+                resp = future.result()
+                if resp and rqstKey in self.rttHists: self.rttHists[rqstKey].add(time.monotonic() - startT)
+                return self._parseReply(resp, rqstType)
         else:
             Log.error("queryBE: input missing: %s" %str(rqstKey, rqstType, rqstDict))
-        return (k, t, result)
+        return (None, None, None)
+
+#-----------------------------------------------------------------------------
+    def _queryToRWAsync(self, rqstKey, rqstType, rqstDict, callback=None):
+        """ Send the query without waiting the reply, callback(result) will be called 
+            with the parsed reply (key, type, result) or None when the reply arrived 
+            or timeout.
+        """
+        startT = time.monotonic()
+        def replyHandler(resp):
+            if resp and rqstKey in self.rttHists: self.rttHists[rqstKey].add(time.monotonic() - startT)
+            result = self._parseReply(resp, rqstType)
+            if callback: callback(result)
+        if rqstKey and rqstType and rqstDict and self.rwConnector:
+            return self._sendQuery(rqstKey, rqstType, rqstDict, callback=replyHandler)
+        Log.error("queryBE: input missing: %s" %str((rqstKey, rqstType, rqstDict)))
+        return None
 
+#-----------------------------------------------------------------------------
+    def getRttStats(self):
+        """ Return the realworld GET/POST query round trip time stats (ms)."""
+        return OrderedDict((key, hist.getStats()) for key, hist in self.rttHists.items())
+
+#-----------------------------------------------------------------------------
+    def checkSockDrops(self, now):
+        """ Log the datagrams dropped by the kernel because the UDP socket receive 
+            buffer is full (check the UDP_PROFILE config if it keeps increasing).
+        """
+        self.dropMonitor.check(self.rwConnector, now)
+
+#-----------------------------------------------------------------------------
     def stop(self):
+        self.unsubscribeRW()
+        self.detachSnapshot()
         self.rwConnector.disconnect()
 
 #-----------------------------------------------------------------------------
@@ -167,18 +351,35 @@ class RealWorldConnector(object):
 class modBusService(threading.Thread):
     """ A sub-threading service modbus service class hold one datahandler, one 
         databank and one Modbus server to handler the SCADA system's modbus request.
+        If the ladderHandler is a modbusTcpCom.unitDataHandler, the service can be 
+        shared by several PLCs (one unit ID per PLC). If reqQueue > 0, the requests are
+        put in the bounded priority queues (modbusTcpCom.priorityDataHandler), the 
+        priorityIpList (HMI) sources' requests are executed first.
     """
-    def __init__(self, parent, threadID, ladderHandler, hostIP='localhost', hostPort=DEF_MB_PORT):
+    def __init__(self, parent, threadID, ladderHandler, hostIP='localhost', hostPort=DEF_MB_PORT,
+                 backend='thread', maxConn=modbusTcpCom.DEF_MAX_CONN, queueDepth=modbusTcpCom.DEF_QUEUE_DEPTH,
+                 reqQueue=0, reqAge=modbusTcpCom.DEF_REQ_AGE, priorityIpList=None):
         threading.Thread.__init__(self)
         self.parent = parent
         self.threadID = threadID
         self.hostIp = hostIP
         self.hostPort = hostPort
         self.ladderHandler = ladderHandler
+        self.reqQueue = None
+        dataHandler = self.ladderHandler
+        if reqQueue > 0:
+            if backend == 'asyncio':
+                Log.warning("The asyncio modbus backend executes the requests in order, the request queue is not used.")
+            else:
+                self.reqQueue = modbusTcpCom.priorityDataHandler(self.ladderHandler, priorityIpList=priorityIpList,
+                                                                 maxDepth=reqQueue, maxAge=reqAge)
+                dataHandler = self.reqQueue
         # Init the modbus TCP server.
         self.server = modbusTcpCom.modbusTcpServer(hostIp=self.hostIp, 
                                                    hostPort=self.hostPort, 
-                                                   dataHandler=self.ladderHandler)
+                                                   dataHandler=dataHandler,
+                                                   backend=backend, maxConn=maxConn, 
+                                                   queueDepth=queueDepth)
         # load the server info into the 
         serverInfo = self.server.getServerInfo()
         self.ladderHandler.initServerInfo(serverInfo)
@@ -191,6 +392,16 @@ class modBusService(threading.Thread):
     def getThreadID(self):
         return self.threadID 
 
+    def getQueueStats(self):
+        """ Return the request queues stats or None if the request queue is not used."""
+        return self.reqQueue.getQueueStats() if self.reqQueue else None
+
+    def addUnit(self, unitID, dataHandler):
+        """ Add a PLC's data handler to the shared service under the unit ID."""
+        if not isinstance(self.ladderHandler, modbusTcpCom.unitDataHandler):
+            raise ValueError("The modbus service is not shared by unit ID.")
+        self.ladderHandler.addUnitHandler(unitID, dataHandler)
+
 #-----------------------------------------------------------------------------
     def run(self):
         """ Start the udp server's main message handling loop."""
@@ -201,6 +412,7 @@ class modBusService(threading.Thread):
 
     def stop(self):
         self.server.stopServer()
+        if self.reqQueue: self.reqQueue.stop()
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -215,10 +427,23 @@ class plcSimuInterface(object):
     def __init__(self, parent, plcID, addressInfoDict, ladderObj, updateInt=0.5):
         self.parent = parent
         self.id = plcID
-        self.updateInt = updateInt
+        self.updateInt = updateInt  # scan cycle time (sec).
+        self.scheduler = perfStats.scanCycleScheduler(self.updateInt)
+        self.overrunLogT = 0
+        self.overrunLogged = 0
+        # performance instrumentation: ladder logic execution time and Modbus requests.
+        self.ladderHist = perfStats.latencyHistogram()
+        self.mbReqCounter = perfStats.rateCounter()
+        self.statsLogT = time.time()
         self.realworldAddr = addressInfoDict['realworld'] if 'realworld' in addressInfoDict.keys() else ('127.0.0.1', DEF_RW_PORT)
         self.allowReadAddr = addressInfoDict['allowread'] if 'allowread' in addressInfoDict.keys() else None
         self.allowWriteAddr = addressInfoDict['allowwrite'] if 'allowwrite' in addressInfoDict.keys() else None
+        # subscribe the realworld state changes instead of polling every clock cycle.
+        self.subscribeFlg = addressInfoDict['subscribe'] if 'subscribe' in addressInfoDict.keys() else False
+        # realworld connector UDP socket options profile name in udpCom.SOCK_PROFILES.
+        self.udpProfile = addressInfoDict['udpprofile'] if 'udpprofile' in addressInfoDict.keys() else None
+        # realworld shared memory snapshot name, used if the emulator runs on the same host.
+        self.shmName = addressInfoDict['shmname'] if 'shmname' in addressInfoDict.keys() else None
         self.autoUpdate = True
         # input sensors state from real world emulator:
         self.regsAddrs = (0, 1) 
@@ -235,13 +460,49 @@ class plcSimuInterface(object):
                                                    allowWipList=self.allowWriteAddr)
         self.dataMgr.addLadderLogic(ladderObj.getLadderName(), ladderObj)
         self.dataMgr.setAutoUpdate(self.autoUpdate)
+        self.dataMgr.setPerfHandlers(requestHandler=self.mbReqCounter.inc, 
+                                     ladderTimeHandler=self.ladderHist.add)
+        # ladder logic update after the clients' write: <0 run in the write request, 0: in
+        # the next scan cycle, >0: coalesce the writes and run at most once per interval.
+        self.ladderInt = addressInfoDict['ladderint'] if 'ladderint' in addressInfoDict.keys() else -1
+        self.rawList = addressInfoDict['rawlist'] if 'rawlist' in addressInfoDict.keys() else None
+        if self.ladderInt >= 0: self.dataMgr.setCoalesceUpdate(self.ladderInt, rawIpList=self.rawList)
+        # per source ip requests rate limit (requests/sec, 0: disable), the requests over 
+        # the limit are replied with the slave device busy exception.
+        self.rateLimit = addressInfoDict['ratelimit'] if 'ratelimit' in addressInfoDict.keys() else 0
+        if self.rateLimit > 0: self.dataMgr.setRateLimit(self.rateLimit)
 
         # Init the UDP connector to connect to the realworld and test the connection. 
-        self.rwConnector = RealWorldConnector(self, self.realworldAddr)
-        # Init the modbus TCP service
+        self.rwConnector = RealWorldConnector(self, self.realworldAddr, sockProfile=self.udpProfile,
+                                              shmName=self.shmName)
+        # Init the modbus TCP service, or join the service shared by several PLCs on
+        # the same port (the PLC is addressed by the unit ID).
         self.modBusAddr = addressInfoDict['hostaddress'] if 'hostaddress' in addressInfoDict.keys() else ('0.0.0.0', DEF_MB_PORT)
-        self.mbService = modBusService(self, 1, self.dataMgr, hostIP=self.modBusAddr[0], hostPort=self.modBusAddr[1])
-        self.mbService.start()
+        self.unitID = addressInfoDict['unitid'] if 'unitid' in addressInfoDict.keys() else None
+        self.mbShared = 'mbservice' in addressInfoDict.keys() and addressInfoDict['mbservice'] is not None
+        if self.mbShared:
+            self.mbService = addressInfoDict['mbservice']
+            self.mbService.addUnit(self.unitID, self.dataMgr)
+        else:
+            # modbus server backend: 'thread' (one thread per client) or 'asyncio'.
+            self.mbBackend = addressInfoDict['mbbackend'] if 'mbbackend' in addressInfoDict.keys() else 'thread'
+            self.mbMaxConn = addressInfoDict['maxconn'] if 'maxconn' in addressInfoDict.keys() else modbusTcpCom.DEF_MAX_CONN
+            self.mbQueueDepth = addressInfoDict['queuedepth'] if 'queuedepth' in addressInfoDict.keys() else modbusTcpCom.DEF_QUEUE_DEPTH
+            # bounded priority request queues (0: disable), the HMI (priority list, default
+            # the allow write list) requests first, the others are shed under flood.
+            self.reqQueue = addressInfoDict['reqqueue'] if 'reqqueue' in addressInfoDict.keys() else 0
+            self.reqAge = addressInfoDict['reqage'] if 'reqage' in addressInfoDict.keys() else modbusTcpCom.DEF_REQ_AGE
+            self.priorityList = addressInfoDict['prioritylist'] if 'prioritylist' in addressInfoDict.keys() and addressInfoDict['prioritylist'] else self.allowWriteAddr
+            self.mbService = modBusService(self, 1, self.dataMgr, hostIP=self.modBusAddr[0], hostPort=self.modBusAddr[1],
+                                           backend=self.mbBackend, maxConn=self.mbMaxConn, queueDepth=self.mbQueueDepth,
+                                           reqQueue=self.reqQueue, reqAge=self.reqAge, priorityIpList=self.priorityList)
+            self.mbService.start()
+        # Init the local stats query endpoint (port 0: disabled).
+        self.statsPort = addressInfoDict['statsport'] if 'statsport' in addressInfoDict.keys() else 0
+        self.statsEndpoint = None
+        if self.statsPort:
+            self.statsEndpoint = perfStats.statsEndpoint(self.statsPort, self.getPerfStats)
+            self.statsEndpoint.start()
         self.terminate = False
         Log.info('Finished init the PLC: %s' %str(self.id))
 
@@ -276,6 +537,12 @@ class plcSimuInterface(object):
 #-----------------------------------------------------------------------------
     def getRWInputInfo(self):
         """ Get sensors state from the real-world simulator. """
+        if self.shmName:
+            reuslt = self.rwConnector.getSnapshotState(self.regSRWfetchKey, self.regsStateRW.keys())
+            if reuslt: return reuslt
+        if self.subscribeFlg:
+            reuslt = self.rwConnector.getPushedState(self.regSRWfetchKey, self.regsStateRW.keys())
+            if reuslt: return reuslt
         rqstDict = {}
         for key in self.regsStateRW.keys():
             rqstDict[key] = None
@@ -284,30 +551,34 @@ class plcSimuInterface(object):
         return reuslt
         
 #-----------------------------------------------------------------------------
-    def changeRWSignalCoil(self):
+    def changeRWSignalCoil(self, wait=True):
         """ Set the signal state to the real-world simulator app. """
         result =  self.rwConnector.changeRWCoil(rqstType=self.coilsRWSetKey, 
-                                                coilDict= self.coilStateRW)
+                                                coilDict= self.coilStateRW, wait=wait)
         return result
     
 #-----------------------------------------------------------------------------
     def periodic(self, now):
-        """ Init all the PLC actions here and this function will be called periodicly 
-            by the program main loop.
+        """ Init all the PLC actions here and this function will be called every scan
+            cycle by the program main loop: input stage (fetch the realworld sensors 
+            state), logic stage (update the holding registers, the ladder logic will 
+            update the coils) and output stage (send the changed coils state).
         """
         sensorInfo = self.getRWInputInfo()
         if sensorInfo is None: return
         (_, _, result) = sensorInfo
-        time.sleep(0.2)
         for key in result.keys():
             self.regsStateRW[key] = result[key]
+        self.scheduler.markStage('input')
         # Update PLC holding registers.
         self.updateHoldingRegs()
-        time.sleep(0.2)
+        self.scheduler.markStage('logic')
         coilUpdated = self.updateCoilOutput()
-        # update the output coils state:
-        if coilUpdated: self.changeRWSignalCoil()
-        
+        # update the output coils state, don't wait the reply so the next cycle's input 
+        # fetch is pipelined with it.
+        if coilUpdated: self.changeRWSignalCoil(wait=False)
+        self.scheduler.markStage('output')
+
 #-----------------------------------------------------------------------------
     def updateHoldingRegs(self):
         holdingRegs = []
@@ -328,19 +599,76 @@ class plcSimuInterface(object):
             updatedFlg = True
         return updatedFlg
 #-----------------------------------------------------------------------------
+    def getScanStats(self):
+        """ Return the scan cycle statistics (check scanCycleScheduler.getStats())."""
+        return self.scheduler.getStats()
+
+    def getPerfStats(self):
+        """ Return the PLC performance stats: scan cycle and stages time, ladder logic
+            execution time, realworld query round trip time (ms), Modbus requests, the
+            denied/rate limited requests of the source IPs and the request queues.
+        """
+        return OrderedDict([
+            ('id', self.id),
+            ('scan', self.scheduler.getStats()),
+            ('ladder', self.ladderHist.getStats()),
+            ('rwRtt', self.rwConnector.getRttStats()),
+            ('modbus', self.mbReqCounter.getStats()),
+            ('filter', self.dataMgr.getFilterStats()),
+            ('queue', self.mbService.getQueueStats())
+        ])
+
+    def _dumpPerfStats(self, now):
+        """ Dump the performance stats to the log every STATS_LOG_INT seconds."""
+        if now - self.statsLogT < STATS_LOG_INT: return
+        self.statsLogT = now
+        Log.info("Performance stats: %s" % json.dumps(self.getPerfStats()))
+
+    def _checkOverrun(self, now):
+        """ Log the scan cycle overruns at most once every OVERRUN_LOG_INT seconds."""
+        overruns = self.scheduler.overrunCount - self.overrunLogged
+        if overruns <= 0 or now - self.overrunLogT < OVERRUN_LOG_INT: return
+        self.overrunLogT = now
+        self.overrunLogged = self.scheduler.overrunCount
+        stats = self.scheduler.getStats()
+        Log.warning("Scan cycle overrun %s times (total: %s, period: %sms, max scan time: %sms)."
+                    % (overruns, stats['overruns'], stats['period'], stats['scanTime']['max']))
+
+#-----------------------------------------------------------------------------
+    def runScanCycle(self):
+        """ Run one scan cycle now if the realworld emulator is online, otherwise try
+            to reconnect. (The caller runs several PLCs in one loop calls this function
+            at the returned time instead of calling run()).
+            Returns:
+                float: the monotonic time when this function needs to be called again.
+        """
+        if self.rwConnector.isRealWorldOnline():
+            self.scheduler.startCycle()
+            now = time.time()
+            self.periodic(now)
+            self.scheduler.endCycle()
+            self.rwConnector.checkSockDrops(now)
+            self._checkOverrun(now)
+            self._dumpPerfStats(now)
+            return self.scheduler.getNextCycleTime()
+        self.rwConnector.reConnectRW()
+        if self.rwConnector.isRealWorldOnline():
+            # restart the cycle phase after reconnected.
+            self.scheduler.realign()
+            return self.scheduler.getNextCycleTime()
+        return time.monotonic() + RECON_WAIT
+
     def run(self):
+        """ Run the PLC scan cycle at fixed rate (the updateInt) until stop."""
+        self.scheduler.reset()
         while not self.terminate:
-            now = time.time()
-            if self.rwConnector.isRealWorldOnline():
-                self.periodic(now)
-                time.sleep(0.6)
-            else:
-                self.rwConnector.reConnectRW()
-                time.sleep(2)
-        time.sleep(self.updateInt)
+            waitT = self.runScanCycle() - time.monotonic()
+            if waitT > 0: time.sleep(waitT)
 
 #-----------------------------------------------------------------------------
     def stop(self):
         self.terminate = True
-        self.mbService.stop()
+        if self.statsEndpoint: self.statsEndpoint.stop()
+        # the shared modbus service is stopped by its owner.
+        if not self.mbShared: self.mbService.stop()
         self.rwConnector.stop()
@@ -41,42 +41,71 @@ from collections import OrderedDict
 import Log # the module need to work with the lib Log module
 import udpCom
 import snap7Comm
+import rwDataCodec
+import rwSnapshot
+import perfStats
 from snap7Comm import BOOL_TYPE, INT_TYPE, REAL_TYPE
 
 RECON_INT = 30      # reconnection time interval default set 30 sec
 DEF_RW_PORT = 3001  # default realworld UDP connection port
 DEF_S7_PORT = 102   # default S7comm port.
+STATS_LOG_INT = 60  # seconds interval to dump the performance stats to the log.
+SCAN_STAGES = ('input', 'update')   # RTU scan cycle stages in execution order.
 
 
 # Define all the module local untility functions here:
 #-----------------------------------------------------------------------------
 def parseIncomeMsg(msg):
     """ parse the income realworld emulator's message to tuple with 3 element: 
-        request key, type and jsonString
+        request key, type and jsonString (the binary payload is kept as bytes).
         Args: msg (str): example: 'GET;dataType;{"user":"<username>"}'
     """
-    req = msg.decode('UTF-8') if not isinstance(msg, str) else msg
+    req = msg.encode('UTF-8') if isinstance(msg, str) else msg
     reqKey = reqType = reqJsonStr= None
     try:
-        reqKey, reqType, reqJsonStr = req.split(';', 2)
+        reqKey, reqType, reqJsonStr = req.split(b';', 2)
+        reqKey, reqType = reqKey.decode('UTF-8'), reqType.decode('UTF-8')
+        if not rwDataCodec.isBinData(reqJsonStr): reqJsonStr = reqJsonStr.decode('UTF-8')
     except Exception as err:
         Log.error('parseIncomeMsg(): The income message format is incorrect.')
         Log.exception(err)
         return (reqKey, reqType, reqJsonStr)
     return (reqKey.strip(), reqType.strip(), reqJsonStr)
 
+def parseCorrID(msg):
+    """ Get the correlation ID from the message key, return None if the message 
+        doesn't carry it.
+        Args: msg (bytes): example: b'REP#<corrID>;dataType;{"user":"<username>"}'
+    """
+    key = msg.split(b';', 1)[0]
+    return key.partition(b'#')[2].decode('UTF-8') or None
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class RealWorldConnector(object):
     """ A UDP connector(client) used to connect to the realword emulator app 
-        to fetech the realworld electrical signal changes or sensor value.
+        to fetech the realworld electrical signal changes or sensor value. Every 
+        query is sent as '<key>#<corrID>;<type>;<json>' so a late reply of a timeout
+        query will not be matched to the next query. The json payload is replaced by 
+        the rwDataCodec binary payload if the emulator accepts it in the login reply.
+        If the RTU runs on the same host as the emulator, the connector can read the
+        state from the emulator's shared memory snapshot (rwSnapshot) without any query.
     """
 
-    def __init__(self, parent, address) -> None:
+    def __init__(self, parent, address, sockProfile=None, shmName=None) -> None:
         self.parent = parent
         self.address = address
         self.realwordInfo = {'ip': address[0], 'port': address[1]}
-        self.rwConnector = udpCom.udpClient((self.realwordInfo['ip'], self.realwordInfo['port']))
+        self.rwConnector = udpCom.udpPipeClient((self.realwordInfo['ip'], self.realwordInfo['port']), 
+                                                parseCorrID, sockProfile=sockProfile)
+        self.dropMonitor = udpCom.sockDropMonitor(logFun=Log.warning)
+        self.corrID = 0
+        self.shmName = shmName  # realworld shared memory snapshot name (None: not used).
+        self.snapshot = None if not shmName else rwSnapshot.snapshotReader(shmName, touchFun=self._touchRW, 
+                                                                           retryInt=RECON_INT, logFun=Log.info)
+        # realworld query round trip time.
+        self.rttHists = {'GET': perfStats.latencyHistogram(), 'POST': perfStats.latencyHistogram()}
+        self.wireFmt = rwDataCodec.FMT_JSON
         self.recoonectCount = RECON_INT
         # Test login the real world emulator
         self.rtuID = self.parent.getID()
@@ -88,10 +117,14 @@ class RealWorldConnector(object):
     def _loginRealWord(self, plcID=None):
         """ Try to connect to the realworld emulator with the plc ID."""
         Log.info("Try to connnect to the realword [%s]..." % str(self.address))
-        rqstKey, rqstType, rqstDict = 'GET', 'login', {'plcID': plcID}
+        rqstKey, rqstType = 'GET', 'login'
+        rqstDict = {'plcID': plcID, 'formats': [rwDataCodec.FMT_BIN, rwDataCodec.FMT_JSON]}
+        self.wireFmt = rwDataCodec.FMT_JSON
         result = self._queryToRW(rqstKey, rqstType, rqstDict)
         if result:
-            Log.info("Realworld emulator online, state: ready")
+            if isinstance(result[2], dict) and result[2].get('format') == rwDataCodec.FMT_BIN:
+                self.wireFmt = rwDataCodec.FMT_BIN
+            Log.info("Realworld emulator online, state: ready, format: %s" % self.wireFmt)
             return True
         return False
 
@@ -118,6 +151,24 @@ class RealWorldConnector(object):
         Log.warning("getRWInputData(): passed in input parm needs to be a dict() type.")
         return None
 
+#-----------------------------------------------------------------------------
+    def getSnapshotState(self, rqstType, keys):
+        """ Get the state from the realworld emulator's shared memory snapshot.
+            Returns:
+                tuple: ('SHM', type, stateDict) or None if the snapshot is not available
+                    or stale (caller needs to fetch the state by UDP).
+        """
+        if self.snapshot is None: return None
+        state = self.snapshot.readState(rqstType, keys)
+        return None if state is None else ('SHM', rqstType, state)
+
+    def _touchRW(self, rqstType, keys):
+        # the emulator marks the RTU online when it gets the RTU's query.
+        self._queryToRW('GET', rqstType, dict.fromkeys(keys), response=False)
+
+    def detachSnapshot(self):
+        if self.snapshot: self.snapshot.close()
+
 #-----------------------------------------------------------------------------
     def changeRWCoil(self, rqstType='signals', coilDict={}):
         """ Send the current rtu coils state to the realwrold emulator."""
@@ -141,16 +192,30 @@ class RealWorldConnector(object):
         """
         k = t = result = None
         if rqstKey and rqstType and rqstDict:
-            rqst = ';'.join((rqstKey, rqstType, json.dumps(rqstDict)))
+            self.corrID += 1
+            corrID = str(self.corrID)
+            payload = None
+            if self.wireFmt == rwDataCodec.FMT_BIN and rwDataCodec.isBinType(rqstType):
+                try:
+                    payload = rwDataCodec.encodeData(rqstType, rqstDict)
+                except Exception as err:
+                    Log.warning("_queryToRW(): use json format, binary encode failed: %s" % str(err))
+            if payload is None: payload = json.dumps(rqstDict).encode('UTF-8')
+            rqst = b';'.join(('#'.join((rqstKey, corrID)).encode('UTF-8'), rqstType.encode('UTF-8'), payload))
             if self.rwConnector:
-                resp = self.rwConnector.sendMsg(rqst, resp=response)
+                startT = time.monotonic()
+                future = self.rwConnector.sendRequest(rqst, corrID)
+                if not response: return (k, t, result)
+                resp = future.result()
                 if resp:
+                    if rqstKey in self.rttHists: self.rttHists[rqstKey].add(time.monotonic() - startT)
                     #gv.gDebugPrint('===> resp:%s' %str(resp), logType=gv.LOG_INFO)
                     k, t, data = parseIncomeMsg(resp)
+                    if k: k = k.partition('#')[0]
                     if k != 'REP': Log.warning('The msg reply key %s is invalid' % k)
                     if t != rqstType: Log.warning('The reply type miss match: %s' %str((rqstType, t)))
                     try:
-                        result = json.loads(data)
+                        result = rwDataCodec.decodeData(t, data) if rwDataCodec.isBinData(data) else json.loads(data)
                         self.lastUpdateT = datetime.now()
                     except Exception as err:
                         Log.exception('Exception: %s' %str(err))
@@ -163,6 +228,18 @@ class RealWorldConnector(object):
             Log.error("queryBE: input missing: %s" %str(rqstKey, rqstType, rqstDict))
         return (k, t, result)
 
+#-----------------------------------------------------------------------------
+    def getRttStats(self):
+        """ Return the realworld GET/POST query round trip time stats (ms)."""
+        return OrderedDict((key, hist.getStats()) for key, hist in self.rttHists.items())
+
+#-----------------------------------------------------------------------------
+    def checkSockDrops(self, now):
+        """ Log the datagrams dropped by the kernel because the UDP socket receive 
+            buffer is full (check the UDP_PROFILE config if it keeps increasing).
+        """
+        self.dropMonitor.check(self.rwConnector, now)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class s7CommService(threading.Thread):
@@ -230,6 +307,9 @@ class rtuSimuInterface(object):
             addressInfoDict = {
                 'hostaddress': gv.gS7serverIP,
                 'realworld':gv.gRealWorldIP, 
+                'udpprofile': gv.gUdpProfile,
+                'shmname': gv.gRwShmName,
+                'statsport': gv.gStatsPort
             }
             rtu = rtuSimuInterface(None, gv.RTU_NAME, addressInfoDict, 
                     dllPath=gv.gS7snapDllPath, updateInt=gv.gInterval)
@@ -237,11 +317,19 @@ class rtuSimuInterface(object):
         self.parent = parent
         self.rtuID = rtuID
         self.regsStateRW = OrderedDict()
-        self.updateInt = updateInt
+        self.updateInt = updateInt  # scan cycle time (sec).
+        self.scheduler = perfStats.scanCycleScheduler(self.updateInt, stages=SCAN_STAGES)
+        # performance instrumentation: S7Comm requests served.
+        self.s7ReqCounter = perfStats.rateCounter()
+        self.statsLogT = time.time()
         # Init the UDP connector to connect to the realworld and test the connection.
         self.regSRWfetchKey = None 
         self.realworldAddr = addressInfoDict['realworld'] if 'realworld' in addressInfoDict.keys() else ('127.0.0.1', DEF_RW_PORT)
-        self.rwConnector = RealWorldConnector(self, self.realworldAddr)
+        self.udpProfile = addressInfoDict['udpprofile'] if 'udpprofile' in addressInfoDict.keys() else None
+        # realworld shared memory snapshot name, used if the emulator runs on the same host.
+        self.shmName = addressInfoDict['shmname'] if 'shmname' in addressInfoDict.keys() else None
+        self.rwConnector = RealWorldConnector(self, self.realworldAddr, sockProfile=self.udpProfile,
+                                              shmName=self.shmName)
         self._initRealWorldConnectionParm()
         # Init the S7Comm TCP service
         self.s7commAddr = addressInfoDict['hostaddress'] if 'hostaddress' in addressInfoDict.keys() else ('127.0.0.1', DEF_S7_PORT)
@@ -253,8 +341,15 @@ class rtuSimuInterface(object):
         self._initMemoryAddrs()
         self._initMemoryDefaultVals()
         self._initLadderHandler()
+        self.s7Service.getS7ServerRef().setRequestHandler(self.s7ReqCounter.inc)
 
         self.s7Service.start()
+        # Init the local stats query endpoint (port 0: disabled).
+        self.statsPort = addressInfoDict['statsport'] if 'statsport' in addressInfoDict.keys() else 0
+        self.statsEndpoint = None
+        if self.statsPort:
+            self.statsEndpoint = perfStats.statsEndpoint(self.statsPort, self.getPerfStats)
+            self.statsEndpoint.start()
         self.terminate = False
         Log.info('Finished init the RTU: %s' %str(self.rtuID))
 
@@ -313,6 +408,9 @@ class rtuSimuInterface(object):
 
     def getRWInputInfo(self):
         """ Get sensors state from the real-world simulator. """
+        if self.shmName:
+            reuslt = self.rwConnector.getSnapshotState(self.regSRWfetchKey, self.regsStateRW.keys())
+            if reuslt: return reuslt
         rqstDict = {}
         for key in self.regsStateRW.keys():
             rqstDict[key] = None
@@ -328,21 +426,47 @@ class rtuSimuInterface(object):
         sensorInfo = self.getRWInputInfo()
         if sensorInfo is None: return
         (_, _, result) = sensorInfo
-        time.sleep(0.1)
+        self.scheduler.markStage('input')
         self._updateMemory(result)
-        
+        self.scheduler.markStage('update')
+
+#-----------------------------------------------------------------------------
+    def getPerfStats(self):
+        """ Return the RTU performance stats: scan cycle and stages time, realworld 
+            query round trip time (ms) and S7Comm requests.
+        """
+        return OrderedDict([
+            ('id', self.rtuID),
+            ('scan', self.scheduler.getStats()),
+            ('rwRtt', self.rwConnector.getRttStats()),
+            ('s7comm', self.s7ReqCounter.getStats())
+        ])
+
+    def _dumpPerfStats(self, now):
+        """ Dump the performance stats to the log every STATS_LOG_INT seconds."""
+        if now - self.statsLogT < STATS_LOG_INT: return
+        self.statsLogT = now
+        Log.info("Performance stats: %s" % json.dumps(self.getPerfStats()))
+
 #-----------------------------------------------------------------------------
     def run(self):
+        """ Run the RTU scan cycle at fixed rate (the updateInt) until stop."""
+        self.scheduler.reset()
         while not self.terminate:
-            now = time.time()
             if self.rwConnector.isRealWorldOnline():
+                self.scheduler.waitCycle()
+                now = time.time()
                 self.periodic(now)
-                time.sleep(0.6)
+                self.scheduler.endCycle()
+                self.rwConnector.checkSockDrops(now)
+                self._dumpPerfStats(now)
             else:
                 print(" > try to reconnect to the real world emulation app: ")
                 self.rwConnector.reConnectRW()
                 time.sleep(2)
-            time.sleep(self.updateInt)
+                if self.rwConnector.isRealWorldOnline(): self.scheduler.realign()
+        if self.statsEndpoint: self.statsEndpoint.stop()
+        self.rwConnector.detachSnapshot()
         self.s7Service.stop()
 
 #-----------------------------------------------------------------------------
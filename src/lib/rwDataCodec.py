@@ -0,0 +1,197 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        rwDataCodec.py
+#
+# Purpose:     This module will provide a compact binary encoder/decoder for the
+#              data exchanged between the realworld emulator and the PLC/RTU
+#              simulators (sensors, stations, signals, trainsPlc and trainsRtu
+#              payloads), the JSON string payload is kept as the fallback format.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/02
+# Version:     v_0.1.1
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+    Every PLC/RTU clock cycle fetches the realworld state with a UDP message
+    "KEY;type;<json>", most of the payload is the JSON syntax of 0/1 lists such as
+    '{"weline": [0, 1, 0, ...], ...}'. This module packs the payload to bytes:
+
+    payload = BIN_TAG + entry + entry + ...
+    entry   = ENTRY_HDR(trackIdx, itemCount) + items
+
+    - trackIdx is the index of the track key in TRACK_KEYS.
+    - itemCount == NULL_CNT means the value is None (the request only sends the keys).
+    - bit list types (sensors, stations, signals, trainsPlc): 8 items per byte, MSB first.
+    - trainsRtu type: every train packed as RTU_ITEM (fsensor, speed, voltage, current).
+
+    A JSON payload always starts with '{', so the receiver can tell the format by
+    the first byte of the payload (check isBinData()). The format is negotiated in
+    the login request: the client sends {"formats": ["bin", "json"]} and only uses
+    the binary format if the emulator replies {"format": "bin"}.
+"""
+
+import struct
+from collections import OrderedDict
+
+BIN_TAG = b'\x00'   # first byte of a binary payload.
+FMT_BIN = 'bin'
+FMT_JSON = 'json'
+
+TRACK_KEYS = ('weline', 'nsline', 'ccline', 'mtline', 'config')
+NULL_CNT = 0xFFFF
+ENTRY_HDR = struct.Struct('!BH')        # track index, item count
+RTU_ITEM = struct.Struct('!?hhh')       # fsensor, speed, voltage, current
+
+BIT_TYPES = ('sensors', 'stations', 'signals', 'trainsPlc')
+RTU_TYPES = ('trainsRtu', )
+
+#-----------------------------------------------------------------------------
+def isBinData(data):
+    """ Check whether the message payload is in binary format."""
+    return isinstance(data, (bytes, bytearray)) and data[:1] == BIN_TAG
+
+def isBinType(rqstType):
+    """ Check whether the request type's payload can be binary encoded."""
+    return rqstType in BIT_TYPES or rqstType in RTU_TYPES
+
+#-----------------------------------------------------------------------------
+def _packEntry(data, key, val):
+    """ Append the entry header to the data and return the item count (-1 if
+        the value is None). Raise ValueError if the key is not a track key.
+    """
+    trackIdx = TRACK_KEYS.index(key)
+    if val is None:
+        data += ENTRY_HDR.pack(trackIdx, NULL_CNT)
+        return -1
+    if len(val) >= NULL_CNT: raise ValueError("Too many items under key %s" % key)
+    data += ENTRY_HDR.pack(trackIdx, len(val))
+    return len(val)
+
+#-----------------------------------------------------------------------------
+def encodeBits(dataDict):
+    """ Encode the dict {trackKey: list of 0/1 or bool or None} to bytes."""
+    data = bytearray(BIN_TAG)
+    for key, val in dataDict.items():
+        count = _packEntry(data, key, val)
+        if count <= 0: continue
+        bits = bytearray((count + 7) >> 3)
+        for i, bit in enumerate(val):
+            if bit: bits[i >> 3] |= 0x80 >> (i & 7)
+        data += bits
+    return bytes(data)
+
+def decodeBits(data, boolFlg=False):
+    """ Decode the bytes to the dict {trackKey: list}.
+        Args:
+            data (bytes): binary payload.
+            boolFlg (bool, optional): True: items are bools (coils state), False:
+                items are int 0/1 (sensors state). Defaults to False.
+    """
+    dataDict = OrderedDict()
+    view = memoryview(data)
+    offset = len(BIN_TAG)
+    while offset < len(view):
+        trackIdx, count = ENTRY_HDR.unpack_from(view, offset)
+        offset += ENTRY_HDR.size
+        key = TRACK_KEYS[trackIdx]
+        if count == NULL_CNT:
+            dataDict[key] = None
+            continue
+        bits = view[offset:offset + ((count + 7) >> 3)]
+        if len(bits) != (count + 7) >> 3: raise ValueError("Truncated payload")
+        offset += len(bits)
+        vals = [(bits[i >> 3] >> (7 - (i & 7))) & 1 for i in range(count)]
+        dataDict[key] = [bool(v) for v in vals] if boolFlg else vals
+    return dataDict
+
+#-----------------------------------------------------------------------------
+def encodeRtu(dataDict):
+    """ Encode the dict {trackKey: list of [fsensor, speed, voltage, current] or
+        None} to bytes.
+    """
+    data = bytearray(BIN_TAG)
+    for key, val in dataDict.items():
+        count = _packEntry(data, key, val)
+        for item in (val if count > 0 else ()):
+            data += RTU_ITEM.pack(bool(item[0]), int(item[1]), int(item[2]), int(item[3]))
+    return bytes(data)
+
+def decodeRtu(data):
+    """ Decode the bytes to the dict {trackKey: list of [fsensor, speed, voltage, current]}."""
+    dataDict = OrderedDict()
+    view = memoryview(data)
+    offset = len(BIN_TAG)
+    while offset < len(view):
+        trackIdx, count = ENTRY_HDR.unpack_from(view, offset)
+        offset += ENTRY_HDR.size
+        key = TRACK_KEYS[trackIdx]
+        if count == NULL_CNT:
+            dataDict[key] = None
+            continue
+        dataDict[key] = [list(item) for item in RTU_ITEM.iter_unpack(
+            view[offset:offset + count*RTU_ITEM.size])]
+        if len(dataDict[key]) != count: raise ValueError("Truncated payload")
+        offset += count*RTU_ITEM.size
+    return dataDict
+
+#-----------------------------------------------------------------------------
+def encodeData(rqstType, dataDict):
+    """ Encode the request/response dict based on the request type, raise ValueError
+        if the type or the data can not be binary encoded.
+    """
+    if rqstType in BIT_TYPES: return encodeBits(dataDict)
+    if rqstType in RTU_TYPES: return encodeRtu(dataDict)
+    raise ValueError("Request type %s not support binary format" % str(rqstType))
+
+def decodeData(rqstType, data, boolFlg=False):
+    """ Decode the binary payload based on the request type, raise ValueError
+        (or struct.error/IndexError) if the payload is invalid.
+    """
+    if not isBinData(data): raise ValueError("Not a binary payload")
+    if rqstType in BIT_TYPES: return decodeBits(data, boolFlg=boolFlg)
+    if rqstType in RTU_TYPES: return decodeRtu(data)
+    raise ValueError("Request type %s not support binary format" % str(rqstType))
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    import json
+    tCount = 0
+    print("1. Bit list round trip:\n----")
+    sensorDict = {'weline': [0, 1, 1, 0, 0, 0, 0, 0, 1], 'nsline': [1]*14, 'ccline': []}
+    data = encodeData('sensors', sensorDict)
+    tPass = decodeData('sensors', data) == sensorDict
+    coilDict = {'weline': [True, False, True], 'config': [True]}
+    tPass = tPass and decodeData('trainsPlc', encodeData('trainsPlc', coilDict), boolFlg=True) == coilDict
+    print("Size binary: %s, json: %s" % (len(data), len(json.dumps(sensorDict))))
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("2. RTU data and request round trip:\n----")
+    rtuDict = {'weline': [[True, 60, 750, 150], [False, 0, 0, 0]], 'mtline': [[True, 100, 730, 200]]}
+    tPass = decodeData('trainsRtu', encodeData('trainsRtu', rtuDict)) == rtuDict
+    rqstDict = {'weline': None, 'nsline': None}
+    tPass = tPass and decodeData('trainsRtu', encodeData('trainsRtu', rqstDict)) == rqstDict
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("3. Invalid data:\n----")
+    tPass = not isBinData(json.dumps(rqstDict).encode('utf-8'))
+    for fun in (lambda: encodeData('login', rqstDict),
+                lambda: encodeData('sensors', {'unknown': [1]}),
+                lambda: decodeData('sensors', BIN_TAG + ENTRY_HDR.pack(0, 20) + b'\x01')):
+        try:
+            fun()
+            tPass = False
+        except ValueError:
+            pass
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+    print(" => All test finished: %s/3" % str(tCount))
+
+#-----------------------------------------------------------------------------
+if __name__ == '__main__':
+    testCase()
@@ -0,0 +1,341 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        rwSnapshot.py
+#
+# Purpose:     This module will provide a versioned realworld state snapshot in the
+#              shared memory, the realworld emulator publishes the components state
+#              after every simulation tick and the processes on the same host read
+#              it without any UDP request.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/09
+# Version:     v_0.1.1
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+    The snapshot is a block of multiprocessing.shared_memory with one writer (the
+    realworld emulator) and many readers:
+
+    memory  = HEADER(seq, publishTime, payloadSize) + payload
+    payload = SECTION_HDR(typeIdx, dataSize) + rwDataCodec bytes + ...
+
+    - typeIdx is the index of the state type in SNAP_TYPES, every section is the
+        rwDataCodec binary payload of the type's {trackKey: list} dict.
+    - seq is a seqlock counter: the writer sets it to odd before changing the payload
+        and to the next even number after, the reader copies the payload and retries
+        if seq was odd or changed during the copy. The snapshot version is seq/2.
+
+    The reader decodes the payload only when the version changed, so reading the
+    same version again doesn't copy/decode anything.
+
+    Usage:
+    - writer: snapshot = rwSnapshot(create=True); snapshot.publish({'sensors': {...}, ...})
+    - reader: snapshot = rwSnapshot(); version, pubTime, stateDict = snapshot.read()
+    - PLC/RTU: reader = snapshotReader(name, touchFun=fun); state = reader.readState(type, keys)
+"""
+
+import time
+import struct
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+
+import rwDataCodec
+
+SHM_NAME = 'railwayRwSnapshot'  # default shared memory block name.
+SHM_SIZE = 64*1024              # default shared memory block size.
+READ_RETRY = 100                # max retry times when the writer is changing the snapshot.
+ATTACH_RETRY = 30               # seconds interval to retry attaching the not available snapshot.
+MAX_AGE = 5                     # seconds after which the snapshot is treated as stale.
+TOUCH_INT = 1                   # seconds interval to call the touch function when reading.
+
+SNAP_TYPES = ('sensors', 'stations', 'trainsPlc', 'trainsRtu')
+HEADER = struct.Struct('<QdI')  # seqlock counter, publish time, payload size
+SEQ = struct.Struct('<Q')
+SECTION_HDR = struct.Struct('<BI')  # state type index, section data size
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class rwSnapshot(object):
+    """ Shared memory realworld state snapshot protected by a seqlock."""
+    def __init__(self, name=SHM_NAME, create=False, size=SHM_SIZE, untrack=True):
+        """ init example: snapshot = rwSnapshot(name='railwayRwSnapshot', create=False)
+            Args:
+                name (str, optional): shared memory block name. Defaults to SHM_NAME.
+                create (bool, optional): True: create the block as the writer, False:
+                    attach to the existing block as a reader. Defaults to False.
+                size (int, optional): block size to create. Defaults to SHM_SIZE.
+                untrack (bool, optional): remove the reader's block from the resource 
+                    tracker so it is not unlinked when the reader exits, set to False in
+                    the process forked from the writer (they share the tracker). 
+                    Defaults to True.
+            Raise FileNotFoundError if the reader's block doesn't exist.
+        """
+        self.name = name
+        self.owner = create
+        if create:
+            try:
+                # remove the block left by the last crashed writer.
+                shared_memory.SharedMemory(name=name).unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.shm.buf[:HEADER.size] = HEADER.pack(0, 0, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # the reader doesn't own the block, don't let the resource tracker unlink it.
+            if untrack:
+                try:
+                    resource_tracker.unregister(self.shm._name, 'shared_memory')
+                except Exception:
+                    pass
+        self.buf = self.shm.buf
+        self.seq = 0            # writer's seqlock counter.
+        self.lastSeq = None     # reader's last decoded seq.
+        self.badSeq = None      # reader's last seq failed to decode.
+        self.lastState = (0, 0, None)
+
+#-----------------------------------------------------------------------------
+    def publish(self, stateDict, pubTime=None):
+        """ Write the state dict {stateType: {trackKey: list}} to the snapshot.
+            Returns:
+                int: the new snapshot version, None if the state can not be encoded or
+                    is bigger than the shared memory block.
+        """
+        payload = bytearray()
+        try:
+            for typeIdx, stateType in enumerate(SNAP_TYPES):
+                if stateType not in stateDict.keys(): continue
+                data = rwDataCodec.encodeData(stateType, stateDict[stateType])
+                payload += SECTION_HDR.pack(typeIdx, len(data))
+                payload += data
+        except Exception as err:
+            print("rwSnapshot;publish(): Can not encode the state: %s" % str(err))
+            return None
+        if HEADER.size + len(payload) > len(self.buf):
+            print("rwSnapshot;publish(): State size %s is too big." % str(len(payload)))
+            return None
+        self.seq += 1   # odd: the readers will retry until the write finished.
+        SEQ.pack_into(self.buf, 0, self.seq)
+        self.buf[HEADER.size:HEADER.size + len(payload)] = payload
+        self.seq += 1
+        HEADER.pack_into(self.buf, 0, self.seq, pubTime or time.time(), len(payload))
+        return self.seq >> 1
+
+#-----------------------------------------------------------------------------
+    def getVersion(self):
+        """ Return the snapshot version (0 if nothing published yet)."""
+        return SEQ.unpack_from(self.buf, 0)[0] >> 1
+
+#-----------------------------------------------------------------------------
+    def read(self):
+        """ Read the latest snapshot.
+            Returns:
+                tuple: (version, publishTime, stateDict), stateDict is None if nothing
+                    published yet, the tuple is None if the writer keeps changing the
+                    snapshot during READ_RETRY times reading or the snapshot can not be
+                    decoded. The stateDict is shared
+                    by the reads of the same version, don't change it.
+        """
+        for i in range(READ_RETRY):
+            seq = SEQ.unpack_from(self.buf, 0)[0]
+            if seq & 1:
+                if i: time.sleep(0)  # let the writer finish.
+                continue
+            if seq == self.lastSeq: return self.lastState
+            _, pubTime, size = HEADER.unpack_from(self.buf, 0)
+            payload = bytes(self.buf[HEADER.size:HEADER.size + size])
+            if SEQ.unpack_from(self.buf, 0)[0] != seq: continue
+            try:
+                stateDict = self._decode(payload) if seq else None
+            except (struct.error, IndexError, ValueError, KeyError) as err:
+                # corrupted or incompatible snapshot, the caller fetches the state by UDP.
+                if seq != self.badSeq: print("rwSnapshot;read(): Snapshot decode error: %s" % str(err))
+                self.badSeq = seq
+                return None
+            self.lastSeq, self.lastState = seq, (seq >> 1, pubTime, stateDict)
+            return self.lastState
+        return None
+
+    def readState(self, stateType, keys, maxAge=None):
+        """ Read the state of the keys (track IDs) of one state type.
+            Args:
+                stateType (str): state type in SNAP_TYPES.
+                keys (list): track ID list.
+                maxAge (float, optional): return None if the snapshot was published more
+                    than maxAge seconds ago (writer stopped). Defaults to None.
+            Returns:
+                OrderedDict: {trackID: list copy}, None if the state is not available.
+        """
+        snapshot = self.read()
+        if snapshot is None or snapshot[2] is None or stateType not in snapshot[2]: return None
+        if maxAge and time.time() - snapshot[1] > maxAge: return None
+        state = snapshot[2][stateType]
+        return OrderedDict((key, list(state[key]) if state.get(key) is not None else None) for key in keys)
+
+    def _decode(self, payload):
+        stateDict = {}
+        offset = 0
+        while offset < len(payload):
+            typeIdx, size = SECTION_HDR.unpack_from(payload, offset)
+            offset += SECTION_HDR.size
+            stateType = SNAP_TYPES[typeIdx]
+            stateDict[stateType] = rwDataCodec.decodeData(stateType, payload[offset:offset + size])
+            offset += size
+        return stateDict
+
+#-----------------------------------------------------------------------------
+    def close(self):
+        """ Detach the shared memory block, the writer also removes it."""
+        self.buf = None
+        self.lastState = (0, 0, None)
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class snapshotReader(object):
+    """ Snapshot reader used by the PLCs/RTUs realworld connectors: attach the snapshot
+        when needed, attach again later if it is not available or stale (the emulator 
+        is not on this host, stopped or restarted) and call the touch function while
+        reading so the emulator still marks the PLC/RTU online.
+    """
+    def __init__(self, name, touchFun=None, retryInt=ATTACH_RETRY, maxAge=MAX_AGE, 
+                 touchInt=TOUCH_INT, logFun=print, untrack=True):
+        """ init example: reader = snapshotReader('railwayRwSnapshot', touchFun=fun)
+            Args:
+                name (str): shared memory block name.
+                touchFun (function, optional): touchFun(stateType, keys) called every 
+                    touchInt seconds when the state is read. Defaults to None.
+                retryInt (int, optional): seconds to retry if the snapshot is not 
+                    available. Defaults to ATTACH_RETRY.
+                maxAge (float, optional): max snapshot age (sec). Defaults to MAX_AGE.
+                touchInt (float, optional): touch interval (sec). Defaults to TOUCH_INT.
+                logFun (function, optional): log function. Defaults to print.
+                untrack (bool, optional): check rwSnapshot(). Defaults to True.
+        """
+        self.name = name
+        self.touchFun = touchFun
+        self.retryInt = retryInt
+        self.maxAge = maxAge
+        self.touchInt = touchInt
+        self.logFun = logFun
+        self.untrack = untrack
+        self.snapshot = None
+        self.retryT = 0
+        self.touchT = 0
+
+    def attach(self):
+        """ Attach to the snapshot, return True if attached."""
+        try:
+            self.snapshot = rwSnapshot(name=self.name, untrack=self.untrack)
+            self.logFun("Attached the realworld state snapshot: %s" % self.name)
+            return True
+        except Exception as err:
+            self.logFun("Realworld state snapshot is not available, use UDP: %s" % str(err))
+            self.snapshot = None
+            self.retryT = time.time() + self.retryInt
+            return False
+
+    def readState(self, stateType, keys):
+        """ Read the state of the keys of one state type, return None if the snapshot 
+            is not available or stale (caller needs to fetch the state by UDP).
+        """
+        now = time.time()
+        if self.snapshot is None and (now < self.retryT or not self.attach()): return None
+        keys = list(keys)
+        state = self.snapshot.readState(stateType, keys, maxAge=self.maxAge)
+        if state is None:
+            # the emulator stopped or restarted with a new block, attach again later.
+            self.close()
+            self.retryT = now + self.maxAge
+            return None
+        if self.touchFun and now - self.touchT > self.touchInt:
+            self.touchT = now
+            self.touchFun(stateType, keys)
+        return state
+
+    def close(self):
+        if self.snapshot: self.snapshot.close()
+        self.snapshot = None
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def testCase():
+    tCount = 0
+    name = 'rwSnapshotTest'
+    print("1. Publish and read:\n----")
+    writer = rwSnapshot(name=name, create=True)
+    reader = rwSnapshot(name=name, untrack=False)  # same process as the writer.
+    tPass = reader.read() == (0, 0, None)
+    state = {'sensors': {'weline': [0, 1, 1], 'nsline': None},
+             'trainsRtu': {'weline': [[True, 60, 750, 150]]}}
+    version = writer.publish(state, pubTime=1.5)
+    result = reader.read()
+    tPass = tPass and version == 1 and result == (1, 1.5, state)
+    tPass = tPass and reader.read()[2] is result[2]  # same version is not decoded again.
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("2. Reader retry during write:\n----")
+    SEQ.pack_into(writer.buf, 0, 3)     # writer is changing the snapshot.
+    tPass = reader.read() is None
+    SEQ.pack_into(writer.buf, 0, 2)
+    tPass = tPass and reader.read()[0] == 1
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("3. Invalid state:\n----")
+    tPass = writer.publish({'sensors': {'unknown': [1]}}) is None
+    tPass = tPass and writer.publish({'stations': {'weline': [1]*(SHM_SIZE*8)}}) is None
+    tPass = tPass and writer.getVersion() == 1
+    reader.close()
+    writer.close()
+    try:
+        rwSnapshot(name=name)
+        tPass = False
+    except FileNotFoundError:
+        pass
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("4. Snapshot reader:\n----")
+    touched = []
+    reader = snapshotReader(name, touchFun=lambda stateType, keys: touched.append(stateType), 
+                            retryInt=0, logFun=lambda msg: None, untrack=False)
+    tPass = reader.readState('sensors', ['weline']) is None
+    writer = rwSnapshot(name=name, create=True)
+    writer.publish({'sensors': {'weline': [1, 0]}})
+    tPass = tPass and reader.readState('sensors', ['weline']) == {'weline': [1, 0]}
+    tPass = tPass and reader.readState('sensors', ['weline']) == {'weline': [1, 0]} and touched == ['sensors']
+    writer.publish({'sensors': {'weline': [1, 1]}}, pubTime=time.time()-MAX_AGE-1)
+    tPass = tPass and reader.readState('sensors', ['weline']) is None and reader.snapshot is None
+    writer.close()
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+
+    print("5. Corrupted snapshot:\n----")
+    writer = rwSnapshot(name=name, create=True)
+    reader = rwSnapshot(name=name, untrack=False)
+    writer.publish({'sensors': {'weline': [1, 0]}})
+    SECTION_HDR.pack_into(writer.buf, HEADER.size, len(SNAP_TYPES), 2)  # unknown state type.
+    tPass = reader.read() is None and reader.readState('sensors', ['weline']) is None
+    writer.publish({'sensors': {'weline': [1, 0]}})
+    writer.buf[HEADER.size + SECTION_HDR.size] = 0xFF  # invalid data format tag.
+    tPass = tPass and reader.read() is None
+    writer.publish({'sensors': {'weline': [1, 1]}})
+    tPass = tPass and reader.readState('sensors', ['weline']) == {'weline': [1, 1]}
+    reader.close()
+    writer.close()
+    if tPass: tCount += 1
+    print("Test passed: %s \n----\n" % str(tPass))
+    print(" => All test finished: %s/5" % str(tCount))
+
+#-----------------------------------------------------------------------------
+if __name__ == '__main__':
+    testCase()
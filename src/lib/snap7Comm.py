@@ -47,6 +47,9 @@ BOOL_TYPE = 0   # bool type 2 bytes data.
 INT_TYPE = 1    # integer type 2 bytes number. 
 REAL_TYPE = 2   # float type 4 bytes number. 
 
+EVT_DATA_READ = 0x00020000  # snap7 server event code: data read command executed.
+EVT_DATA_WRITE = 0x00040000 # snap7 server event code: data write command executed.
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 def parseS7bytes(databytes, dataIdx, dataType):
@@ -236,6 +239,7 @@ class s7commServer(object):
             print("s7commServer > Load the Snap7 Win-OS lib-dll file : %s" %str(snapLibPath))
             load_library(snapLibPath)
         self.clockInterval = 0.05 # the interval of the event handling clock 
+        self.requestHandler = None  # called for every client data read/write request.
         self.terminate = False
         print("s7commServerInit > Host IP: %s, Port: %d" %(self._hostIp, self._hostPort))
 
@@ -317,19 +321,27 @@ class s7commServer(object):
              return None
         # Added the loop to print the event and handle the DB change request.
         while not self.terminate:
+            # handle all the queued events every clock.
             event = self._server.pick_event()
-            if event:
+            while event:
                 if printEvt: print(" - Event: %s" % str(event))
-                if eventHandlerFun and event.EvtCode == 262144 and event.EvtRetCode == 0:  # write command executed
+                if self.requestHandler and event.EvtCode in (EVT_DATA_READ, EVT_DATA_WRITE):
+                    self.requestHandler()
+                if eventHandlerFun and event.EvtCode == EVT_DATA_WRITE and event.EvtRetCode == 0:  # write command executed
                     if event.EvtParam1 == 132:  # DB write
                         address, dataIdx, writeLen = event.EvtParam2, event.EvtParam3, event.EvtParam4
                         eventHandlerFun((address, dataIdx, writeLen))
+                event = self._server.pick_event()
             time.sleep(self.clockInterval)
 
     #-----------------------------------------------------------------------------
     def setClockInterval(self, interval):
         self.clockInterval = interval
 
+    def setRequestHandler(self, requestHandler):
+        """ Set the function called for every client data read/write request."""
+        self.requestHandler = requestHandler
+
     #-----------------------------------------------------------------------------
     def setMemoryVal(self, memoryIdx, dataIdx, dataVal):
         """ Set the memory index byte index value.
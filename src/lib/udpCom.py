@@ -22,24 +22,57 @@
             function return value, the value will be send back to the client side.
 
     If the message/data size is bigger than the MAX/pre-configured UDP socket buffer 
-    size, it will be split to several chunks, each chunk will be buffer size - 1 bytes.
-    Then the chunk will be send to destination under splitted sequence. The data transfer 
-    will follow below steps:
-        1. Send b'BM;Send;<messageSize>' to the server side.
-        2. Send every thrunk in a loop.
-        3. Send b'BM;Sent;Finish' to identify finished and trigger the response.
+    size, it will be split to several chunks, each chunk is framed with a small binary
+    header: <CHUNK_TAG><msgID><messageSize><sequence><totalCount><payload>, so the
+    receiver can put every chunk to the right place of a preallocated buffer even if
+    the chunks arrive out of order. The chunk payloads are memoryview slices of the 
+    message sent with the frame header by one scatter sendmsg() call, the receiver 
+    reads the datagrams into a reused buffer with recvfrom_into() and copies the 
+    payload once to the preallocated message buffer. The data transfer will follow 
+    below steps:
+        1. Send b'BM;Send;<messageSize>;<msgID>;<totalCount>' to the server side.
+        2. Send every framed chunk in a loop.
+        3. Send b'BM;Sent;<msgID>' to identify finished and trigger the response.
+    If some chunks are not received within the per message timeout (MSG_TIMEOUT ms),
+    the receiver will send b'BM;Nack;<msgID>;<seq0>,<seq1>...' to the sender to re-request
+    the missing chunks (an empty sequence list means resend the whole message), after
+    MSG_RETRY NACK rounds the incomplete message will be dropped.
     The server's reply Big message will follow step 1 & 2.
 
     Usage: 
     - server: the server side will have a loop to keep fetching data from the buffer,
             so it will good to package it in a threading class running parallel with 
             your main program thread.(As shown in the <udpComTest.py>)
+    - async server: udpAsyncServer is a drop-in replacement of the server which runs
+            an asyncio event loop, keeps the big message reassembly state per client 
+            and dispatches the messages to the handler concurrently, so one client's 
+            big message will not block the other clients' requests.
     - client: client = udpClient((<ip address>, <port>))
+    - pipeline client: client = udpPipeClient((<ip address>, <port>), <replyIDFun>), 
+            several requests can be outstanding at the same time, every request is 
+            sent with a correlation ID and a receiver thread routes the reply to the 
+            request's future/callback by the ID parsed from the reply with replyIDFun,
+            the late replies of the timeout requests are dropped, the messages which 
+            don't match any request (server push) are passed to the pushHandler.
+    - server push: start the server with serverStart(handler, addrFlg=True) to get 
+            the client address in handler(msg, address), then call pushMsg(msg, address)
+            to send a message to the client which is not a reply of its request.
+    - socket options: pass sockProfile (a SOCK_PROFILES name such as 'burst' or an 
+            options dict) to the server/client init or call setSockProfile() to set the 
+            kernel buffers size, SO_REUSEPORT, DSCP/TOS mark and the path MTU aware chunk 
+            size, getSockStats() returns the kernel buffers and drops counters.
 """
 
+import sys
 import time
+import random
 import socket
+import struct
+import asyncio
+import threading
 from math import ceil
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 
 BUFFER_SZ = 4096        # Default socket buffer size. Set to value smaller than MTU will increase small message transfer throughput.
 BUFFER_SZ_MAX = 65507   # UDP maximum buffer size.
@@ -47,41 +80,431 @@ RESP_TIME = 0.01
 BIG_MSG_FLG = 'BM'      # Flag to identify big size message.      
 CODE_FMT = 'utf-8'      # default str <-> bytes encode/decode format.
 
+CHUNK_TAG = b'BMC'      # Tag to identify a big message chunk frame.
+CHUNK_HDR = struct.Struct('!3sIIHH') # chunk frame header: tag, msgID, messageSize, sequence, totalCount
+CHUNK_CNT_MAX = 0xFFFF  # max number of chunks of one big message.
+MSG_SZ_MAX = 512*1024  # default max size of one received big message (the realworld state messages are a few KB).
+PENDING_MSG_MAX = 64    # max number of big messages reassembled by the async server at the same time.
+PENDING_ADDR_MAX = 4    # max number of big messages of one source IP reassembled at the same time.
+PENDING_SZ_MAX = 4*1024*1024 # max total buffer bytes of the big messages reassembled by the async server.
+MSG_ID_MAX = 0xFFFFFFFF # max big message ID, the ID will roll back to 0 after reach it.
+MSG_TIMEOUT = 200       # time (ms) to wait a missing chunk before NACK it.
+MSG_RETRY = 3           # NACK rounds before drop the incomplete big message.
+CACHE_SZ = 16           # number of the sent/received big messages kept for resend and duplicate check.
+MAX_WORKERS = 4         # number of the async server's handler worker threads.
+DISPATCH_MAX = 256      # max number of messages handled by the async server at the same time.
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg') # scatter send is not supported on Windows.
+MTU_CACHE_SZ = 1024     # max number of the client IPs' path MTU chunk size cached by the server.
+UDP_HDR_SZ = 28         # IPv4 + UDP header size, a datagram <= (path MTU - 28) bytes is not fragmented.
+PROC_UDP_FILES = ('/proc/net/udp', '/proc/net/udp6') # Linux kernel UDP sockets table (with drops counter).
+DROP_CHECK_INT = 10     # seconds interval to check the socket's kernel drops counter.
+
+# Socket options profiles, value 0 means keep the OS default setting:
+#   rcvBuf/sndBuf: kernel SO_RCVBUF/SO_SNDBUF bytes (Linux limits it by net.core.rmem_max/wmem_max).
+#   reusePort: set SO_REUSEPORT before bind so several processes can bind the same port.
+#   tos: IP_TOS byte (DSCP << 2), 0xB8 is DSCP EF (expedited forwarding).
+#   mtuChunk: cut the big message chunk datagrams to the path MTU to avoid the IP fragmentation.
+SOCK_PROFILES = {
+    'default':      {'rcvBuf': 0, 'sndBuf': 0, 'reusePort': False, 'tos': 0, 'mtuChunk': False},
+    'burst':        {'rcvBuf': 4*1024*1024, 'sndBuf': 1024*1024, 'reusePort': False, 'tos': 0, 'mtuChunk': False},
+    'lowLatency':   {'rcvBuf': 256*1024, 'sndBuf': 256*1024, 'reusePort': False, 'tos': 0xB8, 'mtuChunk': True},
+    'shard':        {'rcvBuf': 4*1024*1024, 'sndBuf': 1024*1024, 'reusePort': True, 'tos': 0, 'mtuChunk': False},
+}
+
+# Define all the module local untility functions here:
+#-----------------------------------------------------------------------------
+def buildChunks(message, msgID, chunkSize):
+    """ Split the message to a list of framed chunks without copying the payload.
+        Args:
+            message (bytes): the whole message.
+            msgID (int): big message ID.
+            chunkSize (int): max payload size of one chunk.
+        Returns:
+            list(tuple(bytes, memoryview)): chunk frames list, every frame is the 
+                (frame header, payload memoryview slice) pair.
+    """
+    messageSZ = len(message)
+    total = ceil(messageSZ/chunkSize)
+    view = memoryview(message)
+    return [(CHUNK_HDR.pack(CHUNK_TAG, msgID, messageSZ, seq, total), view[i:i+chunkSize])
+            for seq, i in enumerate(range(0, messageSZ, chunkSize))]
+
+def sendFrame(sock, frame, address):
+    """ Send the data bytes or the (header, payload) chunk frame to the address, the 
+        frame is sent by one scatter sendmsg() call so the header and payload are not
+        joined (copied) if the platform supports it.
+    """
+    if isinstance(frame, tuple):
+        if HAS_SENDMSG: return sock.sendmsg(frame, (), 0, address)
+        frame = b''.join(frame)
+    return sock.sendto(frame, address)
+
+def parseChunk(data):
+    """ Parse the chunk frame (bytes or memoryview) to tuple (msgID, messageSize, 
+        sequence, totalCount, payload), the payload is a memoryview of the data. Return 
+        None if the data is not a chunk frame.
+    """
+    if len(data) < CHUNK_HDR.size or data[:len(CHUNK_TAG)] != CHUNK_TAG: return None
+    _, msgID, messageSZ, seq, total = CHUNK_HDR.unpack_from(data)
+    return (msgID, messageSZ, seq, total, memoryview(data)[CHUNK_HDR.size:])
+
+def parseCtrlMsg(data):
+    """ Parse the big message control msg b'BM;<action>;<arg0>;<arg1>...' to tuple
+        (action, argsList), return (None, []) if the data is not a control message.
+    """
+    if not data.startswith(b'BM;'): return (None, [])
+    try:
+        fields = data.decode(CODE_FMT).split(';')
+        return (fields[1], fields[2:])
+    except Exception:
+        return (None, [])
+
+def getBigMsgID(data):
+    """ Return the big message ID of a header or chunk frame, None if not found."""
+    chunk = parseChunk(data)
+    if chunk: return chunk[0]
+    action, args = parseCtrlMsg(data)
+    if action == 'Send' and len(args) == 3 and args[1].isdigit(): return int(args[1])
+    return None
+
+def buildNack(msgID, missingList, bufferSize):
+    """ Build the NACK message of the missing chunks sequence list, the list will be
+        cut to fit in the buffer (the rest will be NACKed in the next round).
+    """
+    msg = ';'.join((BIG_MSG_FLG, 'Nack', str(msgID), ''))
+    for i, seq in enumerate(missingList):
+        item = str(seq) if i == 0 else ','+str(seq)
+        if len(msg) + len(item) > bufferSize: break
+        msg += item
+    return msg.encode(CODE_FMT)
+
+def resendChunks(sendFun, address, header, frames, nackArgs):
+    """ Resend the chunks listed in the NACK message args [msgID, 'seq0,seq1..'] by 
+        sendFun(data, address), resend the header and all the chunks if the NACK doesn't 
+        list any sequence.
+    """
+    seqList = [int(seq) for seq in nackArgs[1].split(',') if seq.isdigit()] if len(nackArgs) > 1 else []
+    if not seqList:
+        sendFun(header, address)
+        seqList = range(len(frames))
+    for seq in seqList:
+        if seq < len(frames): sendFun(frames[seq], address)
+
+#-----------------------------------------------------------------------------
+def getSockProfile(profile):
+    """ Return the socket options dict of the profile name in SOCK_PROFILES, or of 
+        the options dict which overwrites the 'default' profile. Return None if the 
+        profile name is not defined.
+    """
+    if profile is None: profile = 'default'
+    if isinstance(profile, dict):
+        options = dict(SOCK_PROFILES['default'])
+        options.update(profile)
+        return options
+    if profile in SOCK_PROFILES: return dict(SOCK_PROFILES[profile])
+    print("Error: the socket options profile %s is not defined." % str(profile))
+    return None
+
+def applySockOptions(sock, options):
+    """ Set the socket options dict (got from getSockProfile()) to the socket, the 
+        reusePort option only takes effect if it is set before bind.
+    """
+    try:
+        if options['rcvBuf'] > 0: sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, options['rcvBuf'])
+        if options['sndBuf'] > 0: sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, options['sndBuf'])
+        if options['reusePort']:
+            if hasattr(socket, 'SO_REUSEPORT'):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            else:
+                print("Warning: SO_REUSEPORT is not supported by the OS.")
+        if options['tos'] > 0: sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, options['tos'])
+    except OSError as err:
+        print("applySockOptions(): Can not set the socket options: %s" % str(err))
+        return False
+    # Linux reports double of the value set, less than it means the OS limit is reached.
+    if 0 < sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < options['rcvBuf']:
+        print("Warning: SO_RCVBUF is limited by the OS (net.core.rmem_max).")
+    return True
+
+def getPathMtu(address):
+    """ Return the MTU of the route to the address (ip, port), None if the OS doesn't
+        support query it (Linux IP_MTU socket option).
+    """
+    ipMtu = getattr(socket, 'IP_MTU', 14 if sys.platform.startswith('linux') else None)
+    if ipMtu is None: return None
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            return sock.getsockopt(socket.IPPROTO_IP, ipMtu)
+    except OSError:
+        return None
+
+def getMtuChunkSize(bufferSize, address):
+    """ Return the chunk payload size which makes the chunk frame fit in both the
+        receiver's buffer and the path MTU to the address.
+    """
+    mtu = getPathMtu(address)
+    datagramSZ = min(bufferSize, mtu - UDP_HDR_SZ) if mtu else bufferSize
+    return max(1, datagramSZ - CHUNK_HDR.size)
+
+def getUdpDrops(port):
+    """ Read the kernel UDP sockets table to get the receive queue bytes and the number
+        of datagrams dropped of the sockets bound to the local port.
+        Returns:
+            dict: {'rxQueue': <bytes>, 'drops': <count>}, None if no socket found or the
+                OS doesn't provide the table (non-Linux).
+    """
+    result, found = {'rxQueue': 0, 'drops': 0}, False
+    for path in PROC_UDP_FILES:
+        try:
+            with open(path, 'r') as fh:
+                lines = fh.readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            # sl local_address rem_address st tx_queue:rx_queue ... ref pointer drops
+            fields = line.split()
+            if len(fields) < 13 or int(fields[1].rsplit(':', 1)[1], 16) != port: continue
+            result['rxQueue'] += int(fields[4].split(':')[1], 16)
+            result['drops'] += int(fields[12])
+            found = True
+    return result if found else None
+
+def getSockStats(sock):
+    """ Return the socket's kernel buffer sizes and the receive queue/drops counters
+        dict: {'rcvBuf', 'sndBuf', 'rxQueue', 'drops'}, the counters are None if not
+        available.
+    """
+    stats = {'rcvBuf': sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+             'sndBuf': sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+             'rxQueue': None, 'drops': None}
+    port = sock.getsockname()[1]
+    counters = getUdpDrops(port) if port else None
+    if counters: stats.update(counters)
+    return stats
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class sockDropMonitor(object):
+    """ Log the datagrams dropped by the kernel because a UDP socket receive buffer 
+        is full, the counter is checked at most every checkInt seconds.
+    """
+    def __init__(self, logFun=print, checkInt=DROP_CHECK_INT):
+        self.logFun = logFun
+        self.checkInt = checkInt
+        self.checkT = 0
+        self.drops = 0
+        self.dispatchDrops = 0
+
+    def check(self, sockOwner, now):
+        """ Check the drops counter of the udpClient/udpServer/udpPipeClient."""
+        if now - self.checkT < self.checkInt: return
+        self.checkT = now
+        stats = sockOwner.getSockStats()
+        if stats is None: return
+        # messages dropped by the async server because all the handlers are busy.
+        dispatchDrops = stats.get('dispatchDrops', 0)
+        if dispatchDrops > self.dispatchDrops:
+            self.logFun("UDP server dropped %s messages, too many messages in handling (total: %s)."
+                        % (dispatchDrops - self.dispatchDrops, dispatchDrops))
+        self.dispatchDrops = dispatchDrops
+        if stats['drops'] is None: return
+        if stats['drops'] > self.drops:
+            self.logFun("UDP socket dropped %s datagrams (total: %s, receive buffer: %s bytes)."
+                        % (stats['drops'] - self.drops, stats['drops'], stats['rcvBuf']))
+        self.drops = stats['drops']
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class chunkAssembler(object):
+    """ Reassemble the framed chunks of one big message into a preallocated buffer."""
+    def __init__(self, msgID, messageSZ, total):
+        self.msgID = msgID
+        self.messageSZ = messageSZ
+        self.total = total
+        self.data = bytearray(messageSZ)
+        self.received = bytearray(total)    # received flag of each chunk sequence.
+        self.count = 0
+
+    @classmethod
+    def fromData(cls, data, sizeMax=MSG_SZ_MAX):
+        """ Create the assembler from a big message header or the first arrived chunk
+            frame, return None if the data is neither of them or the message size is
+            bigger than sizeMax.
+        """
+        chunk = parseChunk(data)
+        if chunk:
+            msgID, messageSZ, seq, total, payload = chunk
+            # drop the invalid frame header before allocate the buffer.
+            if not (cls.validSize(messageSZ, total, sizeMax) and seq < total): return None
+            assembler = cls(msgID, messageSZ, total)
+            assembler.addChunk(seq, payload)
+            return assembler
+        action, args = parseCtrlMsg(data)
+        if action == 'Send' and len(args) == 3:
+            try:
+                messageSZ, msgID, total = (int(arg) for arg in args)
+            except Exception:
+                return None
+            # drop the invalid header before allocate the buffer.
+            if cls.validSize(messageSZ, total, sizeMax): return cls(msgID, messageSZ, total)
+        return None
+
+    @staticmethod
+    def validSize(messageSZ, total, sizeMax=MSG_SZ_MAX):
+        """ Check the message size and chunks count from the untrusted header."""
+        return 1 <= total <= CHUNK_CNT_MAX and 0 <= messageSZ <= min(total * BUFFER_SZ_MAX, sizeMax)
+
+    def addChunk(self, seq, payload):
+        """ Put the chunk payload in the buffer, the last chunk fill the buffer end and
+            others are placed by sequence * payload size.
+        """
+        if seq >= self.total or self.received[seq]: return False
+        offset = self.messageSZ - len(payload) if seq == self.total - 1 else seq * len(payload)
+        if offset < 0 or offset + len(payload) > self.messageSZ: return False
+        self.data[offset:offset+len(payload)] = payload
+        self.received[seq] = 1
+        self.count += 1
+        return True
+
+    def isComplete(self):
+        return self.count == self.total
+
+    def getMissing(self):
+        return [seq for seq, flg in enumerate(self.received) if not flg]
+
+    def getData(self):
+        return bytes(self.data)
+
+    def takePending(self, pendingMsgs, srcAddr=None):
+        """ Add the chunks of this message which are already stashed in the pendingMsgs
+            deque of (data, address) while receiving another message, and remove them.
+        """
+        for item in [item for item in pendingMsgs if srcAddr is None or item[1] == srcAddr]:
+            chunk = parseChunk(item[0])
+            if chunk and chunk[0] == self.msgID:
+                self.addChunk(chunk[2], chunk[4])
+                pendingMsgs.remove(item)
+
+    def receiveFrom(self, sock, recvBuf, srcAddr=None):
+        """ Read one datagram into the reused recvBuf and add it if it is a chunk of
+            this message (the payload is copied once from recvBuf to the message buffer).
+            Returns:
+                tuple: (data, address), data is None if the datagram is a chunk frame 
+                    of this message from the srcAddr, else the datagram bytes.
+        """
+        nbytes, address = sock.recvfrom_into(recvBuf)
+        data = memoryview(recvBuf)[:nbytes]
+        chunk = parseChunk(data) if srcAddr is None or address == srcAddr else None
+        if chunk and chunk[0] == self.msgID:
+            self.addChunk(chunk[2], chunk[4])
+            return (None, address)
+        return (bytes(data), address)
+
+    def receive(self, sock, peerAddr, bufferSize, msgTimeout, srcAddr=None, stashFun=None):
+        """ Receive the rest chunks from the socket until the message is complete.
+            Args:
+                sock (socket): UDP socket to read the chunks.
+                peerAddr (tuple): the sender address to send the NACK.
+                bufferSize (int): socket read size.
+                msgTimeout (int): time (ms) to wait the next chunk before NACK the missing ones.
+                srcAddr (tuple, optional): only accept the chunks from this address.
+                stashFun (function, optional): stashFun(data, address) to keep the other
+                    incoming messages during receiving the chunks. Defaults drop them.
+            Returns:
+                bytes: the whole message data, None if some chunks are still missing
+                    after MSG_RETRY NACK rounds.
+        """
+        prevTimeout = sock.gettimeout()
+        sock.settimeout(msgTimeout/1000.0)
+        retry = 0
+        recvBuf = bytearray(bufferSize)
+        try:
+            while not self.isComplete():
+                try:
+                    count = self.count
+                    data, address = self.receiveFrom(sock, recvBuf, srcAddr=srcAddr)
+                except socket.timeout:
+                    retry += 1
+                    if retry > MSG_RETRY: break
+                    sock.sendto(buildNack(self.msgID, self.getMissing(), bufferSize), peerAddr)
+                    continue
+                if data is None:
+                    if self.count != count: retry = 0
+                    continue
+                if srcAddr and address != srcAddr:
+                    if stashFun: stashFun(data, address)
+                    continue
+                action, args = parseCtrlMsg(data)
+                if action == 'Sent' and args and args[0] == str(self.msgID):
+                    # sender finished sending: NACK the missing chunks immediately.
+                    sock.sendto(buildNack(self.msgID, self.getMissing(), bufferSize), peerAddr)
+                elif action == 'Send' and stashFun and len(args) == 3 and args[1] != str(self.msgID):
+                    # the sender gave up this message and started a new one.
+                    stashFun(data, address)
+                    break
+                elif action != 'Send' and stashFun:
+                    stashFun(data, address)
+        finally:
+            sock.settimeout(prevTimeout)
+        if self.isComplete(): return self.getData()
+        print("chunkAssembler;receive(): Data transfer error, chunks %s missing." % str(self.getMissing()))
+        return None
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class udpClient(object):
     """ UDP client module."""
-    def __init__(self, ipAddr):
+    def __init__(self, ipAddr, sockProfile=None):
         """ Create an ipv4 (AF_INET) socket object using the udp protocol (SOCK_DGRAM)
             init example: client = udpClient(('127.0.0.1', 502))
             Args:
                 ipAddr (tuple(str(), int())): IP address tuple ip + port.
+                sockProfile (str/dict, optional): socket options profile name in 
+                    SOCK_PROFILES or options dict. Defaults to None (OS default).
         """
         self.ipAddr = ipAddr
         self.bufferSize = BUFFER_SZ
-        self.chunkSize = max(1, self.bufferSize - 8) # make the chunk size 1 byte smaller than the bugger to send big message.
+        self.chunkSize = max(1, self.bufferSize - CHUNK_HDR.size) # make the chunk + frame header fit in the buffer.
+        self.msgTimeout = MSG_TIMEOUT
+        self.msgSizeMax = MSG_SZ_MAX
+        self.msgID = random.randint(0, MSG_ID_MAX)
+        self.recvDone = deque(maxlen=CACHE_SZ) # received big messages ID.
+        self.pendingMsgs = deque()  # messages arrived during receiving chunks.
+        self.mtuChunk = False       # cut the chunks to the path MTU.
         self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.setTimeOut()
+        if sockProfile: self.setSockProfile(sockProfile)
+
+#--udpClient-------------------------------------------------------------------
+    def _nextMsgID(self):
+        self.msgID = (self.msgID + 1) % (MSG_ID_MAX + 1)
+        return self.msgID
 
 #--udpClient-------------------------------------------------------------------
-    def receiveChunk(self, messageSZ):
-        """ recieve the chunks based on the data type
+    def receiveChunk(self, data, stashFun=None):
+        """ recieve the chunks of a big message.
             Args:
-                messageSZ (int): the whole message size
+                data (bytes): the big message header or the first arrived chunk frame.
+                stashFun (function, optional): stashFun(data, address) to keep the other
+                    messages arrived during receiving the chunks. Defaults drop them.
             Returns:
-                bytes: the whole data chunks.
+                bytes: the whole data chunks, None if the message is incomplete.
         """
-        receiveCount = ceil(messageSZ*1.0/self.chunkSize) # after python3 no need to *1.0
-        data = b''
-        try:
-            for _ in range(receiveCount):
-                subData, _ = self.client.recvfrom(self.bufferSize)
-                data += subData
-        except Exception as err:
-            print("udpClient;receiveChunk(): Data transfer error, some data missing.")
-            print("Error: %s" %str(err))
+        assembler = chunkAssembler.fromData(data, self.msgSizeMax)
+        if assembler is None:
+            print("udpClient;receiveChunk(): Big message header invalid: %s" % str(data))
+            return None
+        assembler.takePending(self.pendingMsgs)
+        data = assembler.receive(self.client, self.ipAddr, self.bufferSize, self.msgTimeout,
+                                 stashFun=stashFun)
+        if data is not None: self.recvDone.append(assembler.msgID)
         return data
 
+#--udpClient-------------------------------------------------------------------
+    def _sendFrame(self, frame, address):
+        if self.client: sendFrame(self.client, frame, address)
+
 #--udpClient-------------------------------------------------------------------
     def sendMsg(self, msg, resp=False, ipAddr=None):
         """ Convert the msg (smaller than the buffer size) to bytes and send it 
@@ -89,57 +512,104 @@ class udpClient(object):
             - resp: server response flag, method will wait server's response and 
                 return the bytes format response if it is set to True. 
         """
-        if not ipAddr is None: self.ipAddr = ipAddr  # reset ip address if needed.
+        if not ipAddr is None and ipAddr != self.ipAddr:
+            self.ipAddr = ipAddr  # reset ip address if needed.
+            if self.mtuChunk: self._updateChunkSize()
         if self.client is None: return None # Check whether disconnected.
         if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
         self.client.sendto(msg, self.ipAddr)
-        if resp:
-            try:
+        return self._recvReply() if resp else None
+
+#--udpClient-------------------------------------------------------------------
+    def _recvReply(self):
+        """ Wait and return the server's response, None if timeout or error."""
+        try:
+            data, _ = self.client.recvfrom(self.bufferSize)
+            # drop the late header/chunks of the big message already received.
+            while getBigMsgID(data) in self.recvDone:
                 data, _ = self.client.recvfrom(self.bufferSize)
-                if b'BM;Send' in data:
-                    _, _, messageSZ = data.decode(CODE_FMT).split(';') 
-                    data = self.receiveChunk(int(messageSZ))
-                return data
-            except Exception as error:
-                print("udpClient;sendMsg(): Can not connect to the server!")
-                print(error)
-                # self.disconnect() no need to diconnect if we want to do reconnect.
-                return None
-        return None
+            if data.startswith(CHUNK_TAG) or data.startswith(b'BM;Send'):
+                data = self.receiveChunk(data)
+            return data
+        except Exception as error:
+            print("udpClient;sendMsg(): Can not connect to the server!")
+            print(error)
+            # self.disconnect() no need to diconnect if we want to do reconnect.
+            return None
 
 #--udpClient-------------------------------------------------------------------
     def sendChunk(self, message, resp=False):
-        """ Send the message bigger than the buffer size to the server side.
+        """ Send the message bigger than the buffer size to the server side, the
+            chunks NACKed by the server will be resent if resp is True.
             Args:
-                message (str/bytes): _description_
-                resp (bool, optional): _description_. Defaults to False.
+                message (str/bytes): the big message.
+                resp (bool, optional): wait the server's response. Defaults to False.
             Returns:
-                _type_: server's response.
+                bytes: server's response.
         """
-        messageSZ = len(message)
-        sendCount = ceil(messageSZ/self.chunkSize)
-        # Step 1: tell server side the whole message size: BM;Send;<dataSize>
-        msg = ';'.join((BIG_MSG_FLG, 'Send', str(messageSZ))) 
-        reply = self.sendMsg(msg, resp=False)
-        # ready to receive big size message.
-        messageChunks = [ message[i:i+self.chunkSize] for i in range(0, messageSZ, self.chunkSize) ]
-        for data in messageChunks:
-            self.sendMsg(data, resp=False)
-            # finished send all the message.
-        msg = ';'.join((BIG_MSG_FLG, 'Sent', 'Finish'))
+        if not isinstance(message, bytes): message = str(message).encode(CODE_FMT)
+        msgID = self._nextMsgID()
+        frames = buildChunks(message, msgID, self.chunkSize)
+        if len(frames) > CHUNK_CNT_MAX:
+            print("udpClient;sendChunk(): Message size %s is too big." % str(len(message)))
+            return None
+        # Step 1: tell server side the whole message size: BM;Send;<dataSize>;<msgID>;<count>
+        header = ';'.join((BIG_MSG_FLG, 'Send', str(len(message)), str(msgID), str(len(frames))))
+        header = header.encode(CODE_FMT)
+        self.sendMsg(header, resp=False)
+        # Step 2: send all the chunk frames.
+        for frame in frames:
+            self._sendFrame(frame, self.ipAddr)
+        # Step 3: finished send all the message and resend the NACKed chunks.
+        msg = ';'.join((BIG_MSG_FLG, 'Sent', str(msgID)))
         reply = self.sendMsg(msg, resp=resp)
-        return reply
+        retry, missCount = 0, len(frames) + 1
+        while retry <= MSG_RETRY:
+            action, args = parseCtrlMsg(reply) if reply else (None, [])
+            if action != 'Nack': return reply
+            if args and args[0] == str(msgID):
+                # reset the retry count if the NACK rounds are making progress.
+                nackCount = len(args[1].split(',')) if len(args) > 1 and args[1] else len(frames)
+                retry = 0 if nackCount < missCount else retry + 1
+                missCount = nackCount
+                resendChunks(self._sendFrame, self.ipAddr, header, frames, args)
+                reply = self.sendMsg(msg, resp=resp)
+            else:
+                # late NACK of the previous message, read the next response.
+                reply = self._recvReply()
+        return None
+
+#--udpClient-------------------------------------------------------------------
+    def _updateChunkSize(self):
+        if self.mtuChunk:
+            self.chunkSize = getMtuChunkSize(self.bufferSize, self.ipAddr)
+        else:
+            self.chunkSize = max(1, self.bufferSize - CHUNK_HDR.size)
 
 #--udpClient-------------------------------------------------------------------
     def setBufferSize(self, bufferSize=BUFFER_SZ):
         """ Update the socket buffer size."""
-        if isinstance(bufferSize, int) and 1 < bufferSize < BUFFER_SZ_MAX:
+        if isinstance(bufferSize, int) and CHUNK_HDR.size < bufferSize < BUFFER_SZ_MAX:
             self.bufferSize = bufferSize
-            self.chunkSize = max(1, self.bufferSize-8)
+            self._updateChunkSize()
             return True
-        print("Error: the input buffer size must be a int 0 < x < 65507.")
+        print("Error: the input buffer size must be a int %s < x < 65507." % str(CHUNK_HDR.size))
         return False
 
+#--udpClient-------------------------------------------------------------------
+    def setSockProfile(self, profile):
+        """ Set the socket options profile (name in SOCK_PROFILES or options dict)."""
+        options = getSockProfile(profile)
+        if options is None or self.client is None: return False
+        self.mtuChunk = options['mtuChunk']
+        self._updateChunkSize()
+        return applySockOptions(self.client, options)
+
+#--udpClient-------------------------------------------------------------------
+    def getSockStats(self):
+        """ Return the socket kernel buffer sizes and receive drops counters dict."""
+        return getSockStats(self.client) if self.client else None
+
 #--udpClient-------------------------------------------------------------------
     def setTimeOut(self, timeoutT=20):
         if isinstance(timeoutT, int) and timeoutT > 0:
@@ -148,6 +618,26 @@ class udpClient(object):
         print("Error: the timeoutT must be a int x > 0 ")
         return False
 
+#--udpClient-------------------------------------------------------------------
+    def setMsgTimeout(self, timeoutMs=MSG_TIMEOUT):
+        """ Set the time (ms) to wait a missing big message chunk before NACK it."""
+        if isinstance(timeoutMs, int) and timeoutMs > 0:
+            self.msgTimeout = timeoutMs
+            return True
+        print("Error: the timeoutMs must be a int x > 0 ")
+        return False
+
+#--udpClient-------------------------------------------------------------------
+    def setMsgSizeMax(self, sizeMax=MSG_SZ_MAX):
+        """ Set the max size (bytes) of a received big message, the header of a bigger
+            message is dropped before allocate its buffer.
+        """
+        if isinstance(sizeMax, int) and sizeMax > 0:
+            self.msgSizeMax = sizeMax
+            return True
+        print("Error: the sizeMax must be a int x > 0 ")
+        return False
+
 #--udpClient-------------------------------------------------------------------
     def disconnect(self):
         """ Send a empty logout message and close the socket."""
@@ -157,97 +647,546 @@ class udpClient(object):
         # server computer is fast, this is not a problem.
 
         # Call shut down before close: https://docs.python.org/3/library/socket.html#socket.socket.shutdown
-        self.client.shutdown(socket.SHUT_RDWR)
+        try:
+            self.client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass # not connected UDP socket can not be shut down on Linux.
         self.client.close()
         self.client = None
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class udpPipeClient(udpClient):
+    """ UDP client with request pipelining, several requests can be outstanding at 
+        the same time and a receiver thread routes every reply to its request's 
+        future (and callback) by the correlation ID parsed from the reply.
+    """
+    def __init__(self, ipAddr, replyIDFun, reqTimeout=20, pushHandler=None, sockProfile=None):
+        """ init example: client = udpPipeClient(('127.0.0.1', 3001), parseCorrID)
+            Args:
+                ipAddr (tuple(str(), int())): IP address tuple ip + port.
+                replyIDFun (function): replyIDFun(reply) return the correlation ID of 
+                    the reply bytes (None if not found).
+                reqTimeout (int, optional): seconds to wait the reply before the request 
+                    fail. Defaults to 20.
+                pushHandler (function, optional): pushHandler(msg) called in the receiver
+                    thread with the message not matching any request. Defaults to None.
+                sockProfile (str/dict, optional): socket options profile. Defaults to None.
+        """
+        super().__init__(ipAddr, sockProfile=sockProfile)
+        self.replyIDFun = replyIDFun
+        self.reqTimeout = reqTimeout
+        self.pushHandler = pushHandler
+        self.pendings = {}  # corrID -> (future, callback, deadline)
+        self.lock = threading.Lock()
+        # receiver wake up interval to expire the timeout requests.
+        self.client.settimeout(RESP_TIME*10)
+        self.recvThread = threading.Thread(target=self._recvLoop, daemon=True)
+        self.recvThread.start()
+
+#--udpPipeClient---------------------------------------------------------------
+    def _finish(self, corrID, reply):
+        """ Set the request result and call its callback, return False if the request
+            is not outstanding (late reply).
+        """
+        with self.lock:
+            item = self.pendings.pop(corrID, None)
+        if item is None: return False
+        future, callback, _ = item
+        future.set_result(reply)
+        if callback:
+            try:
+                callback(reply)
+            except Exception as err:
+                print("udpPipeClient: Request %s callback error: %s" %(str(corrID), str(err)))
+        return True
+
+#--udpPipeClient---------------------------------------------------------------
+    def _recvLoop(self):
+        """ Receive the replies and route them to the outstanding requests."""
+        sock = self.client
+        while True:
+            if not self.pendingMsgs:
+                try:
+                    self.pendingMsgs.append(sock.recvfrom(self.bufferSize))
+                except socket.timeout:
+                    pass
+                except OSError:
+                    break   # socket closed.
+            data = self.pendingMsgs.popleft()[0] if self.pendingMsgs else None
+            if data and not getBigMsgID(data) in self.recvDone:
+                if data.startswith(CHUNK_TAG) or data.startswith(b'BM;Send'):
+                    # keep the other replies arrived during receiving the chunks.
+                    data = self.receiveChunk(data, stashFun=lambda msg, addr: self.pendingMsgs.append((msg, addr)))
+                try:
+                    corrID = self.replyIDFun(data) if data else None
+                except Exception:
+                    corrID = None
+                if not self._finish(corrID, data) and data and self.pushHandler:
+                    try:
+                        self.pushHandler(data)
+                    except Exception as err:
+                        print("udpPipeClient: Push message handler error: %s" % str(err))
+            # fail the requests which didn't get reply in time.
+            now = time.time()
+            with self.lock:
+                expired = [corrID for corrID, item in self.pendings.items() if item[2] < now]
+            for corrID in expired: self._finish(corrID, None)
+        with self.lock:
+            remains = list(self.pendings.keys())
+        for corrID in remains: self._finish(corrID, None)
+
+#--udpPipeClient---------------------------------------------------------------
+    def sendRequest(self, msg, corrID, callback=None):
+        """ Send a request without waiting its reply.
+            Args:
+                msg (str/bytes): request message carrying the correlation ID.
+                corrID (str): correlation ID the server will put in the reply.
+                callback (function, optional): callback(reply) called in the receiver 
+                    thread when the reply arrives, reply is None if timeout.
+            Returns:
+                concurrent.futures.Future: future of the reply bytes (None if timeout).
+        """
+        future = Future()
+        if self.client is None:
+            future.set_result(None)
+            return future
+        with self.lock:
+            self.pendings[corrID] = (future, callback, time.time() + self.reqTimeout)
+        try:
+            super().sendMsg(msg, resp=False)
+        except Exception as err:
+            print("udpPipeClient;sendRequest(): Can not send request: %s" % str(err))
+            self._finish(corrID, None)
+        return future
+
+#--udpPipeClient---------------------------------------------------------------
+    def setPushHandler(self, pushHandler):
+        """ Set the handler of the server push messages (None to drop them)."""
+        self.pushHandler = pushHandler
+
+#--udpPipeClient---------------------------------------------------------------
+    def sendMsg(self, msg, resp=False, ipAddr=None):
+        """ Send the msg without waiting reply (the receiver thread owns the socket 
+            reading), use sendRequest() for the request needs a reply.
+        """
+        return super().sendMsg(msg, resp=False, ipAddr=ipAddr)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class udpServer(object):
     """ UDP server module."""
-    def __init__(self, parent, port):
+    def __init__(self, parent, port, sockProfile=None, host='0.0.0.0'):
         """ Create an ipv4 (AF_INET) socket object using the tcp protocol (SOCK_STREAM)
-            init example: server = udpServer(None, 5005)
+            init example: server = udpServer(None, 5005, sockProfile='burst')
+            sockProfile (str/dict, optional): socket options profile name in SOCK_PROFILES
+                or options dict, set before bind. Defaults to None (OS default).
+            host (str, optional): bind address, '127.0.0.1' for local service only. 
+                Defaults to '0.0.0.0'.
         """
         self.bufferSize = BUFFER_SZ
-        self.chunkSize = max(1, self.bufferSize-8)
+        self.chunkSize = max(1, self.bufferSize - CHUNK_HDR.size)
+        self.msgTimeout = MSG_TIMEOUT
+        self.msgSizeMax = MSG_SZ_MAX
+        self.msgID = random.randint(0, MSG_ID_MAX)
+        self.sentCache = OrderedDict()          # (address, msgID) -> (header, frames) for resend.
+        self.recvDone = deque(maxlen=CACHE_SZ)  # received big messages (address, msgID).
+        self.pendingMsgs = deque()              # messages arrived during receiving chunks.
+        self.addrFlg = False                    # pass the client address to the handler.
+        self.mtuChunk = False                   # cut the chunks to the path MTU.
+        self.mtuChunkSizes = {}                 # client ip -> chunk size fits the path MTU.
         self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server.bind(('0.0.0.0', port))
+        if sockProfile: self.setSockProfile(sockProfile)
+        self.server.bind((host, port))
         self.terminate = False  # Server terminate flag.
 
 #--udpServer-------------------------------------------------------------------
-    def receiveChunk(self, messageSZ):
-        """ recieve the chunks based on the data type
+    def _nextMsgID(self):
+        self.msgID = (self.msgID + 1) % (MSG_ID_MAX + 1)
+        return self.msgID
+
+#--udpServer-------------------------------------------------------------------
+    def _stashMsg(self, data, address):
+        self.pendingMsgs.append((data, address))
+
+#--udpServer-------------------------------------------------------------------
+    def _sendto(self, data, address):
+        sendFrame(self.server, data, address)
+
+#--udpServer-------------------------------------------------------------------
+    def _reply(self, msg, address):
+        """ Send the handler's reply to the client, the reply bigger than the buffer
+            will be sent as a big message.
+        """
+        if msg is None: return  # don't response client if the handler feed back is None
+        if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
+        if len(msg) < self.bufferSize:
+            self._sendto(msg, address)
+        else:
+            self.sendChunk(msg, address)
+
+#--udpServer-------------------------------------------------------------------
+    def receiveChunk(self, data, address):
+        """ recieve the chunks of a big message from the client.
             Args:
-                messageSZ (int): the whole message size
+                data (bytes): the big message header or the first arrived chunk frame.
+                address (tuple): client address.
             Returns:
-                bytes: the whole data Chunks.
+                bytes: the whole data Chunks, None if the message is incomplete.
         """
-        receiveCount = ceil(messageSZ/self.chunkSize)
-        data = b''
-        try:
-            for _ in range(receiveCount):
-                subData, _ = self.server.recvfrom(self.bufferSize)
-                data += subData
-        except Exception as err:
-            print("udpServer;receiveChunk(): Data transfer error, some data missing.")
-            print("Error: %s" %str(err))
+        assembler = chunkAssembler.fromData(data, self.msgSizeMax)
+        if assembler is None:
+            print("udpServer;receiveChunk(): Big message header invalid: %s" % str(data))
+            return None
+        assembler.takePending(self.pendingMsgs, srcAddr=address)
+        data = assembler.receive(self.server, address, self.bufferSize, self.msgTimeout,
+                                 srcAddr=address, stashFun=self._stashMsg)
+        if data is not None: self.recvDone.append((address, assembler.msgID))
         return data
 
 #--udpServer-------------------------------------------------------------------
-    def serverStart(self, handler=None):
-        """ Start the UDP server to handle the incomming message."""
+    def _handleBigMsg(self, data, address):
+        """ Handle the big message header/chunk/control message, return the whole
+            message if received or None.
+        """
+        action, args = parseCtrlMsg(data)
+        if action == 'Nack':
+            key = (address, int(args[0])) if args and args[0].isdigit() else None
+            if key in self.sentCache:
+                header, frames = self.sentCache[key]
+                resendChunks(self._sendto, address, header, frames, args)
+            return None
+        if action == 'Sent':
+            # the header and all chunks are lost, ask the client resend the whole message.
+            if args and args[0].isdigit() and (address, int(args[0])) not in self.recvDone:
+                self._sendto(buildNack(args[0], [], self.bufferSize), address)
+            return None
+        if (address, getBigMsgID(data)) in self.recvDone: return None # late header/chunk.
+        return self.receiveChunk(data, address)
+
+#--udpServer-------------------------------------------------------------------
+    def serverStart(self, handler=None, addrFlg=False):
+        """ Start the UDP server to handle the incomming message.
+            Args:
+                handler (function, optional): handler(msg) return the reply. Defaults to None.
+                addrFlg (bool, optional): True: call handler(msg, address) with the client 
+                    address. Defaults to False.
+        """
+        self.addrFlg = addrFlg
         while not self.terminate:
-            data, address = self.server.recvfrom(self.bufferSize)
+            if self.pendingMsgs:
+                data, address = self.pendingMsgs.popleft()
+            else:
+                data, address = self.server.recvfrom(self.bufferSize)
             # Check whether the message is a big message
-            if b'BM;Send' in data:
-                bmMsg = data.decode(CODE_FMT)
-                _, _, size = bmMsg.split(';')
-                data = self.receiveChunk(int(size))
-                subData, _ = self.server.recvfrom(self.bufferSize)
+            if data.startswith(CHUNK_TAG) or data.startswith(b'BM;'):
+                data = self._handleBigMsg(data, address)
+                if data is None: continue
             print("Accepted connection from %s" % str(address))
-            msg = handler(data) if not handler is None else data
-            if not msg is None:  # don't response client if the handler feed back is None
-                if not isinstance(msg, bytes): msg = str(msg).encode(CODE_FMT)
-                if len(msg) < self.bufferSize:
-                    self.server.sendto(msg, address)
-                else:
-                    self.sendChunk(msg, address)
+            if handler is None:
+                msg = data
+            else:
+                msg = handler(data, address) if self.addrFlg else handler(data)
+            self._reply(msg, address)
         # close the server.
         self.server.close()
 
-#--udpClient-------------------------------------------------------------------
+#--udpServer-------------------------------------------------------------------
+    def _getChunkSize(self, address):
+        """ Return the chunk payload size of the big message sent to the client."""
+        if not self.mtuChunk: return self.chunkSize
+        chunkSize = self.mtuChunkSizes.get(address[0])
+        if chunkSize is None:
+            if len(self.mtuChunkSizes) > MTU_CACHE_SZ: self.mtuChunkSizes.clear()
+            chunkSize = self.mtuChunkSizes[address[0]] = getMtuChunkSize(self.bufferSize, address)
+        return chunkSize
+
+#--udpServer-------------------------------------------------------------------
     def setBufferSize(self, bufferSize=BUFFER_SZ):
-        if isinstance(bufferSize, int) and 1 < bufferSize < BUFFER_SZ_MAX:
+        if isinstance(bufferSize, int) and CHUNK_HDR.size < bufferSize < BUFFER_SZ_MAX:
             self.bufferSize = bufferSize
-            self.chunkSize = max(1, self.bufferSize-8)
+            self.chunkSize = max(1, self.bufferSize - CHUNK_HDR.size)
+            self.mtuChunkSizes.clear()
             return True
-        print("Error: the input buffer size must be a int 1 < x < 65507.")
+        print("Error: the input buffer size must be a int %s < x < 65507." % str(CHUNK_HDR.size))
         return False
 
-#--udpClient-------------------------------------------------------------------
+#--udpServer-------------------------------------------------------------------
+    def setSockProfile(self, profile):
+        """ Set the socket options profile (name in SOCK_PROFILES or options dict), 
+            the reusePort option is ignored after the server socket is bound.
+        """
+        options = getSockProfile(profile)
+        if options is None: return False
+        if options['reusePort'] and self.server.getsockname()[1]:
+            print("Warning: SO_REUSEPORT needs to be set when init the server.")
+            options['reusePort'] = False
+        self.mtuChunk = options['mtuChunk']
+        self.mtuChunkSizes.clear()
+        return applySockOptions(self.server, options)
+
+#--udpServer-------------------------------------------------------------------
+    def getSockStats(self):
+        """ Return the socket kernel buffer sizes and receive drops counters dict."""
+        return getSockStats(self.server)
+
+#--udpServer-------------------------------------------------------------------
+    def setMsgTimeout(self, timeoutMs=MSG_TIMEOUT):
+        """ Set the time (ms) to wait a missing big message chunk before NACK it."""
+        if isinstance(timeoutMs, int) and timeoutMs > 0:
+            self.msgTimeout = timeoutMs
+            return True
+        print("Error: the timeoutMs must be a int x > 0 ")
+        return False
+
+#--udpServer-------------------------------------------------------------------
+    def setMsgSizeMax(self, sizeMax=MSG_SZ_MAX):
+        """ Set the max size (bytes) of a received big message, the header of a bigger
+            message is dropped before allocate its buffer.
+        """
+        if isinstance(sizeMax, int) and sizeMax > 0:
+            self.msgSizeMax = sizeMax
+            return True
+        print("Error: the sizeMax must be a int x > 0 ")
+        return False
+
+#--udpServer-------------------------------------------------------------------
     def sendChunk(self, message, address):
-        """ reply the message bigger than the buffer size to the client side.
+        """ reply the message bigger than the buffer size to the client side, the
+            chunks are cached to resend the ones NACKed by the client.
             Args:
-                message (str/bytes): _description_
-                resp (bool, optional): _description_. Defaults to False.
-            Returns:
-                _type_: server's response.
+                message (bytes): the big message.
+                address (tuple): client address.
+        """
+        msgID = self._nextMsgID()
+        frames = buildChunks(message, msgID, self._getChunkSize(address))
+        if len(frames) > CHUNK_CNT_MAX:
+            print("udpServer;sendChunk(): Message size %s is too big." % str(len(message)))
+            return
+        # Step 1: tell client side the whole message size: BM;Send;<dataSize>;<msgID>;<count>
+        header = ';'.join((BIG_MSG_FLG, 'Send', str(len(message)), str(msgID), str(len(frames))))
+        header = header.encode(CODE_FMT)
+        self.sentCache[(address, msgID)] = (header, frames)
+        while len(self.sentCache) > CACHE_SZ: self.sentCache.popitem(last=False)
+        self._sendto(header, address)
+        for frame in frames:
+            self._sendto(frame, address)
+
+#--udpServer-------------------------------------------------------------------
+    def pushMsg(self, msg, address):
+        """ Send a message to the client which is not a reply of the client's request
+            (the client address is got from handler(msg, address)).
         """
-        messageSZ = len(message)
-        sendCount = ceil(messageSZ/self.chunkSize) if messageSZ > self.bufferSize else 1
-        # Step 1: tell server side the whole message size: BM;Send;<dataSize>
-        msg = ';'.join((BIG_MSG_FLG, 'Send', str(messageSZ)))
-        self.server.sendto(msg.encode(CODE_FMT), address)
-        # ready to receive big size message.
-        messageChunks = [ message[i:i+self.chunkSize] for i in range(0, messageSZ, self.chunkSize) ]
-        for data in messageChunks:
-            self.server.sendto(data, address)
+        self._reply(msg, address)
 
 #--udpServer-------------------------------------------------------------------
     def serverStop(self):
         self.terminate = True
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class udpServerProtocol(asyncio.DatagramProtocol):
+    """ asyncio datagram protocol to pass the incoming datagrams to the udpAsyncServer."""
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.server.transport = transport
+
+    def datagram_received(self, data, address):
+        self.server.datagramReceived(data, address)
+
+    def error_received(self, exc):
+        print("udpServerProtocol: Socket error: %s" % str(exc))
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class udpAsyncServer(udpServer):
+    """ Non-blocking multi-client UDP server module, drop-in replacement of the 
+        udpServer. Every client's big messages are reassembled independently and 
+        the handler calls are dispatched to a worker thread pool (or awaited if the
+        handler is a coroutine function) so they will not block each other. At most
+        dispatchMax messages are handled at the same time, the messages arrived 
+        when all of them are busy are dropped and counted (dispatchDrops).
+    """
+    def __init__(self, parent, port, workers=MAX_WORKERS, sockProfile=None, dispatchMax=DISPATCH_MAX):
+        """ init example: server = udpAsyncServer(None, 5005, workers=4)"""
+        super().__init__(parent, port, sockProfile=sockProfile)
+        self.server.setblocking(False)
+        self.workers = workers
+        self.dispatchMax = dispatchMax
+        self.dispatchTasks = set()  # messages in handling.
+        self.dispatchDrops = 0      # messages dropped because dispatchMax messages are in handling.
+        self.handler = None
+        self.executor = None
+        self.loop = None
+        self.transport = None
+        self.stopEvent = None
+        self.assemblers = {}    # (address, msgID) -> big message reassembly state.
+        self.ipMsgCount = {}    # source IP -> number of the big messages in the assemblers.
+        self.pendingSize = 0    # total buffer bytes of the big messages in the assemblers.
+
+#--udpAsyncServer--------------------------------------------------------------
+    def _sendto(self, data, address):
+        # the asyncio transport doesn't support scatter send, join the chunk frame.
+        if isinstance(data, tuple): data = b''.join(data)
+        if self.transport: self.transport.sendto(data, address)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def _armTimer(self, key):
+        """ (Re)start the big message timer to NACK the missing chunks."""
+        state = self.assemblers[key]
+        if state['timer']: state['timer'].cancel()
+        state['timer'] = self.loop.call_later(self.msgTimeout/1000.0, self._onMsgTimeout, key)
+
+    def _onMsgTimeout(self, key):
+        state = self.assemblers.get(key)
+        if state is None: return
+        state['retry'] += 1
+        if state['retry'] > MSG_RETRY:
+            print("udpAsyncServer: Data transfer error, chunks %s missing." % str(state['assembler'].getMissing()))
+            self._removeState(key)
+            return
+        self._sendto(buildNack(key[1], state['assembler'].getMissing(), self.bufferSize), key[0])
+        state['timer'] = self.loop.call_later(self.msgTimeout/1000.0, self._onMsgTimeout, key)
+
+    def _removeState(self, key):
+        state = self.assemblers.pop(key)
+        if state['timer']: state['timer'].cancel()
+        self.pendingSize -= state['assembler'].messageSZ
+        ipAddr = key[0][0]
+        count = self.ipMsgCount.get(ipAddr, 0) - 1
+        if count > 0:
+            self.ipMsgCount[ipAddr] = count
+        else:
+            self.ipMsgCount.pop(ipAddr, None)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def receiveChunk(self, data, address):
+        """ Add the big message header/chunk to the client's reassembly state.
+            Returns:
+                bytes: the whole data chunks if all received, else None.
+        """
+        key = (address, getBigMsgID(data))
+        state = self.assemblers.get(key)
+        if state is None:
+            # limit the buffers one sender IP (or all the senders) can make the server allocate.
+            if len(self.assemblers) >= PENDING_MSG_MAX or self.ipMsgCount.get(address[0], 0) >= PENDING_ADDR_MAX:
+                print("udpAsyncServer;receiveChunk(): Too many big messages pending, drop %s from %s" 
+                      % (str(key[1]), str(address)))
+                return None
+            assembler = chunkAssembler.fromData(data, self.msgSizeMax)
+            if assembler is None:
+                print("udpAsyncServer;receiveChunk(): Big message header invalid: %s" % str(data))
+                return None
+            if self.pendingSize + assembler.messageSZ > PENDING_SZ_MAX:
+                print("udpAsyncServer;receiveChunk(): Big messages pending size over limit, drop %s from %s" 
+                      % (str(key[1]), str(address)))
+                return None
+            state = self.assemblers[key] = {'assembler': assembler, 'retry': 0, 'timer': None}
+            self.ipMsgCount[address[0]] = self.ipMsgCount.get(address[0], 0) + 1
+            self.pendingSize += assembler.messageSZ
+        else:
+            chunk = parseChunk(data)
+            if chunk and state['assembler'].addChunk(chunk[2], chunk[4]): state['retry'] = 0
+        if state['assembler'].isComplete():
+            self._removeState(key)
+            self.recvDone.append(key)
+            return state['assembler'].getData()
+        self._armTimer(key)
+        return None
+
+#--udpAsyncServer--------------------------------------------------------------
+    def _handleBigMsg(self, data, address):
+        action, args = parseCtrlMsg(data)
+        if action == 'Sent' and args and args[0].isdigit():
+            state = self.assemblers.get((address, int(args[0])))
+            if state:
+                # client finished sending: NACK the missing chunks immediately.
+                self._sendto(buildNack(args[0], state['assembler'].getMissing(), self.bufferSize), address)
+                return None
+        return super()._handleBigMsg(data, address)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def datagramReceived(self, data, address):
+        """ Handle one incoming datagram (called by the event loop)."""
+        if data.startswith(CHUNK_TAG) or data.startswith(b'BM;'):
+            data = self._handleBigMsg(data, address)
+            if data is None: return
+        if len(self.dispatchTasks) >= self.dispatchMax:
+            self.dispatchDrops += 1
+            return
+        task = self.loop.create_task(self._dispatch(data, address))
+        self.dispatchTasks.add(task)
+        task.add_done_callback(self.dispatchTasks.discard)
+
+#--udpAsyncServer--------------------------------------------------------------
+    async def _dispatch(self, data, address):
+        """ Call the handler with the message and reply the result to the client."""
+        try:
+            args = (data, address) if self.addrFlg else (data, )
+            if self.handler is None:
+                msg = data
+            elif asyncio.iscoroutinefunction(self.handler):
+                msg = await self.handler(*args)
+            else:
+                msg = await self.loop.run_in_executor(self.executor, self.handler, *args)
+        except Exception as err:
+            print("udpAsyncServer;_dispatch(): Handler error: %s" % str(err))
+            return
+        self._reply(msg, address)
+
+#--udpAsyncServer--------------------------------------------------------------
+    async def _serve(self):
+        self.stopEvent = asyncio.Event()
+        await self.loop.create_datagram_endpoint(lambda: udpServerProtocol(self), sock=self.server)
+        if not self.terminate: await self.stopEvent.wait()
+        for state in self.assemblers.values():
+            if state['timer']: state['timer'].cancel()
+        # cancel the messages in handling before close the loop.
+        for task in self.dispatchTasks: task.cancel()
+        if self.dispatchTasks: await asyncio.gather(*self.dispatchTasks, return_exceptions=True)
+        self.transport.close()
+
+#--udpAsyncServer--------------------------------------------------------------
+    def serverStart(self, handler=None, addrFlg=False):
+        """ Start the UDP server event loop to handle the incomming message, the 
+            function will block until serverStop() is called.
+        """
+        self.handler = handler
+        self.addrFlg = addrFlg
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            self.loop.close()
+            self.executor.shutdown(wait=False)
+            self.server.close()
+
+#--udpAsyncServer--------------------------------------------------------------
+    def getSockStats(self):
+        """ Return the socket stats dict with the dropped messages count 'dispatchDrops'."""
+        stats = getSockStats(self.server)
+        stats['dispatchDrops'] = self.dispatchDrops
+        return stats
+
+#--udpAsyncServer--------------------------------------------------------------
+    def pushMsg(self, msg, address):
+        """ Send a message to the client, this function can be called from any thread."""
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._reply, msg, address)
+
+#--udpAsyncServer--------------------------------------------------------------
+    def serverStop(self):
+        """ Stop the server, this function can be called from any thread."""
+        self.terminate = True
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._setStop)
+
+    def _setStop(self):
+        if self.stopEvent: self.stopEvent.set()
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 # Use case program: udpComTest.py
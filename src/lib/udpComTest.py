@@ -12,10 +12,13 @@
 # License:     MIT License 
 #-----------------------------------------------------------------------------
 
+import os
 import time
+import socket
 import random
 import string
 import threading    # create multi-thread test case.
+import contextlib
 import udpCom
 
 UDP_PORT = 5005
@@ -23,16 +26,17 @@ UDP_PORT = 5005
 #-----------------------------------------------------------------------------
 class testThread(threading.Thread):
     """ Thread to test the UDP server/insert the tcp server in other program.""" 
-    def __init__(self, parent, threadID, name):
+    def __init__(self, parent, threadID, name, asyncMode=False):
         threading.Thread.__init__(self)
         self.threadName = name
-        self.server = udpCom.udpServer(None, UDP_PORT)
+        self.server = udpCom.udpAsyncServer(None, UDP_PORT) if asyncMode else udpCom.udpServer(None, UDP_PORT)
 
     def msgHandler(self, msg):
         """ The test handler method passed into the UDP server to handle the 
             incoming messages.
         """
         print("Incomming message: %s" %str(msg))
+        if msg.startswith(b'slow'): time.sleep(1) # simulate a slow request.
         return msg
 
     def run(self):
@@ -52,6 +56,34 @@ class testThread(threading.Thread):
         endClient.disconnect()
         endClient = None
 
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class lossyClient(udpCom.udpClient):
+    """ UDP client to simulate the network drop the big message chunk <dropSeq> once
+        and deliver all the other chunks in reverse order.
+    """
+    def __init__(self, ipAddr, dropSeq=1):
+        super().__init__(ipAddr)
+        self.dropSeq = dropSeq
+        self.frameBuf = []
+
+    def _sendFrame(self, frame, address):
+        chunk = udpCom.parseChunk(frame[0]) if isinstance(frame, tuple) else None
+        if chunk:
+            if chunk[2] == self.dropSeq:
+                self.dropSeq = None
+            else:
+                self.frameBuf.append(frame)
+            return None
+        return super()._sendFrame(frame, address)
+
+    def sendMsg(self, msg, resp=False, ipAddr=None):
+        if str(msg).startswith('BM;Sent'):
+            for frame in reversed(self.frameBuf):
+                super()._sendFrame(frame, self.ipAddr)
+            self.frameBuf = []
+        return super().sendMsg(msg, resp=resp, ipAddr=ipAddr)
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 
@@ -163,6 +195,107 @@ def testCase(mode):
         print(rpl)
         print(" - Message send and receive test passed: %s" %str(msg==rpl))
         servThread.stop()
+    elif mode == '4':
+        print("Start big message chunks lost and out of order test. test mode: %s \n" % str(mode))
+        testBFSize = 100
+        servThread = testThread(None, 0, "server thread")
+        servThread.setBufferSize(testBFSize)
+        servThread.start()
+        client = lossyClient(('127.0.0.1', UDP_PORT), dropSeq=1)
+        client.setBufferSize(testBFSize)
+        msg = getRandomStr(400)
+        startT = time.time()
+        rpl = client.sendChunk(msg, resp=True)
+        print(" - Lost chunk resend test passed: %s" %str(msg.encode('utf-8') == rpl))
+        print(" - Message transfer time: %s sec" %str(round(time.time()-startT, 3)))
+        servThread.stop()
+    elif mode == '5':
+        print("Start async server multi-client test. test mode: %s \n" % str(mode))
+        servThread = testThread(None, 0, "server thread", asyncMode=True)
+        servThread.setBufferSize(100)
+        servThread.start()
+        time.sleep(0.2)
+        results = {}
+        def clientRun(idx, msg):
+            client = udpCom.udpClient(('127.0.0.1', UDP_PORT))
+            client.setBufferSize(100)
+            results[idx] = (msg == client.sendChunk(msg, resp=True)) if len(msg) > 50 \
+                else (msg == client.sendMsg(msg, resp=True))
+        slowClient = threading.Thread(target=clientRun, args=(0, b'slow request'))
+        slowClient.start()
+        time.sleep(0.1)
+        startT = time.time()
+        clients = [threading.Thread(target=clientRun, args=(i, getRandomStr(400).encode('utf-8')))
+                   for i in range(1, 4)]
+        for client in clients: client.start()
+        for client in clients: client.join()
+        fastT = time.time() - startT
+        slowClient.join()
+        print(" - All clients reply test passed: %s" %str(all(results.values()) and len(results) == 4))
+        print(" - Not blocked by slow request test passed: %s (%s sec)" %(str(fastT < 0.5), str(round(fastT, 3))))
+        servThread.server.serverStop()
+    elif mode == '6':
+        print("Start socket options profile and kernel drops test. test mode: %s \n" % str(mode))
+        server = udpCom.udpServer(None, UDP_PORT, sockProfile={'rcvBuf': 4096, 'reusePort': True})
+        # SO_REUSEPORT: the second server can bind the same port.
+        udpCom.udpServer(None, UDP_PORT, sockProfile='shard').server.close()
+        print(" - Shard profile port reuse test passed: True")
+        print(" - Unknown profile test passed: %s" % str(not server.setSockProfile('unknown')))
+        client = udpCom.udpClient(('127.0.0.1', UDP_PORT), sockProfile='lowLatency')
+        tosFlg = client.client.getsockopt(socket.IPPROTO_IP, socket.IP_TOS) == 0xB8
+        print(" - DSCP/TOS mark test passed: %s" % str(tosFlg))
+        mtu = udpCom.getPathMtu(('127.0.0.1', UDP_PORT))
+        chunkFlg = client.chunkSize == min(client.bufferSize, (mtu or udpCom.BUFFER_SZ_MAX) - udpCom.UDP_HDR_SZ) - udpCom.CHUNK_HDR.size
+        print(" - Path MTU (%s) chunk size test passed: %s" %(str(mtu), str(chunkFlg)))
+        # the server sockets are not read, the small receive buffer overflows.
+        for _ in range(400): client.sendMsg(b'x'*1000, resp=False)
+        stats = server.getSockStats()
+        print(" - Kernel drops counter: %s" % str(stats))
+        print(" - Kernel drops test passed: %s" % str(stats['drops'] is None or stats['drops'] > 0))
+        server.server.close()
+    elif mode == '7':
+        print("Start async server flood test. test mode: %s \n" % str(mode))
+        servThread = testThread(None, 0, "server thread", asyncMode=True)
+        servThread.start()
+        time.sleep(0.2)
+        server = servThread.server
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        address = ('127.0.0.1', UDP_PORT)
+        # the server prints every dropped header, redirect it during the flood.
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for i in range(200):
+                sock.sendto(b'BM;Send;%d;%d;%d' % (udpCom.MSG_SZ_MAX+1, i, 0xFFFF), address)
+                sock.sendto(udpCom.CHUNK_HDR.pack(udpCom.CHUNK_TAG, 1000+i, 0xFFFFFFFF, 0, 0xFFFF) + b'x', address)
+            time.sleep(0.2)
+            oversizeFlg = len(server.assemblers) == 0 and server.pendingSize == 0
+            # valid size headers: only PENDING_ADDR_MAX messages of one IP are kept.
+            for i in range(200):
+                sock.sendto(b'BM;Send;%d;%d;%d' % (udpCom.MSG_SZ_MAX, 2000+i, 200), address)
+            time.sleep(0.2)
+            pendingFlg = len(server.assemblers) <= udpCom.PENDING_ADDR_MAX \
+                and server.pendingSize <= udpCom.PENDING_SZ_MAX
+        print(" - Oversized headers rejected test passed: %s" % str(oversizeFlg))
+        print(" - Pending messages of one IP bounded test passed: %s (%s pending, %s bytes)" 
+              %(str(pendingFlg), str(len(server.assemblers)), str(server.pendingSize)))
+        client = udpCom.udpClient(address)
+        print(" - Server still serving test passed: %s" % str(client.sendMsg(b'ping', resp=True) == b'ping'))
+        client.disconnect()
+        server.serverStop()
+        # slow requests flood: the messages over the dispatchMax are dropped and counted.
+        server = udpCom.udpAsyncServer(None, UDP_PORT+1, dispatchMax=2)
+        servThread = threading.Thread(target=server.serverStart, kwargs={'handler': lambda msg: time.sleep(1)})
+        servThread.start()
+        time.sleep(0.2)
+        for _ in range(10): sock.sendto(b'slow request', ('127.0.0.1', UDP_PORT+1))
+        time.sleep(0.2)
+        stats = server.getSockStats()
+        print(" - Messages in handling bounded test passed: %s (%s dropped)" 
+              %(str(stats['dispatchDrops'] == 8), str(stats['dispatchDrops'])))
+        # stop with messages in handling: the dispatch tasks are cancelled before the loop closed.
+        server.serverStop()
+        servThread.join(2)
+        print(" - Stop with messages in handling test passed: %s" % str(not servThread.is_alive()))
+        sock.close()
     else:
         print("Input %s is not valid, program terminate." % str(uInput))
 
@@ -173,6 +306,10 @@ if __name__ == '__main__':
         \t (0) Auto test,\n\
         \t (1) UDP echo server,\n\
         \t (2) UDP client\n\
-        \t (3) Test send big message bigger than buffer")
+        \t (3) Test send big message bigger than buffer,\n\
+        \t (4) Test big message chunks lost and out of order,\n\
+        \t (5) Test async server with multiple clients,\n\
+        \t (6) Test socket options profile and kernel drops counter,\n\
+        \t (7) Test async server big message header and slow requests flood")
     uInput = str(input())
     testCase(uInput)
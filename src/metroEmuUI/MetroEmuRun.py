@@ -3,7 +3,8 @@
 # Name:        MetroEmuRun.py
 #
 # Purpose:     This module is the main wx-frame for the metro railway and signal
-#              sysetm emulator.
+#              sysetm emulator, the frame is the viewer of the realworld simulation
+#              core <metroEmuCore.py> (run the core module directly to run headless).
 #
 # Author:      Yuancheng Liu
 #
@@ -19,10 +20,9 @@ import json
 
 import wx
 import metroEmuGobal as gv
-import railwayMgr as mapMgr
+import metroEmuCore as core
 import railwayPanel as pnlFunction
 import railwayPanelMap as pnlMap
-import dataMgr as dm
 
 FRAME_SIZE = (1800, 1030)
 
@@ -48,36 +48,23 @@ class UIFrame(wx.Frame):
         # Add the bottom status bar under single line mode.
         self.statusbar = self.CreateStatusBar(1)
         self.statusbar.SetStatusText('Test mode: %s' %str(gv.gTestMD))
-        # Set the periodic call back
-        self.updateLock = False
-        # Define the data manager parallel thread.
-        gv.iDataMgr = dm.DataManager(self)
-        gv.iDataMgr.start()
-
-        self.lastPeriodicTime = time.time()
-        self.timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.periodic)
-        self.timer.Start(gv.PERIODIC)
+        # Display the state after every simulation step of the core.
+        self.updatePending = False
+        self.lastPeriodicTime = 0
+        gv.iSimCore.subscribe(self.onSimStep)
+        gv.iSimCore.start()
         self.Bind(wx.EVT_CLOSE, self.onClose)
         gv.gDebugPrint("Metro-System real world main frame inited.", logType=gv.LOG_INFO)
 
 #--UIFrame---------------------------------------------------------------------
     def _initGlobals(self):
-        # Init the global parameters used only by this module
-        gv.gTrackConfig['weline'] = {'id':'weline', 'num': 4, 'color': wx.Colour(52, 169, 129), 
-                                     'stationCfg': gv.CONFIG_DICT['WE_STATION_CFG'], 'icon': 'welabel.png'}
-        gv.gTrackConfig['nsline'] = {'id':'nsline', 'num': 3, 'color': wx.Colour(233, 0, 97), 
-                                     'stationCfg': gv.CONFIG_DICT['NC_STATION_CFG'], 'icon': 'nslabel.png'}
-        gv.gTrackConfig['ccline'] = {'id':'ccline', 'num': 3, 'color': wx.Colour(255, 136, 0), 
-                                     'stationCfg': gv.CONFIG_DICT['CC_STATION_CFG'], 'icon': 'cclabel.png'}
-        gv.gTrackConfig['mtline'] = {'id':'mtline', 'num': 0, 'color': wx.Colour(200, 210, 200), 
-                                     'stationCfg': gv.CONFIG_DICT['MT_STATION_CFG'], 'icon': None}
         # Init all the global instance
         # if gv.gCollsionTestFlg: gv.gTestMD = False # disable the test mode flag to fetch the signal from PLC
         # Init all the train list
         self.trainCfgFiles = [filename for filename in os.listdir(gv.gTrainCfgDir) if filename.endswith('.json')]
         gv.gDebugPrint("Avalible Scenario file: %s" %str(self.trainCfgFiles), logType=gv.LOG_INFO)
-        gv.iMapMgr = mapMgr.MapMgr(self)
+        # the simulation core inits the map manager and the data manager.
+        gv.iSimCore = core.SimCore(self)
 
 #--UIFrame---------------------------------------------------------------------
     def _buildMenuBar(self):
@@ -164,16 +151,27 @@ class UIFrame(wx.Frame):
         return vbox0
 
 #--UIFrame---------------------------------------------------------------------
-    def periodic(self, event):
-        """ Call back every periodic time."""
-        now = time.time()
-        if (not self.updateLock) and now - self.lastPeriodicTime >= gv.gUpdateRate:
-            print("main frame update at %s" % str(now))
-            self.lastPeriodicTime = now
-            # update the manager.
-            gv.iMapMgr.periodic(now)
-            # apply the state on the map panel.
-            self.mapPanel.periodic(now)
+    def onSimStep(self, version, now):
+        """ Simulation core step callback (called from the core thread), pass the 
+            display update to the UI thread, the steps finished before the UI thread
+            handles it are merged into one update.
+        """
+        if self.updatePending: return
+        self.updatePending = True
+        wx.CallAfter(self.periodic, now)
+
+    def periodic(self, now):
+        """ Display the latest simulation step state, at most once every gv.gUpdateRate
+            sec if the core runs faster than the UI update interval.
+        """
+        waitT = self.lastPeriodicTime + gv.gUpdateRate - time.time()
+        if waitT > 0:
+            wx.CallLater(max(1, int(waitT*1000)), self.periodic, now)
+            return
+        self.lastPeriodicTime = time.time()
+        self.updatePending = False
+        # apply the state on the map panel (the panel takes the core lock to read it).
+        self.mapPanel.periodic(now)
 
 #-----------------------------------------------------------------------------
     def onCollisionSet(self, event):
@@ -185,7 +183,8 @@ class UIFrame(wx.Frame):
         gv.gDebugPrint("Show Train realworld information enable: %s" %str(gv.gShowTrainRWInfo), logType=gv.LOG_INFO)
     
     def changeCAcheckboxState(self, state):
-        self.collisionCB.SetValue(state)
+        # called by the data manager thread.
+        wx.CallAfter(self.collisionCB.SetValue, state)
 
 #-----------------------------------------------------------------------------
     def onLoadScenario(self, event):
@@ -200,10 +199,7 @@ class UIFrame(wx.Frame):
             if os.path.exists(trainConfigPath):
                 with open(trainConfigPath) as json_file:
                     trainConfigDict = json.load(json_file)
-                    if gv.iMapMgr:
-                        self.updateLock = True
-                        gv.iMapMgr.resetTrainsPos(trainConfigDict)
-                        self.updateLock = False
+                    if gv.iSimCore: gv.iSimCore.loadScenario(trainConfigDict)
         self.scenarioDialog.Destroy()
         self.scenarioDialog = None
 
@@ -228,8 +224,9 @@ class UIFrame(wx.Frame):
                 if confirm == wx.ID_CANCEL:
                     evt.Veto(True)
                     return
-                if gv.iDataMgr: gv.iDataMgr.stop()
-                self.timer.Stop()
+                if gv.iSimCore:
+                    gv.iSimCore.unsubscribe(self.onSimStep)
+                    gv.iSimCore.stop()
                 self.Destroy()
         except Exception as err:
             gv.gDebugPrint("Error to close the UI: %s" %str(err), logType=gv.LOG_ERR)
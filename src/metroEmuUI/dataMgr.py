@@ -13,29 +13,117 @@
 # License:     MIT License
 #-----------------------------------------------------------------------------
 
+import sys
 import time
 import json
+import queue
 import threading
+import multiprocessing
 
 import metroEmuGobal as gv
 import Log
 import udpCom
+import rwDataCodec
+import rwSnapshot
+
+SUB_LEASE = 10      # max seconds a subscription is kept without renew.
+KEYFRAME_INT = 10   # push the full state to the subscribers every num of simulation ticks.
+DROP_CHECK_INT = 10 # seconds interval to check the UDP server socket's kernel drops counter.
+SHARD_TYPES = ('sensors', 'stations', 'trainsPlc', 'trainsRtu') # requests handled by the shard workers.
+FWD_QUEUE_SZ = 1024 # max number of requests forwarded from the shard workers waiting to be handled.
+TOUCH_INT = 1       # min seconds interval a shard worker reports a data type's PLC/RTU is online.
 
 # Define all the local untility functions here:
 #-----------------------------------------------------------------------------
 def parseIncomeMsg(msg):
     """ parse the income message to tuple with 3 elements: request key, type and jsonString
+        (the rwDataCodec binary payload is kept as bytes).
         Args: msg (str): example: 'GET;dataType;{"user":"<username>"}'
     """
-    req = msg.decode('UTF-8') if not isinstance(msg, str) else msg
+    req = msg.encode('UTF-8') if isinstance(msg, str) else msg
     try:
-        reqKey, reqType, reqJsonStr = req.split(';', 2)
-        return (reqKey.strip(), reqType.strip(), reqJsonStr)
+        reqKey, reqType, reqJsonStr = req.split(b';', 2)
+        if not rwDataCodec.isBinData(reqJsonStr): reqJsonStr = reqJsonStr.decode('UTF-8')
+        return (reqKey.decode('UTF-8').strip(), reqType.decode('UTF-8').strip(), reqJsonStr)
     except Exception as err:
         Log.error('parseIncomeMsg(): The income message format is incorrect.')
         Log.exception(err)
         return('','',json.dumps({}))
 
+def buildReply(reqKey, respType, respStr):
+    """ Build the reply bytes REP[#corrID];<respType>;<respStr> of the request key."""
+    _, _, corrID = reqKey.partition('#')
+    repKey = '#'.join(('REP', corrID)) if corrID else 'REP'
+    if isinstance(respStr, str): respStr = respStr.encode('utf-8')
+    return b';'.join((repKey.encode('utf-8'), respType.encode('utf-8'), respStr))
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class ShardWorker(object):
+    """ A worker process of the realworld UDP endpoint sharding: all the workers and 
+        the data manager bind the same UDP port with SO_REUSEPORT (the kernel spreads 
+        the PLCs/RTUs by their address). The worker answers the components state fetch
+        requests from the shared memory snapshot published by the simulation process 
+        and forwards the other requests (login, subscribe, POST...) with the client 
+        address to the data manager through the queue, the data manager handles them
+        and replies from its own socket.
+    """
+    def __init__(self, workerID, port, shmName, fwdQueue, sockProfile):
+        self.workerID = workerID
+        self.fwdQueue = fwdQueue
+        # the forked worker shares the resource tracker with the snapshot writer.
+        self.snapshot = rwSnapshot.rwSnapshot(name=shmName, untrack=False)
+        self.server = udpCom.udpServer(None, port, sockProfile=sockProfile)
+        self.touchT = {}
+
+    #-----------------------------------------------------------------------------
+    def _forward(self, item):
+        try:
+            self.fwdQueue.put_nowait(item)
+        except queue.Full:
+            print("ShardWorker-%s: forward queue is full, drop the request." % str(self.workerID))
+
+    #-----------------------------------------------------------------------------
+    def fetchState(self, reqType, reqData):
+        """ Fill the request dict with the snapshot state and return it in the request's
+            format (same as the DataManager's fetch functions).
+        """
+        respStr = json.dumps({'result': 'failed'})
+        try:
+            snapshot = self.snapshot.read()
+            if snapshot is None or snapshot[2] is None: return respStr
+            state = snapshot[2][reqType]
+            binFlg = rwDataCodec.isBinData(reqData)
+            reqDict = rwDataCodec.decodeData(reqType, reqData) if binFlg else json.loads(reqData)
+            for key in reqDict.keys():
+                if key in state.keys(): reqDict[key] = state[key]
+            respStr = rwDataCodec.encodeData(reqType, reqDict) if binFlg else json.dumps(reqDict)
+        except Exception as err:
+            print("ShardWorker-%s: fetchState() Error: %s" %(str(self.workerID), str(err)))
+        return respStr
+
+    #-----------------------------------------------------------------------------
+    def msgHandler(self, msg, address):
+        if msg == b'': return None
+        reqKey, reqType, reqData = parseIncomeMsg(msg)
+        if reqKey.partition('#')[0] == 'GET' and reqType in SHARD_TYPES:
+            now = time.time()
+            if now - self.touchT.get(reqType, 0) > TOUCH_INT:
+                self.touchT[reqType] = now
+                self._forward(('touch', reqType, None))
+            return buildReply(reqKey, reqType, self.fetchState(reqType, reqData))
+        self._forward(('msg', msg, address))
+        return None
+
+    #-----------------------------------------------------------------------------
+    def run(self):
+        print("ShardWorker-%s: start handling the requests." % str(self.workerID))
+        self.server.serverStart(handler=self.msgHandler, addrFlg=True)
+
+def shardWorkerRun(workerID, port, shmName, fwdQueue, sockProfile):
+    """ Shard worker process main function."""
+    ShardWorker(workerID, port, shmName, fwdQueue, sockProfile).run()
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class DataManager(threading.Thread):
@@ -47,8 +135,18 @@ class DataManager(threading.Thread):
         threading.Thread.__init__(self)
         self.parent = parent
         self.terminate = False
-        # Init a udp server to accept all the other plc module's data fetch/set request.
-        self.server = udpCom.udpServer(None, gv.UDP_PORT)
+        # Init a udp server to accept all the other plc module's data fetch/set request, 
+        # the async server handle the PLCs/RTUs requests concurrently.
+        # the socket options profile sets the kernel buffers to absorb the request bursts.
+        sockProfile = udpCom.getSockProfile(gv.gUdpProfile)
+        self.shardFlg = gv.gUdpWorkers > 0 and sys.platform.startswith('linux')
+        if gv.gUdpWorkers > 0 and not self.shardFlg:
+            gv.gDebugPrint("UDP shard workers need SO_REUSEPORT on Linux, disabled.", logType=gv.LOG_WARN)
+        if self.shardFlg: sockProfile['reusePort'] = True
+        if gv.gUdpAsync:
+            self.server = udpCom.udpAsyncServer(None, gv.UDP_PORT, sockProfile=sockProfile)
+        else:
+            self.server = udpCom.udpServer(None, gv.UDP_PORT, sockProfile=sockProfile)
         self.daemon = True
         # init the local sensors data record dictionary
         self.sensorsDict = {
@@ -57,16 +155,6 @@ class DataManager(threading.Thread):
             'ccline': None,
             'mtline': None
         }
-        # ccline have lowest piority: check whether other 2 line sensors are on
-        self.priorityConfig = [('nsline',0), None, 
-                               ('nsline', 4), None,
-                               ('nsline', 2), None,
-                               ('nsline', 2), None,
-                               ('weline', 7, 9), None,
-                               ('weline', 5, 11), None,
-                               ('weline', 3, 13), None,
-                               ('weline', 1, 15), None ]
-
         self.sensorPlcUpdateT = 0
         # init the local station data record dictionary
         self.stationsDict = {
@@ -94,22 +182,83 @@ class DataManager(threading.Thread):
         }
         self.trainRtuUpdateT = 0
 
+        # init the state change subscription: (address, dataType) -> subscription dict
+        self.subscribers = {}
+        self.subLock = threading.Lock()
+        self.pubCount = 0
+        # kernel dropped datagrams count of the server socket.
+        self.sockDrops = 0
+        self.dropCheckT = 0
+        # shard workers answer the state fetch requests from the map manager's shared 
+        # memory snapshot.
+        self.workers = []
+        self.fwdQueue = None
+        if self.shardFlg: self._startShardWorkers(gv.gUdpWorkers, sockProfile)
         gv.gDebugPrint("datamanager init finished.", logType=gv.LOG_INFO)
 
+    #-----------------------------------------------------------------------------
+    def _startShardWorkers(self, workerNum, sockProfile):
+        """ Fork the shard worker processes."""
+        # fork the workers: they only use the lib modules and never touch the UI.
+        ctx = multiprocessing.get_context('fork')
+        self.fwdQueue = ctx.Queue(FWD_QUEUE_SZ)
+        for i in range(workerNum):
+            worker = ctx.Process(target=shardWorkerRun, daemon=True, 
+                                 args=(i, gv.UDP_PORT, gv.gShmName, self.fwdQueue, sockProfile))
+            worker.start()
+            self.workers.append(worker)
+        threading.Thread(target=self._forwardLoop, daemon=True).start()
+        gv.gDebugPrint("Started %s UDP shard workers." % str(workerNum), logType=gv.LOG_INFO)
+
+    def _forwardLoop(self):
+        """ Handle the requests forwarded by the shard workers."""
+        updateTAttrs = {dataType: source[2] for dataType, source in self._getPubSources().items()}
+        while not self.terminate:
+            try:
+                kind, data, address = self.fwdQueue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if kind == 'touch':
+                if data in updateTAttrs: setattr(self, updateTAttrs[data], time.time())
+                continue
+            resp = self.msgHandler(data, address=address)
+            if resp: self.server.pushMsg(resp, address)
+
     #-----------------------------------------------------------------------------
     # Define all the data fetching request here:
     # the fetch function will handle the Plc components state fetch request by: convert 
-    # the json string to dict, then fill the input reqDict with the data and return.
+    # the json string (or binary bytes) to dict, then fill the input reqDict with the 
+    # data and return in the same format.
     # return json.dumps({'result': 'failed'}) if process data error.
+    def _loadData(self, reqType, reqData, boolFlg=False):
+        """ Convert the request payload (json string or rwDataCodec bytes) to dict."""
+        if rwDataCodec.isBinData(reqData):
+            return rwDataCodec.decodeData(reqType, reqData, boolFlg=boolFlg)
+        return json.loads(reqData)
+
+    def _dumpData(self, reqType, respDict, binFlg=False):
+        """ Convert the response dict to the binary bytes if binFlg is True and the 
+            data can be binary encoded, else to the json string.
+        """
+        if binFlg:
+            try:
+                return rwDataCodec.encodeData(reqType, respDict)
+            except Exception as err:
+                gv.gDebugPrint("_dumpData() binary encode failed: %s" %str(err), logType=gv.LOG_WARN)
+        return json.dumps(respDict)
+
+    #-----------------------------------------------------------------------------
     def fetchSensorInfo(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('sensors', reqJsonStr)
             self.sensorPlcUpdateT = time.time() 
             self.updateSensorsData()
             for key in reqDict.keys():
                 if key in self.sensorsDict.keys(): reqDict[key] = self.sensorsDict[key]
-            respStr = json.dumps(reqDict)
+            respStr = self._dumpData('sensors', reqDict, binFlg=rwDataCodec.isBinData(reqJsonStr))
         except Exception as err:
             gv.gDebugPrint("fetchSensorInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
         return respStr
@@ -118,12 +267,12 @@ class DataManager(threading.Thread):
     def fetchStationInfo(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('stations', reqJsonStr)
             self.stationPlcUpdateT = time.time()
             self.updateStationsData()
             for key in reqDict.keys():
                 if key in self.stationsDict.keys(): reqDict[key] = self.stationsDict[key]
-            respStr = json.dumps(reqDict)
+            respStr = self._dumpData('stations', reqDict, binFlg=rwDataCodec.isBinData(reqJsonStr))
         except Exception as err:
             gv.gDebugPrint("fetchStationInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
         return respStr
@@ -132,12 +281,12 @@ class DataManager(threading.Thread):
     def fetchTrainPwrInfo(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('trainsPlc', reqJsonStr)
             self.trainPlcUpdateT = time.time()
             self.updateTrainsPwrData()
             for key in reqDict.keys():
                 if key in self.trainsDict.keys(): reqDict[key] = self.trainsDict[key]
-            respStr = json.dumps(reqDict)
+            respStr = self._dumpData('trainsPlc', reqDict, binFlg=rwDataCodec.isBinData(reqJsonStr))
         except Exception as err:
             gv.gDebugPrint("fetchTrainPwrInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
         return respStr
@@ -145,12 +294,12 @@ class DataManager(threading.Thread):
     def fetchTrainSensInfo(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('trainsRtu', reqJsonStr)
             self.trainRtuUpdateT = time.time()
             self.updateTrainsSenData()
             for key in reqDict.keys():
                 if key in self.trainsDict.keys(): reqDict[key] = self.trainsRtuDict[key]
-            respStr = json.dumps(reqDict)
+            respStr = self._dumpData('trainsRtu', reqDict, binFlg=rwDataCodec.isBinData(reqJsonStr))
         except Exception as err:
             gv.gDebugPrint("fetchTrainSenInfo() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
         return respStr
@@ -176,58 +325,177 @@ class DataManager(threading.Thread):
         }
 
     #-----------------------------------------------------------------------------
-    def msgHandler(self, msg):
+    def msgHandler(self, msg, address=None):
         """ Function to handle the data-fetch/control request from the monitor-hub.
             Args:
                 msg (str/bytes): incoming data from PLC modules though UDP.
+                address (tuple, optional): PLC's UDP address, needed by the subscribe request.
             Returns:
                 bytes: message bytes needs to reply to the PLC.
         """
         gv.gDebugPrint("Incomming message: %s" % str(msg), logType=gv.LOG_INFO)
         if msg == b'': return None
         # request message format: 
-        # data fetch: GET:<key>:<val1>:<val2>...
-        # data set: POST:<key>:<val1>:<val2>...
-        resp = b'REP;deny;{}'
+        # data fetch: GET;<type>;<jsonStr> or GET#<corrID>;<type>;<jsonStr>
+        # data set: POST;<type>;<jsonStr> or POST#<corrID>;<type>;<jsonStr>
+        # the optional correlation ID will be put back in the reply key: REP#<corrID>
+        # the <jsonStr> can be replaced by rwDataCodec binary bytes if the client 
+        # selected the binary format in the login request, reply in the same format.
         (reqKey, reqType, reqJsonStr) = parseIncomeMsg(msg)
+        rawKey, reqKey = reqKey, reqKey.partition('#')[0]
+        respType, respStr = 'deny', '{}'
         if reqKey=='GET':
             if reqType == 'login':
-                resp = ';'.join(('REP', 'login', json.dumps({'state':'ready'})))
+                respType, respStr = 'login', self.login(reqJsonStr)
             elif reqType == 'sensors':
-                respStr = self.fetchSensorInfo(reqJsonStr)
-                resp =';'.join(('REP', 'sensors', respStr))
+                respType, respStr = 'sensors', self.fetchSensorInfo(reqJsonStr)
             elif reqType == 'stations':
-                respStr = self.fetchStationInfo(reqJsonStr)
-                resp =';'.join(('REP', 'stations', respStr))
+                respType, respStr = 'stations', self.fetchStationInfo(reqJsonStr)
             elif reqType == 'trainsPlc':
-                respStr = self.fetchTrainPwrInfo(reqJsonStr)
-                resp =';'.join(('REP', 'trainsPlc', respStr))
+                respType, respStr = 'trainsPlc', self.fetchTrainPwrInfo(reqJsonStr)
             elif reqType == 'trainsRtu':
-                respStr = self.fetchTrainSensInfo(reqJsonStr)
-                resp =';'.join(('REP', 'trainsRtu', respStr))
+                respType, respStr = 'trainsRtu', self.fetchTrainSensInfo(reqJsonStr)
+            elif reqType == 'subscribe' and address:
+                respType, respStr = 'subscribe', self.subscribe(reqJsonStr, address)
+            elif reqType == 'unsubscribe' and address:
+                respType, respStr = 'unsubscribe', self.unsubscribe(reqJsonStr, address)
             pass
         elif reqKey=='POST':
             if reqType == 'signals':
-                respStr = self.setSignals(reqJsonStr)
-                resp =';'.join(('REP', 'signals', respStr))
+                respType, respStr = 'signals', self.setSignals(reqJsonStr)
             elif reqType == 'stations':
-                respStr = self.setStationSignals(reqJsonStr)
-                resp =';'.join(('REP', 'stations', respStr))
+                respType, respStr = 'stations', self.setStationSignals(reqJsonStr)
             elif reqType == 'trainsPlc':
-                respStr = self.setTrainsPower(reqJsonStr)
-                resp =';'.join(('REP', 'trainsPlc', respStr))
+                respType, respStr = 'trainsPlc', self.setTrainsPower(reqJsonStr)
             pass
             # TODO: Handle all the control request here.
-        if isinstance(resp, str): resp = resp.encode('utf-8')
+        resp = buildReply(rawKey, respType, respStr)
         #gv.gDebugPrint('reply: %s' %str(resp), logType=gv.LOG_INFO )
         return resp
 
+    #-----------------------------------------------------------------------------
+    def login(self, reqJsonStr):
+        """ Handle the PLC/RTU login request, select the binary data format if the 
+            client supports it: {"plcID": <id>, "formats": ["bin", "json"]}
+        """
+        respDict = {'state': 'ready'}
+        try:
+            reqDict = json.loads(reqJsonStr)
+            if rwDataCodec.FMT_BIN in reqDict.get('formats', []):
+                respDict['format'] = rwDataCodec.FMT_BIN
+        except Exception as err:
+            gv.gDebugPrint("login() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
+        return json.dumps(respDict)
+
+    #-----------------------------------------------------------------------------
+    # Define all the state change subscription functions here:
+    # A PLC/RTU sends GET;subscribe;{"type": <dataType>, "keys": [<track>...], "lease": <sec>}
+    # to register the interest, then after every simulation tick the publish() will push 
+    # PUB;<dataType>;{"seq": <n>, "full": <bool>, "data": {...}} to the subscriber:
+    # - full == True: the data is the keyframe {track: [full state list]}
+    # - full == False: the data only contains the changed items {track: [[idx, val], ...]}
+    # The subscriber needs to renew (subscribe again) before the lease expired.
+    def _getPubSources(self):
+        return {
+            'sensors': (self.updateSensorsData, self.sensorsDict, 'sensorPlcUpdateT'),
+            'stations': (self.updateStationsData, self.stationsDict, 'stationPlcUpdateT'),
+            'trainsPlc': (self.updateTrainsPwrData, self.trainsDict, 'trainPlcUpdateT'),
+            'trainsRtu': (self.updateTrainsSenData, self.trainsRtuDict, 'trainRtuUpdateT')
+        }
+
+    def subscribe(self, reqJsonStr, address):
+        respStr = json.dumps({'result': 'failed'})
+        try:
+            reqDict = json.loads(reqJsonStr)
+            dataType, keys = reqDict['type'], list(reqDict['keys'])
+            pubSources = self._getPubSources()
+            if dataType in pubSources:
+                lease = min(float(reqDict['lease']), SUB_LEASE) if 'lease' in reqDict.keys() else SUB_LEASE
+                with self.subLock:
+                    subInfo = self.subscribers.get((address, dataType))
+                    if subInfo is None or subInfo['keys'] != keys:
+                        # new subscription, the first push will be a keyframe.
+                        subInfo = {'keys': keys, 'seq': 0, 'last': None}
+                        self.subscribers[(address, dataType)] = subInfo
+                    subInfo['expire'] = time.time() + lease
+                setattr(self, pubSources[dataType][2], time.time())
+                respStr = json.dumps({'result': 'success', 'lease': lease})
+        except Exception as err:
+            gv.gDebugPrint("subscribe() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
+        return respStr
+
+    def unsubscribe(self, reqJsonStr, address):
+        respStr = json.dumps({'result': 'failed'})
+        try:
+            reqDict = json.loads(reqJsonStr)
+            with self.subLock:
+                self.subscribers.pop((address, reqDict['type']), None)
+            respStr = json.dumps({'result': 'success'})
+        except Exception as err:
+            gv.gDebugPrint("unsubscribe() Error: %s" %str(err), logType=gv.LOG_EXCEPT)
+        return respStr
+
+    #-----------------------------------------------------------------------------
+    def publish(self):
+        """ Push the changed components state to the subscribers, this function needs
+            to be called after the map manager finished a simulation tick.
+        """
+        if not self.subscribers: return
+        now = time.time()
+        self.pubCount += 1
+        keyFrame = self.pubCount % KEYFRAME_INT == 0
+        pubSources = self._getPubSources()
+        updatedTypes = []
+        with self.subLock:
+            for (address, dataType), subInfo in list(self.subscribers.items()):
+                if subInfo['expire'] < now:
+                    gv.gDebugPrint("Subscription %s expired." %str((address, dataType)), logType=gv.LOG_INFO)
+                    del self.subscribers[(address, dataType)]
+                    continue
+                updateFun, dataDict, updateTAttr = pubSources[dataType]
+                if dataType not in updatedTypes:
+                    updateFun()
+                    updatedTypes.append(dataType)
+                    setattr(self, updateTAttr, now)
+                state = {key: list(dataDict[key] or []) for key in subInfo['keys'] if key in dataDict.keys()}
+                lastState = subInfo['last']
+                fullFlg = keyFrame or lastState is None
+                data = state
+                if not fullFlg:
+                    data = {}
+                    for key, vals in state.items():
+                        if len(vals) != len(lastState[key]):
+                            fullFlg, data = True, state
+                            break
+                        changes = [[idx, val] for idx, val in enumerate(vals) if val != lastState[key][idx]]
+                        if changes: data[key] = changes
+                subInfo['last'] = state
+                if not (fullFlg or data): continue  # nothing changed.
+                subInfo['seq'] += 1
+                pushDict = {'seq': subInfo['seq'], 'full': fullFlg, 'data': data}
+                self.server.pushMsg(';'.join(('PUB', dataType, json.dumps(pushDict))), address)
+
+    #-----------------------------------------------------------------------------
+    def checkSockDrops(self, now):
+        """ Report the datagrams dropped by the kernel because the UDP server socket 
+            receive buffer is full (check the UDP_PROFILE config if it keeps increasing).
+        """
+        if now - self.dropCheckT < DROP_CHECK_INT: return
+        self.dropCheckT = now
+        stats = self.server.getSockStats()
+        if stats is None or stats['drops'] is None: return
+        if stats['drops'] > self.sockDrops:
+            gv.gDebugPrint("UDP server socket dropped %s datagrams (total: %s, receive buffer: %s bytes)."
+                           % (stats['drops'] - self.sockDrops, stats['drops'], stats['rcvBuf']), 
+                           logType=gv.LOG_WARN)
+        self.sockDrops = stats['drops']
+
     #-----------------------------------------------------------------------------
     def run(self):
         """ Thread run() function will be called by start(). """
         time.sleep(1)
         gv.gDebugPrint("datamanager subthread started.", logType=gv.LOG_INFO)
-        self.server.serverStart(handler=self.msgHandler)
+        self.server.serverStart(handler=self.msgHandler, addrFlg=True)
         gv.gDebugPrint("DataManager running finished.", logType=gv.LOG_INFO)
 
     #-----------------------------------------------------------------------------
@@ -238,7 +506,7 @@ class DataManager(threading.Thread):
     def setSignals(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('signals', reqJsonStr, boolFlg=True)
             if gv.iMapMgr:
                 if not gv.gJuncAvoid:
                     for key, val in reqDict.items():
@@ -252,7 +520,7 @@ class DataManager(threading.Thread):
     def setStationSignals(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('stations', reqJsonStr, boolFlg=True)
             if gv.iMapMgr:
                 for key, val in reqDict.items():
                     gv.iMapMgr.setStationSignal(key, val)
@@ -265,7 +533,7 @@ class DataManager(threading.Thread):
     def setTrainsPower(self, reqJsonStr):
         respStr = json.dumps({'result': 'failed'})
         try:
-            reqDict = json.loads(reqJsonStr)
+            reqDict = self._loadData('trainsPlc', reqJsonStr, boolFlg=True)
             if gv.iMapMgr:
                 for key, val in reqDict.items():
                     gv.iMapMgr.setTainsPower(key, val)
@@ -276,61 +544,35 @@ class DataManager(threading.Thread):
 
     #-----------------------------------------------------------------------------
     # define() all the update function here, update function will update the local 
-    # components record from the map manager.
+    # components record from the state snapshot published by the map manager after
+    # every simulation tick (the UDP thread doesn't touch the components changed by
+    # the UI thread).
 
-    def updateSensorsData(self):
+    def _updateFromSnapshot(self, stateType, dataDict):
         if gv.iMapMgr:
-            for key in self.sensorsDict.keys():
-                sensorAgent = gv.iMapMgr.getSensors(trackID=key)
-                self.sensorsDict[key] = sensorAgent.getSensorsState()
-            # update the cc sensor piority if connect to PLC
-            if not gv.gTestMD: self._updateSensorPriority()
-
-    def _updateSensorPriority(self):
-        if self.sensorsDict['ccline']:
-            pryLen = len(self.priorityConfig)
-            for i, val in enumerate(self.sensorsDict['ccline']):
-                if i < pryLen and self.priorityConfig[i]:
-                    priorityVal = self.priorityConfig[i]
-                    overWriteFlg = False 
-                    key, idxs = priorityVal[0], priorityVal[1:]
-                    for j in idxs:
-                        if j < len(self.sensorsDict[key]):
-                            overWriteFlg = overWriteFlg or self.sensorsDict[key][j]
-                    if val and overWriteFlg:
-                        self.sensorsDict['ccline'][i] = 0
+            state = gv.iMapMgr.getStateSnapshot(stateType=stateType)
+            for key in dataDict.keys():
+                dataDict[key] = state[key] if key in state.keys() else None
+
+    def updateSensorsData(self):
+        self._updateFromSnapshot('sensors', self.sensorsDict)
 
     #-----------------------------------------------------------------------------
     def updateStationsData(self):
-        if gv.iMapMgr:
-            for key in self.stationsDict.keys():
-                self.stationsDict[key] = []
-                for stationAgent in gv.iMapMgr.getStations(trackID=key):
-                    state = 1 if stationAgent.getDockState() else 0
-                    self.stationsDict[key].append(state)
+        self._updateFromSnapshot('stations', self.stationsDict)
 
     #-----------------------------------------------------------------------------
     def updateTrainsPwrData(self):
-        if gv.iMapMgr:
-            for key in self.trainsDict.keys():
-                self.trainsDict[key] = []
-                for train in gv.iMapMgr.getTrains(trackID=key):
-                    state = 0 if train.getPowerState() == 0 else 1
-                    self.trainsDict[key].append(state)
-                    
+        self._updateFromSnapshot('trainsPlc', self.trainsDict)
+
     def updateTrainsSenData(self):
-        if gv.iMapMgr:
-            for key in self.trainsRtuDict.keys():
-                self.trainsRtuDict[key] = []
-                for train in gv.iMapMgr.getTrains(trackID=key):
-                    state = train.getTrainRealInfo()
-                    reuslt = [state['fsensor'], state['speed'], state['voltage'], state['current']]
-                    self.trainsRtuDict[key].append(reuslt) 
+        self._updateFromSnapshot('trainsRtu', self.trainsRtuDict)
 
     #-----------------------------------------------------------------------------
     def stop(self):
         """ Stop the thread."""
         self.terminate = True
+        for worker in self.workers: worker.terminate()
         if self.server: self.server.serverStop()
         endClient = udpCom.udpClient(('127.0.0.1', gv.UDP_PORT))
         endClient.disconnect()
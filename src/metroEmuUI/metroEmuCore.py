@@ -0,0 +1,150 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        metroEmuCore.py
+#
+# Purpose:     The UI-free realworld simulation core of the metro emulator: run
+#              the map manager's simulation step in a fixed-step loop with the
+#              UDP data manager attached. The module can be executed directly to
+#              run the emulator headless (no display needed, example in a container),
+#              the wx main frame <MetroEmuRun.py> is an optional viewer of the core.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/05/10
+# Version:     v_0.1.2
+# Copyright:   Copyright (c) 2024 Singapore National Cybersecurity R&D Lab LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+""" Program Design:
+    - SimCore: a thread runs the simulation steps every gv.gSimInterval sec (SIM_INTERVAL
+        config, 0: full speed). A step updates the map (MapMgr.periodic()), pushes the
+        state changes to the subscribed PLCs/RTUs and checks the UDP server socket
+        drops, then increases the step version and calls the subscribers' callback
+        func(version, now). If a step takes longer than the interval the loop does not
+        try to catch up the missed steps. The viewers hold the core lock while reading
+        the map state to get a consistent step state.
+"""
+
+import time
+import signal
+import threading
+
+import metroEmuGobal as gv
+import railwayMgr as mapMgr
+import dataMgr as dm
+
+OVERRUN_LOG_INT = 10    # min seconds interval to log the simulation step overrun.
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class SimCore(threading.Thread):
+    """ Realworld simulation core thread."""
+    def __init__(self, parent, interval=None) -> None:
+        """ Init the map manager and the data manager.
+            Args:
+                parent (object): parent object (the viewer frame), None if headless.
+                interval (float, optional): simulation step interval (sec). Defaults
+                    to None use gv.gSimInterval.
+        """
+        threading.Thread.__init__(self)
+        self.parent = parent
+        self.interval = gv.gSimInterval if interval is None else max(0.0, interval)
+        self.lock = threading.Lock()    # held during a simulation step.
+        self.version = 0                # number of finished simulation steps.
+        self.overruns = 0               # number of steps finished after the deadline.
+        self.lastOverrunLogT = 0
+        self.subscribers = []
+        self.terminate = False
+        self.stopEvent = threading.Event()
+        self.daemon = True
+        gv.iMapMgr = mapMgr.MapMgr(self)
+        gv.iDataMgr = dm.DataManager(self)
+        gv.iDataMgr.start()
+
+    #-----------------------------------------------------------------------------
+    def subscribe(self, callback):
+        """ Add a callback func(version, now) called after every simulation step (from
+            the core thread, a UI viewer needs to pass the call to its own thread).
+        """
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers: self.subscribers.remove(callback)
+
+    #-----------------------------------------------------------------------------
+    def step(self, now=None):
+        """ Run one simulation step."""
+        if now is None: now = time.time()
+        with self.lock:
+            gv.iMapMgr.periodic(now)
+            # push the state changes of this step to the subscribed PLCs/RTUs.
+            if gv.iDataMgr:
+                gv.iDataMgr.publish()
+                gv.iDataMgr.checkSockDrops(now)
+            self.version += 1
+        for callback in list(self.subscribers):
+            try:
+                callback(self.version, now)
+            except Exception as err:
+                gv.gDebugPrint("SimCore subscriber callback error: %s" %str(err), logType=gv.LOG_EXCEPT)
+
+    #-----------------------------------------------------------------------------
+    def loadScenario(self, trainConfigDict):
+        """ Reset the trains position with the scenario config between two steps."""
+        with self.lock:
+            gv.iMapMgr.resetTrainsPos(trainConfigDict)
+
+    #-----------------------------------------------------------------------------
+    def getStats(self):
+        return {'version': self.version, 'interval': self.interval, 'overruns': self.overruns}
+
+    #-----------------------------------------------------------------------------
+    def run(self):
+        """ Thread run() function will be called by start(). """
+        gv.gDebugPrint("Simulation core started, step interval: %s sec." %str(self.interval),
+                       logType=gv.LOG_INFO)
+        nextT = time.monotonic()
+        while not self.terminate:
+            self.step()
+            nextT += self.interval
+            waitT = nextT - time.monotonic()
+            if waitT > 0:
+                self.stopEvent.wait(waitT)
+            elif self.interval > 0:
+                # step overrun: restart the schedule from now.
+                self.overruns += 1
+                nextT = time.monotonic()
+                if nextT - self.lastOverrunLogT >= OVERRUN_LOG_INT:
+                    self.lastOverrunLogT = nextT
+                    gv.gDebugPrint("Simulation step overrun (total: %s), the step takes longer than %s sec."
+                                   % (self.overruns, self.interval), logType=gv.LOG_WARN)
+        gv.gDebugPrint("Simulation core finished.", logType=gv.LOG_INFO)
+
+    #-----------------------------------------------------------------------------
+    def stop(self):
+        """ Stop the simulation loop and the data manager."""
+        if self.terminate: return   # already stopped.
+        self.terminate = True
+        self.stopEvent.set()
+        if self.is_alive() and threading.current_thread() is not self: self.join(timeout=5)
+        if gv.iDataMgr: gv.iDataMgr.stop()
+        if gv.iMapMgr: gv.iMapMgr.closeSnapshot()
+
+#-----------------------------------------------------------------------------
+def main():
+    """ Run the realworld emulator headless until Ctrl-C or SIGTERM (container stop)."""
+    gv.iSimCore = SimCore(None)
+    # the handler runs in the main thread: stop() waits the current step finished.
+    signal.signal(signal.SIGTERM, lambda signum, frame: gv.iSimCore.stop())
+    gv.gDebugPrint("Metro-System real world emulator running headless.", logType=gv.LOG_INFO)
+    gv.iSimCore.start()
+    try:
+        while gv.iSimCore.is_alive(): gv.iSimCore.join(1)
+    except KeyboardInterrupt:
+        pass
+    gv.gDebugPrint("Stop the real world emulator.", logType=gv.LOG_INFO)
+    gv.iSimCore.stop()
+
+#-----------------------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -123,8 +123,33 @@ gJuncAvoid = CONFIG_DICT['JUNC_AVOID']      # Auto correct juction state.
 gDockTime = int(CONFIG_DICT['DOCK_TIME'])
 
 gPlcTimeout = int(CONFIG_DICT['PLC_TIMEOUT'])
-
+# Use the non-blocking asyncio UDP server to handle the PLCs/RTUs requests.
+gUdpAsync = CONFIG_DICT['UDP_ASYNC'] if 'UDP_ASYNC' in CONFIG_DICT.keys() else False
+# UDP server socket options profile name defined in udpCom.SOCK_PROFILES.
+gUdpProfile = CONFIG_DICT['UDP_PROFILE'] if 'UDP_PROFILE' in CONFIG_DICT.keys() else 'default'
+# Number of the UDP shard worker processes (0: disable) and their state snapshot shared memory name.
+gUdpWorkers = int(CONFIG_DICT['UDP_WORKERS']) if 'UDP_WORKERS' in CONFIG_DICT.keys() else 0
+gShmName = CONFIG_DICT['SHM_NAME'] if 'SHM_NAME' in CONFIG_DICT.keys() else 'railwayRwSnapshot'
+# Publish the realworld state snapshot to the shared memory after every simulation tick
+# for the PLCs/RTUs on the same host (needed by the UDP shard workers).
+gShmSnapshot = CONFIG_DICT['SHM_SNAPSHOT'] if 'SHM_SNAPSHOT' in CONFIG_DICT.keys() else False
+gShmSnapshot = gShmSnapshot or gUdpWorkers > 0
+
+# Realworld simulation step interval (sec) of the simulation core's fixed-step loop,
+# 0: run the simulation steps back to back (full speed).
+gSimInterval = float(CONFIG_DICT['SIM_INTERVAL']) if 'SIM_INTERVAL' in CONFIG_DICT.keys() else gUpdateRate
+gSimInterval = max(0.0, gSimInterval)
+
+# Tracks config, the color is a (R, G, B) tuple so the simulation core does not need wx.
 gTrackConfig = OrderedDict()
+gTrackConfig['weline'] = {'id':'weline', 'num': 4, 'color': (52, 169, 129), 
+                          'stationCfg': CONFIG_DICT['WE_STATION_CFG'], 'icon': 'welabel.png'}
+gTrackConfig['nsline'] = {'id':'nsline', 'num': 3, 'color': (233, 0, 97), 
+                          'stationCfg': CONFIG_DICT['NC_STATION_CFG'], 'icon': 'nslabel.png'}
+gTrackConfig['ccline'] = {'id':'ccline', 'num': 3, 'color': (255, 136, 0), 
+                          'stationCfg': CONFIG_DICT['CC_STATION_CFG'], 'icon': 'cclabel.png'}
+gTrackConfig['mtline'] = {'id':'mtline', 'num': 0, 'color': (200, 210, 200), 
+                          'stationCfg': CONFIG_DICT['MT_STATION_CFG'], 'icon': None}
 #gCollsionTestFlg = CONFIG_DICT['TEST_JC_COLLISION'] # flag used to enable test the train collision at the junction.
 #gTrainDistTestFlag = CONFIG_DICT['TEST_TR_DISTANCE'] # flag used to see if the minimum distance between trains are observed
 gTrainCfgDir = os.path.join(dirpath, CFGDIR, CONFIG_DICT['TR_CFG_FOLDER'])
@@ -135,4 +160,5 @@ iMainFrame = None   # UI MainFrame.
 iCtrlPanel = None   # UI function control panel.
 iMapPanel = None    # UI map display panel
 iMapMgr = None      # map manager.
+iSimCore = None     # realworld simulation core running the simulation steps.
 iDataMgr = None     # data manager to handling data fetch and set requirment.
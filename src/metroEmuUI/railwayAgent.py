@@ -55,10 +55,10 @@ class AgentTarget(object):
 #-----------------------------------------------------------------------------
 class agentEnv(AgentTarget):
     """ The environment Item shown on the map such as building, IOT, camera."""
-    def __init__(self, parent, tgtID, pos, wxBitMap, size ,tType=gv.ENV_TYPE):
+    def __init__(self, parent, tgtID, pos, imgPath, size ,tType=gv.ENV_TYPE):
         super().__init__(parent, tgtID, pos, tType)
         # build Icon: https://www.freepik.com/premium-vector/isometric-modern-supermarket-buildings-set_10094282.htm
-        self.bitmap = wxBitMap
+        self.imgPath = imgPath  # the map panel loads the image, the agent does not need wx.
         self.size = size
         self.color = None   
         self.linkList = None
@@ -74,8 +74,8 @@ class agentEnv(AgentTarget):
     def getSize(self):
         return self.size
 
-    def getWxBitmap(self):
-        return self.bitmap
+    def getImgPath(self):
+        return self.imgPath
     
 #-----------------------------------------------------------------------------
 # Define all the set() functions here:
@@ -15,11 +15,11 @@
 
 import os
 import json
-import wx
 from collections import OrderedDict
 
 import metroEmuGobal as gv
 import railwayAgent as agent
+import rwSnapshot
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -36,6 +36,17 @@ class MapMgr(object):
         self.stations = OrderedDict()
         self.junctions = []
         self.envItems = [] # Currently we only have building item so use list instead of dict()
+        self.mapVersion = 0 # increased when the map scenario is reloaded.
+        # ccline sensors have lowest piority when connect to PLC: the sensor state is 
+        # off if the listed other line sensors are on: (trackID, sensorIdx, ...)
+        self.priorityConfig = [('nsline',0), None, 
+                               ('nsline', 4), None,
+                               ('nsline', 2), None,
+                               ('nsline', 2), None,
+                               ('weline', 7, 9), None,
+                               ('weline', 5, 11), None,
+                               ('weline', 3, 13), None,
+                               ('weline', 1, 15), None ]
 
         self._initTandT()
         self._initSensors()
@@ -43,6 +54,13 @@ class MapMgr(object):
         self._initStation()
         self._initEnv()
         self._initJunction()
+        # The components state published after every simulation tick, the dict is 
+        # replaced (never changed) so other threads can read it without lock.
+        self.stateSnapshot = None
+        self.shmSnapshot = None
+        if gv.gShmSnapshot:
+            self.shmSnapshot = rwSnapshot.rwSnapshot(name=gv.gShmName, create=True)
+        self.publishState()
 
         gv.gDebugPrint('Map display management controller inited', logType=gv.LOG_INFO)
 
@@ -326,8 +344,7 @@ class MapMgr(object):
         for info in envCfg:
             imgPath = os.path.join(gv.IMG_FD, info['img'])
             if os.path.exists(imgPath):
-                bitmap = wx.Bitmap(imgPath)
-                building = agent.agentEnv(self, info['id'], info['pos'], bitmap, info['size'] )
+                building = agent.agentEnv(self, info['id'], info['pos'], imgPath, info['size'] )
                 self.envItems.append(building)
         
         labelCfg = [
@@ -391,10 +408,14 @@ class MapMgr(object):
         self._initSignal()
         self._initStation()
         self._initJunction()
+        self.mapVersion += 1
 
 #-----------------------------------------------------------------------------
 # Define all the get() functions here:
 
+    def getMapVersion(self):
+        return self.mapVersion
+
     def getEnvItems(self):
         return self.envItems
 
@@ -421,6 +442,57 @@ class MapMgr(object):
     def getJunction(self):
         return self.junctions
 
+    def getStateSnapshot(self, stateType=None):
+        """ Return the components state published after the last simulation tick: 
+            {'sensors'/'stations'/'trainsPlc'/'trainsRtu': {trackID: list}}, don't 
+            change the returned dict.
+        """
+        if stateType: return self.stateSnapshot[stateType]
+        return self.stateSnapshot
+
+#-----------------------------------------------------------------------------
+    def _buildState(self):
+        """ Collect the sensors bits, stations dock state, trains power state and the 
+            trains realworld info (RTU) of all the tracks.
+        """
+        state = {'sensors': OrderedDict(), 'stations': OrderedDict(), 
+                 'trainsPlc': OrderedDict(), 'trainsRtu': OrderedDict()}
+        for key in self.tracks.keys():
+            state['sensors'][key] = list(self.sensors[key].getSensorsState()) if key in self.sensors.keys() else None
+            state['stations'][key] = [1 if station.getDockState() else 0 for station in self.stations.get(key, [])]
+            trains = self.trains.get(key, [])
+            state['trainsPlc'][key] = [0 if train.getPowerState() == 0 else 1 for train in trains]
+            state['trainsRtu'][key] = [[info['fsensor'], info['speed'], info['voltage'], info['current']]
+                                       for info in (train.getTrainRealInfo() for train in trains)]
+        # update the cc sensor piority if connect to PLC
+        if not gv.gTestMD: self._applySensorPriority(state['sensors'])
+        return state
+
+    def _applySensorPriority(self, sensorsDict):
+        if sensorsDict.get('ccline'):
+            pryLen = len(self.priorityConfig)
+            for i, val in enumerate(sensorsDict['ccline']):
+                if i < pryLen and self.priorityConfig[i]:
+                    priorityVal = self.priorityConfig[i]
+                    overWriteFlg = False 
+                    key, idxs = priorityVal[0], priorityVal[1:]
+                    for j in idxs:
+                        if j < len(sensorsDict[key]):
+                            overWriteFlg = overWriteFlg or sensorsDict[key][j]
+                    if val and overWriteFlg:
+                        sensorsDict['ccline'][i] = 0
+
+    def publishState(self, now=None):
+        """ Publish the components state snapshot for the data manager and write it 
+            to the shared memory for the PLCs/RTUs running on the same host.
+        """
+        self.stateSnapshot = self._buildState()
+        if self.shmSnapshot: self.shmSnapshot.publish(self.stateSnapshot, pubTime=now)
+
+    def closeSnapshot(self):
+        if self.shmSnapshot: self.shmSnapshot.close()
+        self.shmSnapshot = None
+
 #-----------------------------------------------------------------------------
 # Define all the set() functions here:
 
@@ -448,7 +520,7 @@ class MapMgr(object):
                            logType=gv.LOG_INFO)
             data = powerStateList[0]
             gv.gCollAvoid = data
-            gv.iMainFrame.changeCAcheckboxState(gv.gCollAvoid)
+            if gv.iMainFrame: gv.iMainFrame.changeCAcheckboxState(gv.gCollAvoid)
 
 #-----------------------------------------------------------------------------
     def updateSignalState(self, key):
@@ -527,5 +599,7 @@ class MapMgr(object):
                 station.updateTrainsDock()
                 if not station.getDockState():
                     station.setEmptyCount(station.getEmptyCount() + 1)
+        # publish the state snapshot of this tick.
+        self.publishState(now)
 
 
@@ -16,11 +16,16 @@
 
 import os
 import time
+import contextlib
 
 import wx
 import metroEmuGobal as gv
 
 DEF_PNL_SIZE = (1600, 900)
+CLOCK_RECT = (1300, 40, 260, 25)    # date and time text area.
+# PLCs/RTU connection state text areas.
+CONN_RECTS = {('plc', 'sensors'): (290, 760, 300, 52), ('plc', 'stations'): (290, 840, 300, 52),
+              ('plc', 'trains'): (1140, 760, 300, 52), ('rtu', 'trains'): (1140, 840, 300, 52)}
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -33,11 +38,20 @@ class PanelMap(wx.Panel):
         self.panelSize = panelSize
         self.bitMaps = self._loadBitMaps()
         self.toggle = False
+        self.lastItems = {}     # last drawn items {itemKey: (state, rect, blinkFlg)}
+        self.gdiCache = {}      # cached pens, brushes, fonts and bitmaps.
+        self.bgBitmap = None    # cached static background layer.
+        self.bgVersion = None   # map version of the cached background layer.
         # Paint the map
         self.Bind(wx.EVT_PAINT, self.onPaint)
+        self.Bind(wx.EVT_SIZE, self.onResize)
         # self.Bind(wx.EVT_LEFT_DOWN, self.onLeftClick)
         # Set the panel double buffer to void the panel flash during update.
         self.SetDoubleBuffered(True)
+        # The blink animation has its own timer which only repaints the blinking items.
+        self.blinkTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onBlink, self.blinkTimer)
+        self.blinkTimer.Start(int(gv.gUpdateRate*1000))
 
 #-----------------------------------------------------------------------------
     def _loadBitMaps(self):
@@ -49,6 +63,93 @@ class PanelMap(wx.Panel):
             imgDict['alert'] = png
         return imgDict
 
+#-----------------------------------------------------------------------------
+# Define the cached pens, brushes and fonts get() functions.
+
+    def _getPen(self, color, width=1, style=wx.PENSTYLE_SOLID):
+        key = ('pen', str(color), width, style)
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Pen(color, width=width, style=style)
+        return self.gdiCache[key]
+
+    def _getBrush(self, color, style=wx.BRUSHSTYLE_SOLID):
+        key = ('brush', str(color), style)
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Brush(color, style)
+        return self.gdiCache[key]
+
+    def _getFont(self, *args):
+        key = ('font',) + args
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Font(*args)
+        return self.gdiCache[key]
+
+    def _getBitmap(self, imgPath):
+        key = ('bitmap', imgPath)
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Bitmap(imgPath)
+        return self.gdiCache[key]
+
+#-----------------------------------------------------------------------------
+    def _buildBgBitmap(self):
+        """ Draw the static background layer (background, tracks and environment items)
+            to an offscreen bitmap.
+        """
+        w, h = self.panelSize
+        bitmap = wx.Bitmap(w, h)
+        memDC = wx.MemoryDC(bitmap)
+        self._drawRailWay(memDC)
+        self._drawEnvItems(memDC)
+        memDC.SelectObject(wx.NullBitmap)
+        return bitmap
+
+#-----------------------------------------------------------------------------
+    def _coreLock(self):
+        """ Return the simulation core lock to read a consistent step state of the map."""
+        return gv.iSimCore.lock if gv.iSimCore else contextlib.nullcontext()
+
+#-----------------------------------------------------------------------------
+    def _getItemsState(self):
+        """ Return the state, the display area rect and the blink flag of all the 
+            trains, junctions, sensors, signals, stations and connection state texts
+            on the map as {itemKey: (state, rect, blinkFlg)}.
+        """
+        items = {}
+        for key, val in gv.iMapMgr.getTrains().items():
+            for i, train in enumerate(val):
+                ptList = [tuple(point) for point in train.getPos()]
+                x, y = train.getTrainPos(idx=0)
+                collision = bool(train.getCollsionFlg())
+                state = (tuple(ptList), train.getTrainSpeed() == 0, bool(train.getEmgStop()), 
+                         collision, str(train.getTrainRealInfo()) if gv.gShowTrainRWInfo else None)
+                # the train area covers the train body, the alert icon and the labels.
+                lbW, lbH = (140, 70) if gv.gShowTrainRWInfo else (60, 20)
+                ptList += [(x-20, y-20), (x+5+lbW, y+5+lbH)]
+                xList, yList = [pt[0] for pt in ptList], [pt[1] for pt in ptList]
+                rect = (min(xList)-6, min(yList)-6, max(xList)-min(xList)+12, max(yList)-min(yList)+12)
+                items[('train', key, i)] = (state, rect, collision)
+        for i, item in enumerate(gv.iMapMgr.getJunction()):
+            x, y = item.getPos()
+            collision = bool(item.getCollition())
+            items[('junction', i)] = (collision, (x-20, y-20, 40, 40), collision and not gv.gJuncAvoid)
+        for key, sensorAgent in gv.iMapMgr.getSensors().items():
+            posList, stateList = sensorAgent.getPos(), sensorAgent.getSensorsState()
+            for i in range(sensorAgent.getSensorCount()):
+                x, y = posList[i]
+                state = bool(stateList[i])
+                items[('sensor', key, i)] = (state, (x-6, y-6, 12, 12), state)
+        for key, signals in gv.iMapMgr.getSignals().items():
+            for i, signalAgent in enumerate(signals):
+                x, y = signalAgent.getPos()
+                items[('signal', key, i)] = (bool(signalAgent.getState()), (x-22, y-22, 44, 44), False)
+        for key, stations in gv.iMapMgr.getStations().items():
+            for i, station in enumerate(stations):
+                x, y = station.getPos()
+                state = (bool(station.getDockState()), bool(station.getSignalState()))
+                items[('station', key, i)] = (state, (x-42, y-42, 84, 84), False)
+        if gv.iDataMgr:
+            connDict = {'plc': gv.iDataMgr.getLastPlcsConnectionState(),
+                        'rtu': gv.iDataMgr.getLastRtusConnectionState()}
+            for (devType, key), rect in CONN_RECTS.items():
+                items[('conn', devType, key)] = (connDict[devType][key], rect, False)
+        return items
+
 #-----------------------------------------------------------------------------
 # Define all the _draw() map components paint functions.
     
@@ -59,29 +160,33 @@ class PanelMap(wx.Panel):
         for item in gv.iMapMgr.getEnvItems():
             id = item.getID()
             pos = item.getPos()
-            bitmap = item.getWxBitmap()
             size = item.getSize()
             if item.getType() == gv.ENV_TYPE:
-                dc.SetFont(wx.Font(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+                bitmap = self._getBitmap(item.getImgPath())
+                dc.SetFont(self._getFont(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
                 dc.DrawBitmap(bitmap, pos[0]-size[0]//2, pos[1]-size[1]//2)
                 dc.DrawText(str(id), pos[0]-size[0]//2, pos[1]-size[1]//2-15)
             elif item.getType() == gv.LABEL_TYPE:
                 color, link = item.getColor(), item.getLink()
                 if link:
-                    dc.SetPen(wx.Pen(color, width=2, style=wx.PENSTYLE_SOLID))
+                    dc.SetPen(self._getPen(color, width=2, style=wx.PENSTYLE_SOLID))
                     dc.DrawLines(link)
-                dc.SetFont(wx.Font(12, wx.DEFAULT, wx.NORMAL, wx.BOLD))
-                dc.SetBrush(wx.Brush(color))
+                dc.SetFont(self._getFont(12, wx.DEFAULT, wx.NORMAL, wx.BOLD))
+                dc.SetBrush(self._getBrush(color))
                 dc.DrawRectangle(pos[0]-size[0]//2, pos[1]-size[1]//2, size[0], size[1])
                 dc.DrawText(str(id), pos[0]-size[0]//2+6, pos[1]-size[1]//2+6)
+
+#-----------------------------------------------------------------------------
+    def _drawEnvState(self, dc):
+        """ Draw the date time and the PLCs/RTU connection state."""
         # Draw the current date and time
-        dc.SetFont(wx.Font(14, wx.DEFAULT, wx.NORMAL, wx.BOLD))
+        dc.SetFont(self._getFont(14, wx.DEFAULT, wx.NORMAL, wx.BOLD))
         dc.SetTextForeground(wx.Colour('GREEN'))
         dc.DrawText(time.strftime("%b %d %Y %H:%M:%S", time.localtime(time.time())), 1300, 40)
         
         # Draw the PLC state:
         if gv.iDataMgr:
-            dc.SetFont(wx.Font(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+            dc.SetFont(self._getFont(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
             plcStateDict = gv.iDataMgr.getLastPlcsConnectionState()
             rtuStateDict = gv.iDataMgr.getLastRtusConnectionState()
             # draw sensor plc state
@@ -131,22 +236,22 @@ class PanelMap(wx.Panel):
                 if self.toggle and not gv.gJuncAvoid:
                     dc.DrawBitmap(self.bitMaps['alert'], pos[0]-15, pos[1]-15)
                 else:
-                    dc.SetPen(wx.Pen('RED', width=1, style=wx.PENSTYLE_SOLID))
-                    dc.SetBrush(wx.Brush('RED'))
+                    dc.SetPen(self._getPen('RED', width=1, style=wx.PENSTYLE_SOLID))
+                    dc.SetBrush(self._getBrush('RED'))
                     dc.DrawRectangle(pos[0]-10, pos[1]-10, 20, 20)
             else: 
-                dc.SetPen(wx.Pen('GREEN', width=1, style=wx.PENSTYLE_SOLID))
-                dc.SetBrush(wx.Brush('GREEN', wx.TRANSPARENT))
+                dc.SetPen(self._getPen('GREEN', width=1, style=wx.PENSTYLE_SOLID))
+                dc.SetBrush(self._getBrush('GREEN', wx.TRANSPARENT))
                 dc.DrawRectangle(pos[0]-10, pos[1]-10, 20, 20)
 
 #-----------------------------------------------------------------------------
     def _drawRailWay(self, dc):
         """ Draw the background and the railway."""
         w, h = self.panelSize
-        dc.SetBrush(wx.Brush(self.bgColor))
+        dc.SetBrush(self._getBrush(self.bgColor))
         dc.DrawRectangle(0, 0, w, h)
         for key, trackInfo in gv.iMapMgr.getTracks().items():
-            dc.SetPen(wx.Pen(trackInfo['color'], width=4, style=wx.PENSTYLE_SOLID))
+            dc.SetPen(self._getPen(trackInfo['color'], width=4, style=wx.PENSTYLE_SOLID))
             trackPts = trackInfo['points']
             for i in range(len(trackPts)-1):
                 fromPt, toPt = trackPts[i], trackPts[i+1]
@@ -191,7 +296,7 @@ class PanelMap(wx.Panel):
                 trainColor = '#CE8349' if train.getTrainSpeed() == 0 else 'GREEN'
                 if train.getEmgStop():
                     trainColor = 'RED'
-                dc.SetBrush(wx.Brush(trainColor))
+                dc.SetBrush(self._getBrush(trainColor))
                 for point in train.getPos():
                     dc.DrawRectangle(point[0]-5, point[1]-5, 10, 10)
                 # draw the train ID:
@@ -203,7 +308,7 @@ class PanelMap(wx.Panel):
                 dc.DrawText(key+'-'+str(i), pos[0]+5, pos[1]+5)
                 if gv.gShowTrainRWInfo:
                     trainInfo = train.getTrainRealInfo()
-                    dc.SetFont(wx.Font(8, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+                    dc.SetFont(self._getFont(8, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
                     dc.DrawText('- power: %s' %str('on' if train.getPowerState() else 'off'), pos[0]+5, pos[1]+15)
                     dc.DrawText('- speed: %s km/h' %str(trainInfo['speed']), pos[0]+5, pos[1]+25)
                     dc.DrawText('- voltage: %s V' %str(trainInfo['voltage']), pos[0]+5, pos[1]+35)
@@ -213,8 +318,8 @@ class PanelMap(wx.Panel):
 #-----------------------------------------------------------------------------
     def _drawSensors(self, dc):
         dc.SetPen(self.dcDefPen)
-        dc.SetFont(wx.Font(7, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
-        dc.SetBrush(wx.Brush('GRAY'))
+        dc.SetFont(self._getFont(7, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+        dc.SetBrush(self._getBrush('GRAY'))
         for key, sensorAgent in gv.iMapMgr.getSensors().items():
             sensorId = sensorAgent.getID()
             sensorPos = sensorAgent.getPos()
@@ -226,17 +331,17 @@ class PanelMap(wx.Panel):
                 state = sensorState[i]
                 if state:
                     color = 'YELLOW' if self.toggle else 'BLUE'
-                    dc.SetBrush(wx.Brush(color))
+                    dc.SetBrush(self._getBrush(color))
                     dc.DrawRectangle(pos[0]-4, pos[1]-4, 8, 8)
-                    dc.SetBrush(wx.Brush('GRAY'))
+                    dc.SetBrush(self._getBrush('GRAY'))
                 else:
                     dc.DrawRectangle(pos[0]-4, pos[1]-4, 8, 8)
 
 #-----------------------------------------------------------------------------
     def _drawSignals(self, dc):
         dc.SetPen(self.dcDefPen)
-        dc.SetFont(wx.Font(7, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
-        dc.SetBrush(wx.Brush('Green'))
+        dc.SetFont(self._getFont(7, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+        dc.SetBrush(self._getBrush('Green'))
         for key, signals in gv.iMapMgr.getSignals().items():
             for signalAgent in signals:
                 id = signalAgent.getID()
@@ -244,7 +349,7 @@ class PanelMap(wx.Panel):
                 state = signalAgent.getState()
                 dir = signalAgent.dir
                 color = 'RED' if state else 'GREEN'
-                dc.SetPen(wx.Pen(color, width=2, style=wx.PENSTYLE_SOLID))
+                dc.SetPen(self._getPen(color, width=2, style=wx.PENSTYLE_SOLID))
                 x, y = pos[0], pos[1]
                 if dir == gv.LAY_U:
                     y -= 15 
@@ -256,13 +361,13 @@ class PanelMap(wx.Panel):
                     x += 15
                 dc.DrawLine(pos[0], pos[1], x, y)
                 dc.DrawText("S-"+str(id), x-10, y-25)
-                dc.SetBrush(wx.Brush(color))
+                dc.SetBrush(self._getBrush(color))
                 dc.DrawRectangle(x-5, y-5, 10, 10)
 
 #-----------------------------------------------------------------------------
     def _drawStation(self, dc):
         dc.SetPen(self.dcDefPen)
-        dc.SetFont(wx.Font(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+        dc.SetFont(self._getFont(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
         for key, stations in gv.iMapMgr.getStations().items():
             colorCode = gv.iMapMgr.getTracks(trackID=key)['color']
             dc.SetTextForeground(colorCode)
@@ -271,15 +376,15 @@ class PanelMap(wx.Panel):
                 pos = station.getPos()
                 x, y = pos[0], pos[1]
                 dc.SetPen(self.dcDefPen)
-                dc.SetBrush(wx.Brush(colorCode))
+                dc.SetBrush(self._getBrush(colorCode))
                 (x1,y1) = station.getLabelPos()
                 dc.DrawText(str(id), x+x1, y+y1)
                 color = 'BLUE' if station.getDockState() else colorCode
                 line =wx.PENSTYLE_SOLID if station.getDockState() else wx.PENSTYLE_LONG_DASH
-                dc.SetBrush(wx.Brush(color))
+                dc.SetBrush(self._getBrush(color))
                 dc.DrawCircle(x, y, 8)
-                dc.SetPen(wx.Pen(color, width=1, style=line))
-                dc.SetBrush(wx.Brush(color, wx.TRANSPARENT))
+                dc.SetPen(self._getPen(color, width=1, style=line))
+                dc.SetBrush(self._getBrush(color, wx.TRANSPARENT))
                 if station.getLayout() == gv.LAY_H:
                     dc.DrawRectangle(x-35, y-7, 70, 14)
                 else: 
@@ -287,7 +392,7 @@ class PanelMap(wx.Panel):
                 # Draw station signal if some train is docking.
                 if station.getSignalState():
                     dc.SetPen(self.dcDefPen)
-                    dc.SetBrush(wx.Brush('RED'))
+                    dc.SetBrush(self._getBrush('RED'))
                     if station.getLayout() == gv.LAY_H:
                         dc.DrawRectangle(x-40, y-6, 8, 12)
                         dc.DrawRectangle(x+30, y-6, 8, 12)
@@ -299,26 +404,61 @@ class PanelMap(wx.Panel):
 
     #--PanelMap--------------------------------------------------------------------
     def onPaint(self, event):
-        """ Draw the whole panel by using the wx device context."""
+        """ Draw the whole panel by using the wx device context: blit the cached
+            static layer then draw the dynamic components on top.
+        """
         dc = wx.PaintDC(self)
         self.dcDefPen = dc.GetPen()
-        # Draw all the components
-        self._drawRailWay(dc)
-        self._drawJunction(dc)
-        self._drawTrains(dc)
-        self._drawSensors(dc)
-        self._drawSignals(dc)
-        self._drawStation(dc)
-        self._drawEnvItems(dc)
+        # the blink/resize/expose paints are not triggered by a simulation step, 
+        # don't let the core change the map during drawing.
+        with self._coreLock():
+            if self.bgBitmap is None: self.bgBitmap = self._buildBgBitmap()
+            dc.DrawBitmap(self.bgBitmap, 0, 0)
+            # Draw all the components
+            self._drawJunction(dc)
+            self._drawTrains(dc)
+            self._drawSensors(dc)
+            self._drawSignals(dc)
+            self._drawStation(dc)
+            self._drawEnvState(dc)
+
+    def onResize(self, event):
+        """ Rebuild the static background layer in the next paint."""
+        self.bgBitmap = None
+        self.Refresh(False)
+        event.Skip()
 
     def updateDisplay(self, updateFlag=None):
         """ Set/Update the display: if called as updateDisplay() the function will 
             update the panel, if called as updateDisplay(updateFlag=?) the function
-            will set the self update flag.
+            will set the self update flag. Only the areas of the items whose state 
+            changed (the last and the current area of a moved train) and the clock
+            are repainted.
         """
-        self.Refresh(False)
+        with self._coreLock():
+            mapVersion = gv.iMapMgr.getMapVersion()
+            items = self._getItemsState()
+        if mapVersion != self.bgVersion:
+            # new scenario loaded: rebuild the static layer and repaint the whole panel.
+            self.bgVersion = mapVersion
+            self.bgBitmap = None
+            self.Refresh(False)
+        for key, (state, rect, _) in items.items():
+            lastItem = self.lastItems.get(key)
+            if lastItem is None or lastItem[0] != state:
+                self.RefreshRect(wx.Rect(*rect), eraseBackground=False)
+                if lastItem and lastItem[1] != rect:
+                    self.RefreshRect(wx.Rect(*lastItem[1]), eraseBackground=False)
+        self.lastItems = items
+        self.RefreshRect(wx.Rect(*CLOCK_RECT), eraseBackground=False)
+        # paint now (onPaint() takes the core lock, it must not be held here).
         self.Update()
+
+    def onBlink(self, event):
+        """ Toggle the blink state and repaint the blinking items."""
         self.toggle = not self.toggle
+        for _, rect, blinkFlg in self.lastItems.values():
+            if blinkFlg: self.RefreshRect(wx.Rect(*rect), eraseBackground=False)
 
 #--PanelMap--------------------------------------------------------------------
     def periodic(self , now):
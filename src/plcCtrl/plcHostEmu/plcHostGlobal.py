@@ -0,0 +1,94 @@
+#-----------------------------------------------------------------------------
+# Name:        plcHostGlobal.py
+#
+# Purpose:     This module is used as a local config file to set constants,
+#              global parameters which will be used in the other modules.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/15
+# Version:     v0.1.2
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+"""
+For good coding practice, follow the following naming convention:
+    1) Global variables should be defined with initial character 'g'
+    2) Global instances should be defined with initial character 'i'
+    2) Global CONSTANTS should be defined with UPPER_CASE letters
+"""
+
+import os, sys
+
+print("Current working directory is : %s" % os.getcwd())
+DIR_PATH = dirpath = os.path.dirname(__file__)
+print("Current source code location : %s" % dirpath)
+APP_NAME = ('plcSimulator', 'PlcHost')
+
+TOPDIRS = ['src', 'rail']
+LIBDIR = 'lib'
+CONFIG_FILE_NAME = 'plcHostConfig.txt'
+PLC_CTRL_DIR = os.path.dirname(dirpath)  # folder of all the PLC simulator apps.
+
+#-----------------------------------------------------------------------------
+# Init the logger:
+for topdir in TOPDIRS:
+    idx = dirpath.find(topdir)
+    gTopDir = dirpath[:idx + len(topdir)] if idx != -1 else dirpath   # found it - truncate right after TOPDIR
+    # Config the lib folder
+    gLibDir = os.path.join(gTopDir, LIBDIR)
+    if os.path.exists(gLibDir):
+        print("Import all the lib-module from folder : %s" %str(gLibDir))
+        sys.path.insert(0, gLibDir)
+        break
+
+# import and init the log
+import Log
+Log.initLogger(gTopDir, 'Logs', APP_NAME[0], APP_NAME[1], historyCnt=100, fPutLogsUnderDate=True)
+
+# Init the log type parameters.
+DEBUG_FLG   = False
+LOG_INFO    = 0
+LOG_WARN    = 1
+LOG_ERR     = 2
+LOG_EXCEPT  = 3
+
+#-----------------------------------------------------------------------------
+# Init the configure file loader.
+import ConfigLoader
+gGonfigPath = os.path.join(dirpath, CONFIG_FILE_NAME)
+iConfigLoader = ConfigLoader.ConfigLoader(gGonfigPath, mode='r')
+if iConfigLoader is None:
+    print("Error: The config file %s is not exist.Program exit!" %str(gGonfigPath))
+    exit()
+CONFIG_DICT = iConfigLoader.getJson()
+
+HOST_NAME = CONFIG_DICT['HOST_NAME'] if 'HOST_NAME' in CONFIG_DICT.keys() else 'PLC-Host'
+
+#-------<GLOBAL VARIABLES (start with "g")>------------------------------------
+# VARIABLES are the built in data type.
+# PLC list [(plcType, plcConfigPath)] from the PLC_<n>:<plcType>;<plcConfigPath> lines,
+# the relative config path is under the PLC host folder.
+gPlcCfgList = []
+for key in sorted(CONFIG_DICT.keys()):
+    if not key.startswith('PLC_'): continue
+    plcType, _, cfgPath = str(CONFIG_DICT[key]).partition(';')
+    cfgPath = cfgPath.strip()
+    if not os.path.isabs(cfgPath): cfgPath = os.path.normpath(os.path.join(dirpath, cfgPath))
+    gPlcCfgList.append((plcType.strip(), cfgPath))
+# local performance stats query endpoint UDP port of all the PLCs (0: disable).
+gStatsPort = int(CONFIG_DICT['STATS_PORT']) if 'STATS_PORT' in CONFIG_DICT.keys() else 0
+
+def gDebugPrint(msg, prt=True, logType=None):
+    if prt: print(msg)
+    if logType == LOG_WARN:
+        Log.warning(msg)
+    elif logType == LOG_ERR:
+        Log.error(msg)
+    elif logType == LOG_EXCEPT:
+        Log.exception(msg)
+    elif logType == LOG_INFO or DEBUG_FLG:
+        Log.info(msg)
+
+#-------<GLOBAL PARAMTERS>-----------------------------------------------------
+iPlcHost = None     # PLC host runner.
@@ -0,0 +1,229 @@
+#!/usr/bin/python
+#-----------------------------------------------------------------------------
+# Name:        plcHostRunner.py
+#
+# Purpose:     A PLC host program to run several simulated PLCs (signal, station
+#              and train power PLCs) in one process, all the PLCs' scan cycles are
+#              executed by one scheduler loop.
+#
+# Author:      Yuancheng Liu
+#
+# Created:     2024/04/15
+# Version:     v0.1.2
+# Copyright:   Copyright (c) 2024 LiuYuancheng
+# License:     MIT License
+#-----------------------------------------------------------------------------
+"""
+Program design:
+    Every PLC simulator app runs one plcSimuInterface in its own process which sleeps
+    most of the time. The PLC host loads the PLC list (PLC_<n>:<plcType>;<plcConfig>)
+    from the host config file and creates the PLC of the type's app module with the
+    plcConfig.txt format config file. Then the host loop keeps a heap of the PLCs'
+    next scan cycle time and calls plcSimuInterface.runScanCycle() of the PLC which
+    is due, so N PLCs only need one scan thread.
+
+    Every PLC keeps its own Modbus-TCP server port, the PLCs configured with the same
+    Modbus-TCP address share one server and are addressed by their MD_UNIT_ID.
+
+    Remark: the scan cycles are executed one by one, the realworld query of a PLC
+    delays the other PLCs' cycles, enable the RW_SHM/RW_SUB config of the PLCs if
+    the host runs many PLCs.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import importlib
+from collections import OrderedDict
+
+import plcHostGlobal as gv
+import Log
+import ConfigLoader
+import modbusTcpCom
+import plcSimulator
+import perfStats
+
+MAX_WAIT = 0.5  # max seconds the host loop sleeps before checking the terminate flag.
+
+# PLC type: (app folder, app module, ladder logic class, PLC class, ladder name)
+PLC_TYPES = {
+    'signal': ('signalPlcEmu', 'plcSimulatorSignal', 'tFlipFlopLadderLogic', 'signalPlcSet', 'T_flipflop_logic_set'),
+    'station': ('stationPlcEmu', 'plcSimulatorStation', 'directConnLadderLogic', 'stationPlcSet', 'Direct_connection'),
+    'train': ('trainPlcEmu', 'plcSimulatorTrain', 'onlyCoilLadderLogic', 'trainPowerPlcSet', 'only_coil_control'),
+}
+
+#-----------------------------------------------------------------------------
+def loadPlcConfig(cfgPath):
+    """ Load the plcConfig.txt format file and return the PLC config dict or None
+        if the file is invalid.
+    """
+    if not os.path.exists(cfgPath):
+        gv.gDebugPrint("loadPlcConfig(): config file %s not exist." % cfgPath, logType=gv.LOG_ERR)
+        return None
+    cfgDict = ConfigLoader.ConfigLoader(cfgPath, mode='r', logFlg=False).getJson()
+    try:
+        plcCfg = {
+            'name': cfgDict['PLC_NAME'],
+            'interval': float(cfgDict['CLK_INT']),
+            'unitid': int(cfgDict['MD_UNIT_ID']) if 'MD_UNIT_ID' in cfgDict.keys() else 1,
+            'addressInfo': {
+                'hostaddress': (cfgDict['MD_BUS_IP'], int(cfgDict['MD_BUS_PORT'])),
+                'realworld': (cfgDict['RW_IP'], int(cfgDict['RW_PORT'])),
+                'allowread': json.loads(cfgDict['ALLOW_R_L']),
+                'allowwrite': json.loads(cfgDict['ALLOW_W_L']),
+                'subscribe': cfgDict['RW_SUB'] if 'RW_SUB' in cfgDict.keys() else False,
+                'udpprofile': cfgDict['UDP_PROFILE'] if 'UDP_PROFILE' in cfgDict.keys() else 'default',
+                'shmname': cfgDict['RW_SHM'] if 'RW_SHM' in cfgDict.keys() and cfgDict['RW_SHM'] else None,
+                'statsport': int(cfgDict['STATS_PORT']) if 'STATS_PORT' in cfgDict.keys() else 0,
+                'ladderint': float(cfgDict['LADDER_INT']) if 'LADDER_INT' in cfgDict.keys() else -1,
+                'rawlist': json.loads(cfgDict['RAW_L']) if 'RAW_L' in cfgDict.keys() else None,
+                'ratelimit': float(cfgDict['MB_RATE_LIMIT']) if 'MB_RATE_LIMIT' in cfgDict.keys() else 0,
+                'mbbackend': cfgDict['MB_BACKEND'] if 'MB_BACKEND' in cfgDict.keys() else 'thread',
+                'maxconn': int(cfgDict['MB_MAX_CONN']) if 'MB_MAX_CONN' in cfgDict.keys() else modbusTcpCom.DEF_MAX_CONN,
+                'queuedepth': int(cfgDict['MB_QUEUE_DEPTH']) if 'MB_QUEUE_DEPTH' in cfgDict.keys() else modbusTcpCom.DEF_QUEUE_DEPTH,
+                'reqqueue': int(cfgDict['MB_REQ_QUEUE']) if 'MB_REQ_QUEUE' in cfgDict.keys() else 0,
+                'reqage': float(cfgDict['MB_REQ_AGE']) if 'MB_REQ_AGE' in cfgDict.keys() else modbusTcpCom.DEF_REQ_AGE,
+                'prioritylist': json.loads(cfgDict['MB_PRIORITY_L']) if 'MB_PRIORITY_L' in cfgDict.keys() else None
+            }
+        }
+    except Exception as err:
+        gv.gDebugPrint("loadPlcConfig(): config file %s invalid: %s" % (cfgPath, str(err)), logType=gv.LOG_ERR)
+        return None
+    return plcCfg
+
+#-----------------------------------------------------------------------------
+def importPlcType(plcType):
+    """ Import the PLC type's app module, return (ladderClass, plcClass, ladderName)
+        or None if the type is not supported.
+    """
+    if plcType not in PLC_TYPES.keys():
+        gv.gDebugPrint("importPlcType(): PLC type %s not support." % plcType, logType=gv.LOG_ERR)
+        return None
+    appDir, moduleName, ladderClsName, plcClsName, ladderName = PLC_TYPES[plcType]
+    appPath = os.path.join(gv.PLC_CTRL_DIR, appDir)
+    if appPath not in sys.path: sys.path.insert(0, appPath)
+    module = importlib.import_module(moduleName)
+    return (getattr(module, ladderClsName), getattr(module, plcClsName), ladderName)
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcHost(object):
+    """ Run all the configured PLCs' scan cycles in one scheduler loop."""
+    def __init__(self, plcCfgList, statsPort=0):
+        """ Init example: host = plcHost([('signal', 'plcConfig.txt'), ...])"""
+        self.plcs = []
+        self.sharedServices = []
+        self.terminate = False
+        plcInfoList = []
+        for plcType, cfgPath in plcCfgList:
+            plcCfg = loadPlcConfig(cfgPath)
+            typeInfo = importPlcType(plcType) if plcCfg else None
+            if typeInfo: plcInfoList.append((plcCfg, typeInfo))
+        # the imported app modules init the log with their own name.
+        Log.initLogger(gv.gTopDir, 'Logs', gv.APP_NAME[0], gv.APP_NAME[1], historyCnt=100, fPutLogsUnderDate=True)
+        mbServices = self._initSharedServices([plcCfg for plcCfg, _ in plcInfoList])
+        for plcCfg, (ladderCls, plcCls, ladderName) in plcInfoList:
+            addressInfoDict = dict(plcCfg['addressInfo'])
+            mbService = mbServices.get(addressInfoDict['hostaddress'])
+            if mbService:
+                if plcCfg['unitid'] in mbService.ladderHandler.getUnitIDs():
+                    gv.gDebugPrint("PLC %s unit ID %s is used by other PLC, skip it."
+                                   % (plcCfg['name'], plcCfg['unitid']), logType=gv.LOG_ERR)
+                    continue
+                addressInfoDict['mbservice'] = mbService
+                addressInfoDict['unitid'] = plcCfg['unitid']
+            ladderObj = ladderCls(None, ladderName=ladderName)
+            plc = plcCls(self, plcCfg['name'], addressInfoDict, ladderObj, updateInt=plcCfg['interval'])
+            self.plcs.append(plc)
+            gv.gDebugPrint("Added PLC %s: %s" % (plcCfg['name'], str(plcCfg['addressInfo']['hostaddress'])),
+                           logType=gv.LOG_INFO)
+        for mbService in self.sharedServices: mbService.start()
+        self.loopLagHist = perfStats.latencyHistogram()
+        self.statsEndpoint = None
+        if statsPort:
+            self.statsEndpoint = perfStats.statsEndpoint(statsPort, self.getPerfStats)
+            self.statsEndpoint.start()
+
+    #-----------------------------------------------------------------------------
+    def _initSharedServices(self, plcCfgList):
+        """ Create one modbus service for every Modbus-TCP address used by more than
+            one PLC, return the dict {address: modBusService}.
+        """
+        addrCount = OrderedDict()
+        for plcCfg in plcCfgList:
+            address = plcCfg['addressInfo']['hostaddress']
+            addrCount[address] = addrCount.get(address, 0) + 1
+        mbServices = {}
+        for address, count in addrCount.items():
+            if count < 2: continue
+            # the shared server uses the backend config of the first PLC on the address.
+            addrInfo = next(plcCfg['addressInfo'] for plcCfg in plcCfgList if plcCfg['addressInfo']['hostaddress'] == address)
+            mbService = plcSimulator.modBusService(self, len(self.sharedServices) + 1, modbusTcpCom.unitDataHandler(),
+                                                   hostIP=address[0], hostPort=address[1], backend=addrInfo['mbbackend'],
+                                                   maxConn=addrInfo['maxconn'], queueDepth=addrInfo['queuedepth'],
+                                                   reqQueue=addrInfo['reqqueue'], reqAge=addrInfo['reqage'],
+                                                   priorityIpList=addrInfo['prioritylist'] or addrInfo['allowwrite'])
+            mbServices[address] = mbService
+            self.sharedServices.append(mbService)
+            gv.gDebugPrint("%s PLCs share the modbus service %s" % (count, str(address)), logType=gv.LOG_INFO)
+        return mbServices
+
+    #-----------------------------------------------------------------------------
+    def getPerfStats(self):
+        """ Return the host scheduler loop lag (ms) and all the PLCs' performance stats."""
+        return OrderedDict([
+            ('host', gv.HOST_NAME),
+            ('loopLag', self.loopLagHist.getStats()),
+            ('plcs', [plc.getPerfStats() for plc in self.plcs])
+        ])
+
+    #-----------------------------------------------------------------------------
+    def run(self):
+        """ Run the PLCs' scan cycles in the order of their next cycle time."""
+        gv.gDebugPrint("PLC host %s start to run %s PLCs." % (gv.HOST_NAME, len(self.plcs)), logType=gv.LOG_INFO)
+        if not self.plcs: return
+        now = time.monotonic()
+        for plc in self.plcs: plc.scheduler.reset()
+        dueHeap = [(now, idx) for idx in range(len(self.plcs))]
+        heapq.heapify(dueHeap)
+        try:
+            while not self.terminate:
+                dueT, idx = dueHeap[0]
+                waitT = dueT - time.monotonic()
+                if waitT > 0:
+                    time.sleep(min(waitT, MAX_WAIT))
+                    continue
+                self.loopLagHist.add(-waitT)
+                plc = self.plcs[idx]
+                try:
+                    nextT = plc.runScanCycle()
+                except Exception as err:
+                    Log.exception("PLC %s scan cycle error: %s" % (plc.getPlcID(), str(err)))
+                    nextT = time.monotonic() + plc.updateInt
+                heapq.heapreplace(dueHeap, (nextT, idx))
+        finally:
+            self._stopAll()
+
+    #-----------------------------------------------------------------------------
+    def _stopAll(self):
+        if self.statsEndpoint: self.statsEndpoint.stop()
+        for plc in self.plcs: plc.stop()
+        for mbService in self.sharedServices: mbService.stop()
+
+    def stop(self):
+        self.terminate = True
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+def main():
+    gv.gDebugPrint("Start Init the PLC host: %s" % str(gv.HOST_NAME), logType=gv.LOG_INFO)
+    gv.iPlcHost = plcHost(gv.gPlcCfgList, statsPort=gv.gStatsPort)
+    try:
+        gv.iPlcHost.run()
+    except KeyboardInterrupt:
+        gv.gDebugPrint("PLC host %s stopped." % str(gv.HOST_NAME), logType=gv.LOG_INFO)
+
+if __name__ == "__main__":
+    main()
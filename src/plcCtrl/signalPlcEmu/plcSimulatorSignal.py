@@ -28,10 +28,10 @@ import plcSimulator
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
-class tFlipFlopLadderLogic(modbusTcpCom.ladderLogic):
-    """ A T-flip-flop latching relay ladder logic set with 19 ladders. The ladder logic
-        needs to be init and passed in the data handler (with handler auto-update flag 
-        set to True).
+class tFlipFlopLadderLogic(modbusTcpCom.compiledLadderLogic):
+    """ A T-flip-flop latching relay ladder logic set with 19 ladders (compiled tff 
+        rungs). The ladder logic needs to be init and passed in the data handler (with 
+        handler auto-update flag set to True).
     """
 
     def __init__(self, parent, ladderName) -> None:
@@ -75,43 +75,11 @@ class tFlipFlopLadderLogic(modbusTcpCom.ladderLogic):
             {'coilIdx': 17, 'onRegIdx': (weIdxOffSet+3, weIdxOffSet+13), 'offRegIdx': (weIdxOffSet+4, weIdxOffSet+14)},
             {'coilIdx': 18, 'onRegIdx': (weIdxOffSet+1, weIdxOffSet+15), 'offRegIdx': (weIdxOffSet+2, weIdxOffSet+16)}
         ]
+        # compile every flipflop to a tff rung, the source coils are the current state.
+        self.rungs = [{'type': 'tff', 'coil': item['coilIdx'],
+                       'on': ['R%s' % idx for idx in item['onRegIdx']],
+                       'off': ['R%s' % idx for idx in item['offRegIdx']]} for item in self.ffConfig]
 
-#-----------------------------------------------------------------------------
-    def _tfligFlogRun(self, coilState, toggleOnList, toggleOffList):
-        """ Function to simulate a normal t-flip-flop latching replay to take input
-            and calculate the output based on the current state. If there is N register
-            state changed, this ladder logic will execute N times.
-            Args:
-                coilState (int/bool): Current output State. 
-                toggleOnList (list(int/bool)): input registers's state list which can toggle
-                    the relay on.
-                toggleOffList (list(int/bool)): input registers's state list which can toggle
-                    the relay off.
-            Returns:
-                bool: the filp-flop positive output.
-        """
-        if coilState: 
-            if 1 in toggleOffList or True in toggleOffList: return False 
-        else:
-            if 1 in toggleOnList or True in toggleOnList: return True
-        return coilState
-
-#-----------------------------------------------------------------------------
-    def runLadderLogic(self, regsList, coilList=None):
-        coilsRsl = []
-        if len(regsList) != 39 or coilList is None or len(coilList)!=19:
-            gv.gDebugPrint('runLadderLogic(): input not valid', logType=gv.LOG_WARN)
-            gv.gDebugPrint("Input registers list: %s" %str(regsList), logType=gv.LOG_INFO)
-            gv.gDebugPrint("Input coils list: %s" %str(coilList), logType=gv.LOG_INFO)
-        else:
-            for item in self.ffConfig:
-               coilState = coilList[item['coilIdx']]
-               onRegListState = [regsList[i] for i in item['onRegIdx']]
-               offRegListState = [regsList[i] for i in item['offRegIdx']]
-               coilsRsl.append(self._tfligFlogRun(coilState, onRegListState, offRegListState) ) 
-        gv.gDebugPrint('Finished calculate all coils: %s' %str(coilsRsl), logType=gv.LOG_INFO)
-        return coilsRsl
-        
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class signalPlcSet(plcSimulator.plcSimuInterface):
@@ -152,7 +120,20 @@ def main():
         'hostaddress': gv.gModBusIP,
         'realworld':gv.gRealWorldIP, 
         'allowread':gv.ALLOW_R_L,
-        'allowwrite': gv.ALLOW_W_L
+        'allowwrite': gv.ALLOW_W_L,
+        'subscribe': gv.gRwSubscribe,
+        'udpprofile': gv.gUdpProfile,
+        'shmname': gv.gRwShmName,
+        'statsport': gv.gStatsPort,
+        'ladderint': gv.gLadderInt,
+        'rawlist': gv.gRawList,
+        'ratelimit': gv.gRateLimit,
+        'mbbackend': gv.gMbBackend,
+        'maxconn': gv.gMbMaxConn,
+        'queuedepth': gv.gMbQueueDepth,
+        'reqqueue': gv.gReqQueue,
+        'reqage': gv.gReqAge,
+        'prioritylist': gv.gPriorityList
     }
     plc = signalPlcSet(None, gv.PLC_NAME, addressInfoDict,  
                        gv.iLadderLogic, updateInt=gv.gInterval)
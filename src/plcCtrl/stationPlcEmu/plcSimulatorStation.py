@@ -30,7 +30,7 @@ import plcSimulator
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
-class directConnLadderLogic(modbusTcpCom.ladderLogic):
+class directConnLadderLogic(modbusTcpCom.compiledLadderLogic):
     """ A direct connection ladder logic diagram set, holding registers will 
         trigger the connected coils.
     """
@@ -48,19 +48,9 @@ class directConnLadderLogic(modbusTcpCom.ladderLogic):
         # address: 0 - 9: weline stations
         # address: 10 - 15: nsline stations
         # address: 16 - 21: ccline sensors.
+        # direct connection copy the register state to coil directly:
+        self.rungs = [{'type': 'copy', 'coil': 0, 'reg': 0, 'count': 22}]
 
-#-----------------------------------------------------------------------------
-    def runLadderLogic(self, regsList, coilList=None):
-        coilsRsl = []
-        if len(regsList) != 22:
-            gv.gDebugPrint('runLadderLogic(): input not valid', logType=gv.LOG_WARN)
-            gv.gDebugPrint("Input registers list: %s" %str(regsList))
-        else:
-            # direct connection copy the register state to coil directly:
-            coilsRsl = list(regsList).copy()
-        gv.gDebugPrint('Finished calculate all coils: %s' %str(coilsRsl), logType=gv.LOG_INFO)
-        return coilsRsl
-        
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class stationPlcSet(plcSimulator.plcSimuInterface):
@@ -108,7 +98,20 @@ def main():
         'hostaddress': gv.gModBusIP,
         'realworld':gv.gRealWorldIP, 
         'allowread':gv.ALLOW_R_L,
-        'allowwrite': gv.ALLOW_W_L
+        'allowwrite': gv.ALLOW_W_L,
+        'subscribe': gv.gRwSubscribe,
+        'udpprofile': gv.gUdpProfile,
+        'shmname': gv.gRwShmName,
+        'statsport': gv.gStatsPort,
+        'ladderint': gv.gLadderInt,
+        'rawlist': gv.gRawList,
+        'ratelimit': gv.gRateLimit,
+        'mbbackend': gv.gMbBackend,
+        'maxconn': gv.gMbMaxConn,
+        'queuedepth': gv.gMbQueueDepth,
+        'reqqueue': gv.gReqQueue,
+        'reqage': gv.gReqAge,
+        'prioritylist': gv.gPriorityList
     }
     plc = stationPlcSet(None, gv.PLC_NAME, addressInfoDict,
                         gv.iLadderLogic, updateInt=gv.gInterval)
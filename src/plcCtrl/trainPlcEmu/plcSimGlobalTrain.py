@@ -19,6 +19,7 @@ For good coding practice, follow the following naming convention:
 """
 
 import os, sys
+import json
 
 print("Current working directory is : %s" % os.getcwd())
 DIR_PATH = dirpath = os.path.dirname(__file__)
@@ -63,8 +64,8 @@ CONFIG_DICT = iConfigLoader.getJson()
 
 # Init the PLC info.
 PLC_NAME = CONFIG_DICT['PLC_NAME']
-ALLOW_R_L = CONFIG_DICT['ALLOW_R_L']
-ALLOW_W_L = CONFIG_DICT['ALLOW_W_L']
+ALLOW_R_L = json.loads(CONFIG_DICT['ALLOW_R_L'])
+ALLOW_W_L = json.loads(CONFIG_DICT['ALLOW_W_L'])
 
 #-------<GLOBAL VARIABLES (start with "g")>------------------------------------
 # VARIABLES are the built in data type.
@@ -72,6 +73,31 @@ gRealWorldIP = (CONFIG_DICT['RW_IP'], int(CONFIG_DICT['RW_PORT']))
 gRealWorldKey = 'trainsPlc'
 gInterval = float(CONFIG_DICT['CLK_INT'])
 gModBusIP = (CONFIG_DICT['MD_BUS_IP'], int(CONFIG_DICT['MD_BUS_PORT']))
+# Subscribe the realworld state changes push instead of polling every clock cycle.
+gRwSubscribe = CONFIG_DICT['RW_SUB'] if 'RW_SUB' in CONFIG_DICT.keys() else False
+# realworld connector UDP socket options profile name defined in udpCom.SOCK_PROFILES.
+gUdpProfile = CONFIG_DICT['UDP_PROFILE'] if 'UDP_PROFILE' in CONFIG_DICT.keys() else 'default'
+# realworld emulator's shared memory state snapshot name (None: fetch the state by UDP).
+gRwShmName = CONFIG_DICT['RW_SHM'] if 'RW_SHM' in CONFIG_DICT.keys() and CONFIG_DICT['RW_SHM'] else None
+# local performance stats query endpoint UDP port (0: disable).
+gStatsPort = int(CONFIG_DICT['STATS_PORT']) if 'STATS_PORT' in CONFIG_DICT.keys() else 0
+# ladder logic update after the clients' holding registers write (<0: in the write request,
+# 0: in the next scan cycle, >0: coalesce the writes and update at most once per interval).
+gLadderInt = float(CONFIG_DICT['LADDER_INT']) if 'LADDER_INT' in CONFIG_DICT.keys() else -1
+# read-after-write client ip list, their coils read waits for the pending ladder update.
+gRawList = json.loads(CONFIG_DICT['RAW_L']) if 'RAW_L' in CONFIG_DICT.keys() else None
+# per source ip Modbus requests rate limit (requests/sec, 0: disable).
+gRateLimit = float(CONFIG_DICT['MB_RATE_LIMIT']) if 'MB_RATE_LIMIT' in CONFIG_DICT.keys() else 0
+# Modbus-TCP server backend ('thread' or 'asyncio'), the asyncio backend's max client
+# connections and max pipelined requests per connection.
+gMbBackend = CONFIG_DICT['MB_BACKEND'] if 'MB_BACKEND' in CONFIG_DICT.keys() else 'thread'
+gMbMaxConn = int(CONFIG_DICT['MB_MAX_CONN']) if 'MB_MAX_CONN' in CONFIG_DICT.keys() else 1024
+gMbQueueDepth = int(CONFIG_DICT['MB_QUEUE_DEPTH']) if 'MB_QUEUE_DEPTH' in CONFIG_DICT.keys() else 16
+# bounded priority request queues depth (0: disable), max request waiting seconds and
+# the priority (HMI) ip list (empty: the ALLOW_W_L list).
+gReqQueue = int(CONFIG_DICT['MB_REQ_QUEUE']) if 'MB_REQ_QUEUE' in CONFIG_DICT.keys() else 0
+gReqAge = float(CONFIG_DICT['MB_REQ_AGE']) if 'MB_REQ_AGE' in CONFIG_DICT.keys() else 0.2
+gPriorityList = json.loads(CONFIG_DICT['MB_PRIORITY_L']) if 'MB_PRIORITY_L' in CONFIG_DICT.keys() else None
 
 def gDebugPrint(msg, prt=True, logType=None):
     if prt: print(msg)
@@ -31,7 +31,7 @@ import plcSimulator
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
-class onlyCoilLadderLogic(modbusTcpCom.ladderLogic):
+class onlyCoilLadderLogic(modbusTcpCom.compiledLadderLogic):
     """ Indiviaul holder register and coil usage, no executable ladder logic 
         between them.
     """
@@ -49,12 +49,9 @@ class onlyCoilLadderLogic(modbusTcpCom.ladderLogic):
         # address: 0 - 3: weline trains speed.
         # address: 4 - 6: nsline trains speed.
         # address: 7 - 9: ccline trains speed.
+        # no rung: the coils are only set by the SCADA.
+        self.rungs = []
 
-#-----------------------------------------------------------------------------
-    def runLadderLogic(self, regsList, coilList=None):
-        print(regsList)
-        return None
-        
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class trainPowerPlcSet(plcSimulator.plcSimuInterface):
@@ -104,9 +101,23 @@ def main():
         'hostaddress': gv.gModBusIP,
         'realworld':gv.gRealWorldIP, 
         'allowread':gv.ALLOW_R_L,
-        'allowwrite': gv.ALLOW_W_L
+        'allowwrite': gv.ALLOW_W_L,
+        'subscribe': gv.gRwSubscribe,
+        'udpprofile': gv.gUdpProfile,
+        'shmname': gv.gRwShmName,
+        'statsport': gv.gStatsPort,
+        'ladderint': gv.gLadderInt,
+        'rawlist': gv.gRawList,
+        'ratelimit': gv.gRateLimit,
+        'mbbackend': gv.gMbBackend,
+        'maxconn': gv.gMbMaxConn,
+        'queuedepth': gv.gMbQueueDepth,
+        'reqqueue': gv.gReqQueue,
+        'reqage': gv.gReqAge,
+        'prioritylist': gv.gPriorityList
     }
-    plc = trainPowerPlcSet(None, gv.PLC_NAME, addressInfoDict,  gv.iLadderLogic)
+    plc = trainPowerPlcSet(None, gv.PLC_NAME, addressInfoDict,  gv.iLadderLogic, 
+                           updateInt=gv.gInterval)
     plc.run()
 
 if __name__ == "__main__":
@@ -74,6 +74,12 @@ gRealWorldIP = (CONFIG_DICT['RW_IP'], int(CONFIG_DICT['RW_PORT']))
 gRealWorldKey = 'trainsRtu'
 gInterval = float(CONFIG_DICT['CLK_INT'])
 gS7serverIP = (CONFIG_DICT['S7COMM_IP'], int(CONFIG_DICT['S7COMM_PORT']))
+# realworld connector UDP socket options profile name defined in udpCom.SOCK_PROFILES.
+gUdpProfile = CONFIG_DICT['UDP_PROFILE'] if 'UDP_PROFILE' in CONFIG_DICT.keys() else 'default'
+# realworld emulator's shared memory state snapshot name (None: fetch the state by UDP).
+gRwShmName = CONFIG_DICT['RW_SHM'] if 'RW_SHM' in CONFIG_DICT.keys() and CONFIG_DICT['RW_SHM'] else None
+# local performance stats query endpoint UDP port (0: disable).
+gStatsPort = int(CONFIG_DICT['STATS_PORT']) if 'STATS_PORT' in CONFIG_DICT.keys() else 0
 
 def gDebugPrint(msg, prt=True, logType=None):
     if prt: print(msg)
@@ -83,6 +83,9 @@ def main():
     addressInfoDict = {
         'hostaddress': gv.gS7serverIP,
         'realworld': gv.gRealWorldIP,
+        'udpprofile': gv.gUdpProfile,
+        'shmname': gv.gRwShmName,
+        'statsport': gv.gStatsPort
     }
     rtu = trainPowerRtu(None, gv.RTU_NAME, addressInfoDict,
                         dllPath=gv.gS7snapDllPath, updateInt=gv.gInterval)
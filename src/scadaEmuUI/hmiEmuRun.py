@@ -42,6 +42,7 @@ class UIFrame(wx.Frame):
         self.statusbar.SetStatusText('Test mode: %s' % str(gv.TEST_MD))
         # Init the local parameters:
         self.updateLock = False
+        self.dataVersion = None     # version of the last displayed PLC data snapshot.
         # Set the periodic call back
         self.updatePlcConIndicator()
         self.lastPeriodicTime = time.time()
@@ -255,12 +256,16 @@ class UIFrame(wx.Frame):
         if (not self.updateLock) and now - self.lastPeriodicTime >= gv.gUpdateRate:
             print("main frame update at %s" % str(now))
             self.lastPeriodicTime = now
-            if not gv.TEST_MD:
-                if gv.idataMgr: gv.idataMgr.periodic(now)
-                self.updatePlcConIndicator()
-                self.updatePlcPanels()
-                self.updateMapJunctionData()
-                self.updateMapStationData()
+            if not gv.TEST_MD and gv.idataMgr:
+                gv.idataMgr.periodic(now)
+                # only update the panels if the pollers published new PLC data.
+                version = gv.idataMgr.getSnapshot().version
+                if version != self.dataVersion:
+                    self.dataVersion = version
+                    self.updatePlcConIndicator()
+                    self.updatePlcPanels()
+                    self.updateMapJunctionData()
+                    self.updateMapStationData()
             gv.iMapPanel.periodic(now)
 
 #-----------------------------------------------------------------------------
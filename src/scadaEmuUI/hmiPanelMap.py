@@ -21,6 +21,7 @@ import time
 import scadaGobal as gv
 
 DEF_PNL_SIZE = (1750, 480)
+CLOCK_RECT = (1500, 15, 220, 25)    # date and time text area.
 
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
@@ -32,10 +33,18 @@ class PanelMap(wx.Panel):
         self.SetBackgroundColour(self.bgColor)
         self.panelSize = panelSize
         self.toggle = False
+        self.lastItems = {}     # last drawn items {itemKey: (state, rect, blinkFlg)}
+        self.gdiCache = {}      # cached pens, brushes and fonts.
+        self.bgBitmap = None    # cached static background layer.
         self._loadLabelsImg()
         # Paint the map
         self.Bind(wx.EVT_PAINT, self.onPaint)
+        self.Bind(wx.EVT_SIZE, self.onResize)
         self.SetDoubleBuffered(True)  # Set the panel double buffer to void the panel flash during update.
+        # The sensors blink animation has its own timer which only repaints the blinking items.
+        self.blinkTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.onBlink, self.blinkTimer)
+        self.blinkTimer.Start(int(gv.gUpdateRate*1000))
 
 #-----------------------------------------------------------------------------
     def _loadLabelsImg(self):
@@ -54,19 +63,77 @@ class PanelMap(wx.Panel):
         imgPath = os.path.join(gv.IMG_FD, 'time.png')
         self.labelDict['timelb'] = [wx.Bitmap(imgPath), (1450, 15)]
     
+#-----------------------------------------------------------------------------
+# Define the cached pens, brushes and fonts get() functions.
+
+    def _getPen(self, color, width=1, style=wx.PENSTYLE_SOLID):
+        key = ('pen', str(color), width, style)
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Pen(color, width=width, style=style)
+        return self.gdiCache[key]
+
+    def _getBrush(self, color, style=wx.BRUSHSTYLE_SOLID):
+        key = ('brush', str(color), style)
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Brush(color, style)
+        return self.gdiCache[key]
+
+    def _getFont(self, *args):
+        key = ('font',) + args
+        if key not in self.gdiCache: self.gdiCache[key] = wx.Font(*args)
+        return self.gdiCache[key]
+
+#-----------------------------------------------------------------------------
+    def _buildBgBitmap(self):
+        """ Draw the static background layer (background, tracks and labels) to an
+            offscreen bitmap.
+        """
+        w, h = self.panelSize
+        bitmap = wx.Bitmap(w, h)
+        memDC = wx.MemoryDC(bitmap)
+        self._drawRailWay(memDC)
+        memDC.SelectObject(wx.NullBitmap)
+        return bitmap
+
+#-----------------------------------------------------------------------------
+    def _getItemsState(self):
+        """ Return the state, the display area rect and the blink flag of all the 
+            sensors, signals and stations on the map as {itemKey: (state, rect, blinkFlg)}.
+        """
+        items = {}
+        for sensorAgent in gv.iMapMgr.getSensors().values():
+            posList, stateList = sensorAgent.getSensorPos(), sensorAgent.getSensorsState()
+            for i in range(sensorAgent.getSensorsCount()):
+                x, y = posList[i]
+                state = bool(stateList[i])
+                items[('sensor', sensorAgent.getID(), i)] = (state, (x-7, y-7, 14, 14), state)
+        for signals in gv.iMapMgr.getSignals().values():
+            for signalAgent in signals:
+                # the signal area covers the trigger lines to the linked sensors.
+                x, y = signalAgent.getPos()
+                ptList = [(x-11, y-5), (x+11, y+5)]
+                ptList += signalAgent.getTGonPos() + signalAgent.getTGoffPos()
+                xList, yList = [pt[0] for pt in ptList], [pt[1] for pt in ptList]
+                rect = (min(xList)-2, min(yList)-2, max(xList)-min(xList)+4, max(yList)-min(yList)+4)
+                items[('signal', signalAgent.getID())] = (bool(signalAgent.getState()), rect, False)
+        for key, stations in gv.iMapMgr.getStations().items():
+            for i, station in enumerate(stations):
+                x, y = station.getPos()
+                state = (bool(station.getSensorState()), bool(station.getSignalState()))
+                items[('station', key, i)] = (state, (x-12, y-12, 24, 24), state[0])
+        return items
+
 #-----------------------------------------------------------------------------
     def _drawRailWay(self, dc):
         """ Draw the background, railway tracks and different labels."""
         w, h = self.panelSize
         trackSeq = ('weline', 'ccline', 'nsline')
-        dc.SetBrush(wx.Brush(self.bgColor))
+        dc.SetBrush(self._getBrush(self.bgColor))
         dc.DrawRectangle(0, 0, w, h)
         # draw the track lines.
         for i, trackName in enumerate(trackSeq):
             color = gv.gTrackConfig[trackName]['color']
-            dc.SetPen(wx.Pen(color, width=4, style=wx.PENSTYLE_SOLID))
+            dc.SetPen(self._getPen(color, width=4, style=wx.PENSTYLE_SOLID))
             dc.DrawLine(50, 100+160*i, 1700, 100+160*i,)
-            dc.SetPen(wx.Pen(color, width=2, style=wx.PENSTYLE_SOLID))
+            dc.SetPen(self._getPen(color, width=2, style=wx.PENSTYLE_SOLID))
             dc.DrawCircle(40, 100+160*i, 8)
             dc.DrawCircle(50, 100+160*i, 8)
             dc.DrawCircle(1700, 100+160*i, 8)
@@ -75,8 +142,11 @@ class PanelMap(wx.Panel):
         for val in self.labelDict.values():
             bitmap, pos = val
             dc.DrawBitmap(bitmap, pos[0], pos[1])
-        # draw the date and time label
-        dc.SetFont(wx.Font(14, wx.DEFAULT, wx.NORMAL, wx.BOLD))
+
+#-----------------------------------------------------------------------------
+    def _drawClock(self, dc):
+        """ Draw the date and time label."""
+        dc.SetFont(self._getFont(14, wx.DEFAULT, wx.NORMAL, wx.BOLD))
         dc.SetTextForeground(wx.Colour('GREEN'))
         dc.DrawText(time.strftime("%b %d %Y %H:%M:%S", time.localtime(time.time())), 1500, 15)
 
@@ -84,8 +154,8 @@ class PanelMap(wx.Panel):
     def _drawSensors(self, dc):
         """ Draw the sensors with the state on track."""
         dc.SetPen(self.dcDefPen)
-        dc.SetFont(wx.Font(7, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
-        dc.SetBrush(wx.Brush('GRAY'))
+        dc.SetFont(self._getFont(7, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+        dc.SetBrush(self._getBrush('GRAY'))
         for sensorAgent in gv.iMapMgr.getSensors().values():
             sensorId = sensorAgent.getID()
             sensorNum = sensorAgent.getSensorsCount()
@@ -98,19 +168,19 @@ class PanelMap(wx.Panel):
                 state = stateList[i]
                 if state:
                     color = 'YELLOW' if self.toggle else 'BLUE'
-                    dc.SetBrush(wx.Brush(color))
+                    dc.SetBrush(self._getBrush(color))
                     dc.DrawRectangle(pos[0]-6, pos[1]-6, 12, 12)
                 else:
-                    dc.SetBrush(wx.Brush('GRAY'))
+                    dc.SetBrush(self._getBrush('GRAY'))
                     dc.DrawRectangle(pos[0]-4, pos[1]-4, 8, 8)
 
 #-----------------------------------------------------------------------------
     def _drawSignals(self, dc):
         """ Draw the signals with the State on track."""
         dc.SetPen(self.dcDefPen)
-        dc.SetFont(wx.Font(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
+        dc.SetFont(self._getFont(10, wx.DEFAULT, wx.NORMAL, wx.NORMAL))
         dc.SetTextForeground(wx.Colour('White'))
-        dc.SetBrush(wx.Brush('Green'))
+        dc.SetBrush(self._getBrush('Green'))
         for signals in gv.iMapMgr.getSignals().values():
             for signalAgent in signals:
                 id = signalAgent.getID()
@@ -118,12 +188,12 @@ class PanelMap(wx.Panel):
                 state = signalAgent.getState()
                 # draw the trigger relation line to link the sensors
                 tgOnlineStype = wx.PENSTYLE_SOLID if state else wx.PENSTYLE_LONG_DASH
-                dc.SetPen(wx.Pen('RED', width=1, style=tgOnlineStype))
+                dc.SetPen(self._getPen('RED', width=1, style=tgOnlineStype))
                 for sensorPos in signalAgent.getTGonPos():
                     dc.DrawLine(pos[0]-10, pos[1], sensorPos[0], sensorPos[1])
 
                 tgOfflineStype = wx.PENSTYLE_SOLID if not state else wx.PENSTYLE_LONG_DASH
-                dc.SetPen(wx.Pen('GREEN', width=1, style=tgOfflineStype))
+                dc.SetPen(self._getPen('GREEN', width=1, style=tgOfflineStype))
                 for sensorPos in signalAgent.getTGoffPos():
                     dc.DrawLine(pos[0]+10, pos[1], sensorPos[0], sensorPos[1])
                 # draw the signal sample.
@@ -131,14 +201,14 @@ class PanelMap(wx.Panel):
                 x, y = pos[0], pos[1]
                 dc.DrawText("S-"+str(id), x, y-25)
                 color = 'RED' if state else 'GREEN'
-                dc.SetBrush(wx.Brush(color))
+                dc.SetBrush(self._getBrush(color))
                 dc.DrawRectangle(x-10, y-4, 20, 8)
 
 #-----------------------------------------------------------------------------
     def _drawStations(self, dc):
         """ Draw the station sensor and signal state."""
         dc.SetPen(self.dcDefPen)
-        dc.SetFont(wx.Font(11, wx.DEFAULT, wx.NORMAL, wx.BOLD))
+        dc.SetFont(self._getFont(11, wx.DEFAULT, wx.NORMAL, wx.BOLD))
         for key, stations in gv.iMapMgr.getStations().items():
             dc.SetTextForeground(gv.gTrackConfig[key]['color'])
             for i, station in enumerate(stations):
@@ -146,24 +216,24 @@ class PanelMap(wx.Panel):
                 pos = station.getPos()
                 sensorState = station.getSensorState()
                 signalState = station.getSignalState()
-                dc.SetPen(wx.Pen(gv.gTrackConfig[key]['color']))
+                dc.SetPen(self._getPen(gv.gTrackConfig[key]['color']))
                 lboffset = 30 if station.getlabelLayout() == gv.LAY_D else -45
                 lioffest = 25 if station.getlabelLayout() == gv.LAY_D else -25
                 dc.DrawLine(pos[0], pos[1], pos[0], pos[1]+lioffest)
                 dc.DrawText("ST[%s]:%s" % (str(i), str(id)), pos[0]-30, pos[1]+lboffset)
                 dc.SetPen(self.dcDefPen)
-                dc.SetBrush(wx.Brush('GRAY'))
+                dc.SetBrush(self._getBrush('GRAY'))
                 # Draw the station sensor state
                 if sensorState:
                     color = 'YELLOW' if self.toggle else 'BLUE'
-                    dc.SetBrush(wx.Brush(color))
+                    dc.SetBrush(self._getBrush(color))
                     dc.DrawRectangle(pos[0]-5, pos[1]-5, 10, 10)
                 else:
                     dc.DrawRectangle(pos[0]-5, pos[1]-5, 10, 10)
                 # Draw the station signal state
                 color = 'RED' if signalState else 'GREEN'
-                dc.SetPen(wx.Pen(color, width=2, style=wx.PENSTYLE_SOLID))
-                dc.SetBrush(wx.Brush(color, wx.TRANSPARENT))
+                dc.SetPen(self._getPen(color, width=2, style=wx.PENSTYLE_SOLID))
+                dc.SetBrush(self._getBrush(color, wx.TRANSPARENT))
                 dc.DrawRectangle(pos[0]-10, pos[1]-10, 20, 20)
 
 #-----------------------------------------------------------------------------
@@ -171,21 +241,42 @@ class PanelMap(wx.Panel):
         """ Draw the whole panel by using the wx device context."""
         dc = wx.PaintDC(self)
         self.dcDefPen = dc.GetPen()
-        # Draw all the components
-        self._drawRailWay(dc)
+        if self.bgBitmap is None: self.bgBitmap = self._buildBgBitmap()
+        dc.DrawBitmap(self.bgBitmap, 0, 0)
+        # Draw all the dynamic components on the static layer.
+        self._drawClock(dc)
         self._drawSignals(dc)
         self._drawSensors(dc)
         self._drawStations(dc)
 
+    def onResize(self, event):
+        """ Rebuild the static background layer in the next paint."""
+        self.bgBitmap = None
+        self.Refresh(False)
+        event.Skip()
+
 #-----------------------------------------------------------------------------
     def updateDisplay(self, updateFlag=None):
         """ Set/Update the display: if called as updateDisplay() the function will 
             update the panel, if called as updateDisplay(updateFlag=?) the function
-            will set the self update flag.
+            will set the self update flag. Only the areas of the items whose state 
+            changed and the clock are repainted.
         """
-        self.Refresh(False)
+        items = self._getItemsState()
+        for key, (state, rect, _) in items.items():
+            lastItem = self.lastItems.get(key)
+            if lastItem is None or lastItem[0] != state:
+                self.RefreshRect(wx.Rect(*rect), eraseBackground=False)
+        self.lastItems = items
+        self.RefreshRect(wx.Rect(*CLOCK_RECT), eraseBackground=False)
         self.Update()
+
+#-----------------------------------------------------------------------------
+    def onBlink(self, event):
+        """ Toggle the blink state and repaint the blinking items."""
         self.toggle = not self.toggle
+        for _, rect, blinkFlg in self.lastItems.values():
+            if blinkFlg: self.RefreshRect(wx.Rect(*rect), eraseBackground=False)
 
 #-----------------------------------------------------------------------------
     def periodic(self , now):
@@ -8,78 +8,141 @@
 # Author:      Yuancheng Liu
 #
 # Created:     2023/06/13
-# Version:     v0.1.2
+# Version:     v0.1.3
 # Copyright:   Copyright (c) 2023 Singapore National Cybersecurity R&D Lab LiuYuancheng
 # License:     MIT License
 #-----------------------------------------------------------------------------
 
 import time
-from collections import OrderedDict
+import threading
+from types import MappingProxyType
+from collections import OrderedDict, namedtuple
 
 import scadaGobal as gv
 import modbusTcpCom
 
+# Immutable PLC data snapshot published by the pollers: the holding registers and 
+# coils tuples and the connection state of every PLC ID.
+plcSnapshot = namedtuple('plcSnapshot', ('version', 'time', 'regs', 'coils', 'conn'))
+
+#-----------------------------------------------------------------------------
+#-----------------------------------------------------------------------------
+class plcPoller(threading.Thread):
+    """ Background thread to read one PLC's holding registers and coils with its own 
+        poll interval and publish the result to the data manager.
+    """
+    def __init__(self, parent, plcID, client, plcInfo, interval) -> None:
+        threading.Thread.__init__(self, daemon=True)
+        self.parent = parent
+        self.plcID = plcID
+        self.client = client
+        self.hRegsAddr, self.hRegsNum = plcInfo['hRegsInfo']
+        self.coilsAddr, self.coilsNum = plcInfo['coilsInfo']
+        self.interval = interval
+        self.terminate = threading.Event()
+
+    def poll(self):
+        """ Read the PLC data once and publish it."""
+        regsList = self.client.getHoldingRegs(self.hRegsAddr, self.hRegsNum)
+        coilsList = self.client.getCoilsBits(self.coilsAddr, self.coilsNum)
+        connected = self.client.checkConn() and not (regsList is None or coilsList is None)
+        self.parent.publish(self.plcID, regsList, coilsList, connected)
+
+    def run(self):
+        while not self.terminate.is_set():
+            startT = time.monotonic()
+            try:
+                self.poll()
+            except Exception as err:
+                gv.gDebugPrint('plcPoller %s: poll error %s' %(self.plcID, str(err)), 
+                               logType=gv.LOG_EXCEPT)
+            self.terminate.wait(max(0, self.interval - (time.monotonic() - startT)))
+
+    def stop(self):
+        self.terminate.set()
+
 #-----------------------------------------------------------------------------
 #-----------------------------------------------------------------------------
 class DataManager(object):
     """ The data manager is a module running parallel with the main thread to 
-        connect to PLCs to do the data communication with modbus TCP.
+        connect to PLCs to do the data communication with modbus TCP. Every PLC is 
+        read by its plcPoller thread concurrently, the pollers publish a new immutable
+        plcSnapshot and the UI periodic() only swaps in the latest snapshot, so the 
+        PLCs network latency doesn't block the UI.
     """
     def __init__(self, parent, plcInfo) -> None:
         self.parent = parent
         self.plcClients = OrderedDict()
-        self.regsDict = {}
-        self.coilsDict = {}
         self.plcInfo = plcInfo
-        self.plcConnectionState = {}
+        self.pollers = OrderedDict()
+        self.publishLock = threading.Lock()
+        if gv.iConnPool is None:
+            gv.iConnPool = modbusTcpCom.modbusConnPool(reqTO=gv.gPlcReqTO, 
+                                                       maxBackoff=gv.gPlcMaxBackoff)
+        connDict = {}
         for key, val in plcInfo.items():
             plcIpaddr = val['ipaddress']
             plcPort = val['port']
-            self.plcClients[key] = modbusTcpCom.modbusTcpClient(plcIpaddr, tgtPort=plcPort)
+            self.plcClients[key] = gv.iConnPool.getClient(plcIpaddr, tgtPort=plcPort)
             if self.plcClients[key].checkConn():
                 gv.gDebugPrint('DataManager: Connected to PLC', logType=gv.LOG_INFO)
-                self.plcConnectionState[key] = True
+                connDict[key] = True
             else:
                 gv.gDebugPrint('DataManager: Fail to connect to PLC', logType=gv.LOG_INFO)
-                self.plcConnectionState[key] = False
-            self.regsDict[key] = []
-            self.coilsDict[key] = []
+                connDict[key] = False
+        emptyDict = MappingProxyType({key: () for key in plcInfo.keys()})
+        self.latestSnapshot = plcSnapshot(0, time.time(), emptyDict, emptyDict, 
+                                          MappingProxyType(connDict))
+        self.snapshot = self.latestSnapshot
+        for key, val in plcInfo.items():
+            interval = val['pollInt'] if 'pollInt' in val.keys() else gv.gUpdateRate
+            self.pollers[key] = plcPoller(self, key, self.plcClients[key], val, interval)
+            self.pollers[key].start()
         gv.gDebugPrint('ScadaHMI dataMgr inited', logType=gv.LOG_INFO)
 
+    #-----------------------------------------------------------------------------
+    def publish(self, plcID, regsList, coilsList, connected):
+        """ Publish a new snapshot with the PLC's poll result if it is different from
+            the latest snapshot (called by the pollers).
+        """
+        regsData = None if regsList is None else tuple(regsList)
+        coilsData = None if coilsList is None else tuple(coilsList)
+        with self.publishLock:
+            lastSnapshot = self.latestSnapshot
+            # keep the snapshot (and its version) if the PLC's data is not changed.
+            if lastSnapshot.regs.get(plcID) == regsData and lastSnapshot.coils.get(plcID) == coilsData \
+                and lastSnapshot.conn.get(plcID) == connected: return
+            regs, coils = dict(lastSnapshot.regs), dict(lastSnapshot.coils)
+            regs[plcID] = regsData
+            coils[plcID] = coilsData
+            conn = dict(lastSnapshot.conn)
+            conn[plcID] = connected
+            self.latestSnapshot = plcSnapshot(lastSnapshot.version + 1, time.time(),
+                                              MappingProxyType(regs), MappingProxyType(coils),
+                                              MappingProxyType(conn))
+
     #-----------------------------------------------------------------------------
     def periodic(self, now):
-        """ Call back every periodic time."""
-        gv.gDebugPrint('DataManager: get PLC information', logType=gv.LOG_INFO)
-        for key, val in self.plcClients.items():
-            hRegsAddr, hRegsNum = self.plcInfo[key]['hRegsInfo']
-            self.regsDict[key] = self.plcClients[key].getHoldingRegs(hRegsAddr, hRegsNum)
-            coilsAddr, coilsNum = self.plcInfo[key]['coilsInfo']
-            self.coilsDict[key] = self.plcClients[key].getCoilsBits(coilsAddr, coilsNum)
-            if self.regsDict[key] is None or self.coilsDict[key] is None:
-                self.plcConnectionState[key] = False
-            else:
-                self.plcConnectionState[key] = True
+        """ Call back every periodic time: swap in the latest published snapshot."""
+        self.snapshot = self.latestSnapshot
 
     #-----------------------------------------------------------------------------
     # define all the get() function here.
+    def getSnapshot(self):
+        return self.snapshot
+
     def getConntionState(self, plcID):
-        if plcID in self.plcClients.keys():
-            return self.plcClients[plcID].checkConn() and self.plcConnectionState[plcID]
-        return False
+        return self.snapshot.conn.get(plcID, False)
 
     #-----------------------------------------------------------------------------
     def getPlcHRegsData(self, plcid, startIdx, endIdx):
-        if plcid in self.regsDict.keys():
-            if not self.regsDict[plcid] is None:
-                return self.regsDict[plcid][startIdx:endIdx]
-        return None
+        regs = self.snapshot.regs.get(plcid)
+        return None if regs is None else list(regs[startIdx:endIdx])
 
     #-----------------------------------------------------------------------------
     def getPlcCoilsData(self, plcid, startIdx, endIdx):
-        if plcid in self.coilsDict.keys():
-            if not self.coilsDict[plcid] is None:
-                return self.coilsDict[plcid][startIdx:endIdx]
-        return None
+        coils = self.snapshot.coils.get(plcid)
+        return None if coils is None else list(coils[startIdx:endIdx])
 
     #-----------------------------------------------------------------------------
     def setPlcCoilsData(self, plcid, idx, val):
@@ -93,9 +156,21 @@ class DataManager(object):
             gv.gDebugPrint('DataManager: set PLC coil:%s' %str((plcid, idx, val)), 
                            logType=gv.LOG_INFO)
             self.plcClients[plcid].setCoilsBit(idx, val)
-            time.sleep(0.1)
+
+    def setPlcCoilsList(self, plcid, startIdx, valList):
+        """ Set the PLC coils [startIdx: startIdx + len(valList)] state in one write 
+            multiple coils request.
+            Args:
+                plcid (str): PLC ID
+                startIdx (int): coils start address index.
+                valList (list(bool)): coils on/off state list.
+        """
+        if plcid in self.plcClients.keys():
+            gv.gDebugPrint('DataManager: set PLC coils:%s' %str((plcid, startIdx, valList)), 
+                           logType=gv.LOG_INFO)
+            self.plcClients[plcid].setMultiCoils(startIdx, valList)
 
     def stop(self):
-        for client in self.plcClients.values():
-            client.close()
+        for poller in self.pollers.values(): poller.stop()
+        if gv.iConnPool: gv.iConnPool.stop()
         gv.gDebugPrint('DataManager: Stopped all PLC clients', logType=gv.LOG_INFO)
\ No newline at end of file
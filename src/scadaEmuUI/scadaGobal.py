@@ -142,6 +142,9 @@ gPlcPnlInfo['PLC-05'] = {'id': 'PLC-05', 'label': 'PLC-05[Slave:slot-2]',
                          'tgt': 'PLC-03', 'hRegsInfo': (16, 22), 'coilsInfo': (16, 22)}
 
 gUpdateRate = float(CONFIG_DICT['CLK_INT'])    # main frame update rate 1 sec.
+# PLC connection pool request time out and max reconnect interval.
+gPlcReqTO = float(CONFIG_DICT['PLC_REQ_TO']) if 'PLC_REQ_TO' in CONFIG_DICT.keys() else 0.5
+gPlcMaxBackoff = float(CONFIG_DICT['PLC_MAX_BACKOFF']) if 'PLC_MAX_BACKOFF' in CONFIG_DICT.keys() else 30
 
 
 gStataionNameDict = {}
@@ -156,3 +159,4 @@ iCtrlPanel = None   # UI function control panel.
 iMapPanel = None    # UI map display panel
 iMapMgr = None
 idataMgr = None
+iConnPool = None   # PLC connection pool shared by the data managers.
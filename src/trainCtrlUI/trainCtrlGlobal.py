@@ -117,10 +117,14 @@ gPlcPnlInfo['PLC-07'] = {'id': 'PLC-07', 'label': 'PLC-07[Slave:slot-1]',
 gUpdateRate = float(CONFIG_DICT['CLK_INT'])
 gTrainsPwrList = json.loads(CONFIG_DICT['TRAINS_PWR'])
 gAutoCA = CONFIG_DICT['AUTO_CA']
+# PLC connection pool request time out and max reconnect interval.
+gPlcReqTO = float(CONFIG_DICT['PLC_REQ_TO']) if 'PLC_REQ_TO' in CONFIG_DICT.keys() else 0.5
+gPlcMaxBackoff = float(CONFIG_DICT['PLC_MAX_BACKOFF']) if 'PLC_MAX_BACKOFF' in CONFIG_DICT.keys() else 30
 
 #-------<GLOBAL PARAMTERS>-----------------------------------------------------
 iMainFrame = None   # UI MainFrame.
 iInfoPanel = None   # UI map display panel
 iRtuPanel = None    
 iMapMgr = None      # manager module to control all the compontents displayed on UI
-idataMgr = None     # manager module to process all the data.
\ No newline at end of file
+idataMgr = None     # manager module to process all the data.
+iConnPool = None    # PLC connection pool shared by the data managers.
\ No newline at end of file
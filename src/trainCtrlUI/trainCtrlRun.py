@@ -310,9 +310,9 @@ class UIFrame(wx.Frame):
         if gv.idataMgr is None: return False
         gv.gDebugPrint('Power all the trains power state to PLC', logType=gv.LOG_INFO)
         csIdx, ceIdx = (0, 10)
-        for idx in range(csIdx, ceIdx):
-            state = gv.gTrainsPwrList[idx] if idx < len(gv.gTrainsPwrList) else False
-            gv.idataMgr.setPlcCoilsData(gv.PLC_ID, idx, state)
+        stateList = [gv.gTrainsPwrList[idx] if idx < len(gv.gTrainsPwrList) else False 
+                     for idx in range(csIdx, ceIdx)]
+        gv.idataMgr.setPlcCoilsList(gv.PLC_ID, csIdx, stateList)
         return True
 
 #-----------------------------------------------------------------------------
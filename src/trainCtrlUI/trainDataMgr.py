@@ -178,10 +178,13 @@ class DataManager(object):
         self.coilsDict = {}
         self.plcInfo = plcInfo
         self.plcConnectionState = {}
+        if gv.iConnPool is None:
+            gv.iConnPool = modbusTcpCom.modbusConnPool(reqTO=gv.gPlcReqTO, 
+                                                       maxBackoff=gv.gPlcMaxBackoff)
         for key, val in plcInfo.items():
             plcIpaddr = val['ipaddress']
             plcPort = val['port']
-            self.plcClients[key] = modbusTcpCom.modbusTcpClient(plcIpaddr, tgtPort=plcPort)
+            self.plcClients[key] = gv.iConnPool.getClient(plcIpaddr, tgtPort=plcPort)
             if self.plcClients[key].checkConn():
                 gv.gDebugPrint('DataManager: Connected to PLC.', logType=gv.LOG_INFO)
                 self.plcConnectionState[key] = True
@@ -286,10 +289,21 @@ class DataManager(object):
             gv.gDebugPrint('DataManager: set PLC coil:%s' %str((plcid, idx, val)), 
                            logType=gv.LOG_INFO)
             self.plcClients[plcid].setCoilsBit(idx, val)
-            time.sleep(0.1)
+
+    def setPlcCoilsList(self, plcid, startIdx, valList):
+        """ Set the PLC coils [startIdx: startIdx + len(valList)] state in one write 
+            multiple coils request.
+            Args:
+                plcid (str): PLC ID
+                startIdx (int): coils start address index.
+                valList (list(bool)): coils on/off state list.
+        """
+        if plcid in self.plcClients.keys():
+            gv.gDebugPrint('DataManager: set PLC coils:%s' %str((plcid, startIdx, valList)), 
+                           logType=gv.LOG_INFO)
+            self.plcClients[plcid].setMultiCoils(startIdx, valList)
     
     #-----------------------------------------------------------------------------
     def stop(self):
-        for client in self.plcClients.values():
-            client.close()
+        if gv.iConnPool: gv.iConnPool.stop()
         gv.gDebugPrint('DataManager: Stopped all PLC clients', logType=gv.LOG_INFO)
\ No newline at end of file